@@ -48,7 +48,7 @@ VIEWER = None # if True, the timeseries of A-weighted SPL at the receivers is se
 SLOWDOWN = 0 # additional time (in milliseconds) between timesteps, to slow down the simulation for visualization
 NETWORK = None # AimsunNetwork object, for gathering network related information
 VEHICLES = None # VehicleInfo object, for gathering vehicle related information
-NOISE = None # NoiseImmission object, for calculating and saving noise immissions
+NOISE = None # NoiseImmission (or FlowImmission) object, for calculating and saving noise immissions
 BUFFER = None # LevelBuffer object, for sending levels to the viewer
 
 
@@ -79,7 +79,7 @@ def AAPIInit():
         # construct network and vehicle related objects
         NETWORK = noysim.aimsuntools.AimsunNetwork()
         VEHICLES = noysim.aimsuntools.VehicleInfo(CONFIGURATION)
-        NOISE = noysim.aimsuntools.NoiseImmission(CONFIGURATION)
+        NOISE = noysim.aimsuntools.createNoiseImmission(CONFIGURATION)
         # construct viewer communication object
         BUFFER = noysim.viewer.createLevelBuffer(active = VIEWER, sleep = SLOWDOWN)
         BUFFER.sendClear()
@@ -126,6 +126,8 @@ def AAPIFinish():
   global DISABLED
   if not DISABLED:
     try:
+      # calculate the immission of the last aggregation interval (for the flow-based emission mode)
+      NOISE.finish()
       # construct filename for saving results
       filename = NETWORK.createFullOutputFilename(NETWORKPATH, CONFIGURATION.outputPath(), CONFIGURATION.outputFilename(), CONFIGURATION.outputExtension())
       AKIPrintString('Saving results to file "%s"...' % filename)
@@ -141,6 +143,12 @@ def AAPIFinish():
       NOISE.saveSpectra(wb)
       # finally, save the workbook
       wb.save(filename)
+      if CONFIGURATION.saveBinary():
+        NOISE.saveBinary(os.path.splitext(filename)[0])
+      # report the use of the emission cache
+      if CONFIGURATION.emissionCache() is not None:
+        stats = CONFIGURATION.emissionCache().statistics()
+        AKIPrintString('Emission cache: %d lookups, %d calculated, hit rate %.1f%%' % (stats['lookups'], stats['misses'], stats['hitrate']))
     except Exception as e:
       DISABLED = True
       AKIPrintString(NAME + ' is set to inactive because of errors (see below)')
@@ -166,4 +174,6 @@ def AAPIEnterVehicle(idveh, idsection):
 
 def AAPIExitVehicle(idveh, idsection):
   """ called when a vehicle reaches its destination """
+  if (not DISABLED) and (NOISE is not None):
+    NOISE.exitVehicle(idveh)
   return 0
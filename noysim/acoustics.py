@@ -3,6 +3,11 @@
 #
 # Acoustical functions and classes
 
+import json
+import math
+import struct
+import zlib
+
 import numpy
 import pylab
 
@@ -12,6 +17,8 @@ import pylab
 #---------------------------------------------------------------------------------------------------
 
 LOWDB = -100.0 # lowest value for decibel calculation (the "zero" value, corresponding to zero energy)
+LOWENERGY = 10.0**(0.1*LOWDB) # linear value corresponding with LOWDB
+DBFACTOR = math.log(10.0)/10.0 # fromdB(x) = exp(DBFACTOR*x)
 
 # octave band (8) and 1/3-octave band (31) center frequencies
 FOCTAVE = [63., 125., 250., 500., 1000., 2000., 4000., 8000.]
@@ -25,6 +32,22 @@ LTERTS  = ['', '', '31.5', '', '', '63', '', '', '125', '', '', '250', '', '', '
 LOCTERTS = {  31.5: '31.5', 63.0: '63', 125.0: '125', 250.0: '250', 500.0: '500',
             1000.0: '1k', 2000.0: '2k', 4000.0: '4k', 8000.0: '8k', 16000.0: '16k'}
 
+# shared read-only arrays with the center frequencies (used by all band spectra instead of a copy per spectrum)
+def readOnly(x):
+  """ return a read-only numpy array with the given values """
+  x = numpy.array(x, dtype = float)
+  x.flags.writeable = False
+  return x
+
+def readOnlyView(x):
+  """ return a read-only view on the given numpy array (without copying the values) """
+  x = x.view()
+  x.flags.writeable = False
+  return x
+
+FOCTAVEARRAY = readOnly(FOCTAVE)
+FTERTSARRAY = readOnly(FTERTS)
+
 # A- and C-weights for octave bands and 1/3-octave bands
 AOCTAVE = [-26.2, -16.1,  -8.6,  -3.2,   0.0,   1.2,   1.0,  -1.1]
 COCTAVE = [ -0.8,  -0.2,   0.0,   0.0,   0.0,  -0.2,  -0.8,  -3.0]
@@ -33,6 +56,39 @@ ATERTS  = [-50.5, -44.7, -39.4, -34.6, -30.2, -26.2, -22.5, -19.1, -16.1, -13.4,
 CTERTS  = [ -6.2,  -4.4,  -3.0,  -2.0,  -1.3,  -0.8,  -0.5,  -0.3,  -0.2,  -0.1,   0.0,  0.0,  0.0,  0.0,   0.0,  0.0,
              0.0,   0.0,   0.0,  -0.1,  -0.2,  -0.3,  -0.5,  -0.8,  -1.3,  -2.0,  -3.0, -4.4, -6.2, -8.5, -11.2]
 
+AOCTAVEARRAY = readOnly(AOCTAVE)
+COCTAVEARRAY = readOnly(COCTAVE)
+ATERTSARRAY = readOnly(ATERTS)
+CTERTSARRAY = readOnly(CTERTS)
+
+# numerical precision of level arrays (spectra, time series and result buffers); float32 halves the memory and
+# bandwidth of bulk arrays, while energy sums (Leq, SEL, indicators, noise maps) are always accumulated in float64
+PRECISIONS = {'float32': numpy.float32, 'float64': numpy.float64}
+PRECISION = numpy.float64
+
+
+def setPrecision(precision):
+  """ set the numerical precision of level arrays ('float32' or 'float64') """
+  global PRECISION
+  if precision not in PRECISIONS:
+    raise Exception('unknown precision: ' + str(precision))
+  PRECISION = PRECISIONS[precision]
+
+
+def precision():
+  """ return the numpy type used for level arrays """
+  return PRECISION
+
+
+def levelArray(z, copy = True):
+  """ return a numpy array with level values in the current precision
+      with copy = False, floating point arrays are used as they are (e.g. memory-mapped files)
+  """
+  if copy:
+    return numpy.array(z, dtype = PRECISION)
+  z = numpy.asarray(z)
+  return z if (z.dtype.kind == 'f') else z.astype(PRECISION)
+
 # various standard markers for plotting 1/3-octave band spectra
 marker = {'cross':                {'marker': 'x', 'markeredgecolor': 'black', 'markerfacecolor': 'white'},
           'circle white':         {'marker': 'o', 'markeredgecolor': 'black', 'markerfacecolor': 'white'},
@@ -58,29 +114,57 @@ marker = {'cross':                {'marker': 'x', 'markeredgecolor': 'black', 'm
 # Decibel calculus
 #---------------------------------------------------------------------------------------------------
 
-def fromdB(x):
-  """ translate from dB values to linear values """
-  return 10.0**(0.1*x)
-
+# the decibel functions below have a fast path for python scalars, and accept an output array (out) for arrays;
+# with approximate = True, arrays are converted in single precision (float32 result), which halves the memory of bulk
+# arrays, is slightly faster, and has an error below 0.0001 dB for levels between LOWDB and 200 dB (see the benchmark
+# in the test code)
 
-def todB(x):
-  """ translate from linear values to dB values """
-  return 10.0*numpy.log10(numpy.clip(x, fromdB(LOWDB), numpy.Inf))
-
-
-def plusdB(x, y):
+def fromdB(x, out = None, approximate = False):
+  """ translate from dB values to linear values """
+  if isinstance(x, (float, int, long)) and (out is None):
+    return math.exp(DBFACTOR*x)
+  if approximate:
+    out = numpy.multiply(x, numpy.float32(DBFACTOR), out = out, dtype = numpy.float32)
+  else:
+    out = numpy.multiply(x, DBFACTOR, out = out)
+  if not isinstance(out, numpy.ndarray):
+    return numpy.exp(out) # numpy scalar
+  return numpy.exp(out, out = out)
+
+
+def todB(x, out = None, approximate = False):
+  """ translate from linear values to dB values (values below LOWENERGY become LOWDB) """
+  if isinstance(x, (float, int, long)) and (out is None):
+    return 10.0*math.log10(max(x, LOWENERGY))
+  if approximate:
+    out = numpy.maximum(x, numpy.float32(LOWENERGY), out = out, dtype = numpy.float32)
+  else:
+    out = numpy.maximum(x, LOWENERGY, out = out)
+  if not isinstance(out, numpy.ndarray):
+    return 10.0*numpy.log10(out) # numpy scalar
+  numpy.log10(out, out = out)
+  return numpy.multiply(out, 10.0, out = out)
+
+
+def plusdB(x, y, out = None, approximate = False):
   """ add two dB values - for the more general case, see sumdB """
-  return todB(fromdB(x) + fromdB(y))
+  if isinstance(x, (float, int, long)) and isinstance(y, (float, int, long)) and (out is None):
+    return 10.0*math.log10(max(math.exp(DBFACTOR*x) + math.exp(DBFACTOR*y), LOWENERGY))
+  e = fromdB(numpy.broadcast_arrays(x, y)[0], out = out, approximate = approximate)
+  e += fromdB(y, approximate = approximate)
+  if not isinstance(e, numpy.ndarray):
+    return todB(e) # numpy scalar
+  return todB(e, out = e, approximate = approximate)
 
 
 def averagedB(x, axis = None):
   """ energy equivalent average of (numpy) array of dB values, over given axis (default over all values, 0 = vertically, 1 = horizontally) """
-  return todB(numpy.mean(fromdB(numpy.asarray(x)), axis = axis))
+  return todB(numpy.mean(fromdB(numpy.asarray(x)), axis = axis, dtype = numpy.float64))
 
 
 def sumdB(x, axis = None):
   """ energy equivalent sum of (numpy) array of dB values, over given axis (default over all values, 0 = vertically, 1 = horizontally) """
-  return todB(numpy.sum(fromdB(numpy.asarray(x)), axis = axis))
+  return todB(numpy.sum(fromdB(numpy.asarray(x)), axis = axis, dtype = numpy.float64))
 
 
 def parsedB(s):
@@ -93,10 +177,13 @@ def parsedB(s):
 #---------------------------------------------------------------------------------------------------
 
 class Spectrum(object):
-  """ base class for spectra with octave and 1/3-octave bands, implementing decibel arithmetic """
-  def __init__(self, f, z):
+  """ base class for spectra with octave and 1/3-octave bands, implementing decibel arithmetic
+      with copy = False, the given arrays are used without copying (the caller should not change them afterwards);
+      read-only frequency arrays are always shared, and read-only amplitude arrays are copied when changed (copy-on-write)
+  """
+  def __init__(self, f, z, copy = True):
     object.__init__(self)
-    self.setFreqAmps(f = f, z = z)
+    self.setFreqAmps(f = f, z = z, copy = copy)
 
   def frequencies(self):
     """ return frequency values (Hz) """
@@ -108,26 +195,27 @@ class Spectrum(object):
 
   def copy(self):
     """ return a copy of the band spectrum """
-    return Spectrum(f = self.frequencies().copy(), z = self.amplitudes().copy())
+    return Spectrum(f = self.frequencies(), z = self.amplitudes())
 
-  def setFreqAmps(self, f, z):
+  def setFreqAmps(self, f, z, copy = True):
     """ set the frequency and amplitude values """
     if len(f) != len(z):
       raise Exception('Spectrum frequency and amplitude arrays do not have same length')
-    self._f = numpy.asarray(f).copy() # frequencies
-    self._z = numpy.asarray(z).copy() # amplitudes
+    self.setFrequencies(f, copy = copy, check = False) # frequencies
+    self._z = numpy.array(z, dtype = PRECISION, copy = copy) # amplitudes
 
-  def setFrequencies(self, f):
-    """ set the frequency values """
-    if len(f) != len(self._f):
+  def setFrequencies(self, f, copy = True, check = True):
+    """ set the frequency values (read-only arrays are shared instead of copied) """
+    if check and (len(f) != len(self._f)):
       raise Exception('setFrequencies: Spectrum frequency and amplitude arrays do not have same length')
-    self._f = numpy.asarray(f).copy()
+    f = numpy.asarray(f)
+    self._f = numpy.array(f, copy = (copy and f.flags.writeable))
 
-  def setAmplitudes(self, z):
+  def setAmplitudes(self, z, copy = True):
     """ set the amplitude values """
     if len(z) != len(self._z):
       raise Exception('setAmplitudes: Spectrum frequency and amplitude arrays do not have same length')
-    self._z = numpy.asarray(z).copy()
+    self._z = numpy.array(z, dtype = PRECISION, copy = copy)
 
   def __len__(self):
     """ return the number of values in the band spectrum """
@@ -143,6 +231,8 @@ class Spectrum(object):
 
   def __setitem__(self, f, z):
     """ set the band spectrum amplitude at frequency f """
+    if not self._z.flags.writeable:
+      self._z = self._z.copy() # copy-on-write
     self.amplitudes()[self.freqindex(f)] = z
 
   def __iter__(self):
@@ -157,7 +247,7 @@ class Spectrum(object):
     """ add two band spectra together (energy-wise) """
     if len(self.amplitudes()) != len(other.amplitudes()):
       raise Exception('Spectrum addition with spectra of different size')
-    self.setAmplitudes(z = 10.0*numpy.log10(10.0**(self.amplitudes()/10.0) + 10.0**(other.amplitudes()/10.0)))
+    self.setAmplitudes(z = plusdB(self.amplitudes(), other.amplitudes()), copy = False)
     return self
 
   def __add__(self, other):
@@ -172,15 +262,15 @@ class Spectrum(object):
       # correction with spectrum
       if len(self.amplitudes()) != len(other.amplitudes()):
         raise Exception('Spectrum.correct() with spectra of different size')
-      self.setAmplitudes(self.amplitudes() + other.amplitudes())
+      self.setAmplitudes(self.amplitudes() + other.amplitudes(), copy = False)
     else:
       # correction with scalar value or numpy array
-      self.setAmplitudes(self.amplitudes() + other)
+      self.setAmplitudes(self.amplitudes() + other, copy = False)
     return self
 
   def multiply(self, factor):
     """ multiply the band spectrum energy with a given factor """
-    self.setAmplitudes(self.amplitudes() + 10.0*numpy.log10(factor))
+    self.setAmplitudes(self.amplitudes() + 10.0*numpy.log10(factor), copy = False)
 
   def __imul__(self, factor):
     """ multiply the band spectrum energy with a given factor """
@@ -199,7 +289,7 @@ class Spectrum(object):
 
   def divide(self, factor):
     """ divide the band spectrum energy by a given factor """
-    self.setAmplitudes(self.amplitudes() - 10.0*numpy.log10(factor))
+    self.setAmplitudes(self.amplitudes() - 10.0*numpy.log10(factor), copy = False)
 
   def __idiv__(self, factor):
     """ divide the band spectrum energy by a given factor """
@@ -219,7 +309,7 @@ class Spectrum(object):
   def __neg__(self):
     """ unary - operator, return band spectrum with negated dB values """
     result = self.copy()
-    result.setAmplitudes(-result.amplitudes())
+    result.setAmplitudes(-result.amplitudes(), copy = False)
     return result
 
   def aweights(self):
@@ -253,19 +343,19 @@ class Spectrum(object):
 
 class OctaveBandSpectrum(Spectrum):
   """ ISO octave band spectrum class """
-  def __init__(self, z = [LOWDB]*len(FOCTAVE)):
+  def __init__(self, z = [LOWDB]*len(FOCTAVE), copy = True):
     if len(z) != len(FOCTAVE):
       raise Exception('trying to construct OctaveBandSpectrum with nr of bands != ' + str(len(FOCTAVE)))
-    Spectrum.__init__(self, f = FOCTAVE, z = z)
+    Spectrum.__init__(self, f = FOCTAVEARRAY, z = z, copy = copy)
 
   def copy(self):
-    return OctaveBandSpectrum(self.amplitudes().copy())
+    return OctaveBandSpectrum(self.amplitudes())
 
   def aweights(self):
-    return numpy.asarray(AOCTAVE)
+    return AOCTAVEARRAY
 
   def cweights(self):
-    return numpy.asarray(COCTAVE)
+    return COCTAVEARRAY
 
   def labels(self):
     return LOCTAVE
@@ -290,30 +380,27 @@ class OctaveBandSpectrum(Spectrum):
 
 class TertsBandSpectrum(Spectrum):
   """ ISO 1/3-octave band spectrum class """
-  def __init__(self, z = [LOWDB]*len(FTERTS)):
+  def __init__(self, z = [LOWDB]*len(FTERTS), copy = True):
     if len(z) != len(FTERTS):
       raise Exception('trying to construct TertsBandSpectrum with nr of bands != ' + str(len(FTERTS)))
-    Spectrum.__init__(self, f = FTERTS, z = z)
+    Spectrum.__init__(self, f = FTERTSARRAY, z = z, copy = copy)
 
   def copy(self):
-    return TertsBandSpectrum(self.amplitudes().copy())
+    return TertsBandSpectrum(self.amplitudes())
 
   def aweights(self):
-    return numpy.asarray(ATERTS)
+    return ATERTSARRAY
 
   def cweights(self):
-    return numpy.asarray(CTERTS)
+    return CTERTSARRAY
 
   def labels(self):
     return LTERTS
 
   def octaveBandSpectrum(self):
     """ return the associated octave band spectrum """
-    temp = [0.0]*len(FOCTAVE)
-    z = self.amplitudes()
-    for i in range(len(FOCTAVE)):
-      temp[i] = sumdB(z[(FOFFSET+i*3):(FOFFSET+3+i*3)])
-    return OctaveBandSpectrum(z = temp)
+    z = self.amplitudes()[FOFFSET:(FOFFSET+3*len(FOCTAVE))].reshape((len(FOCTAVE), 3))
+    return OctaveBandSpectrum(z = sumdB(z, axis = 1), copy = False)
 
   def plot(self, m = 'cross', color = 'black', interval = None):
     """ plot the 1/3-octave band spectrum using a line with given marker type and color """
@@ -351,28 +438,410 @@ def CWeightTertsBandSpectrum():
   return TertsBandSpectrum(CTERTS)
 
 
+#---------------------------------------------------------------------------------------------------
+# Percentile levels
+#---------------------------------------------------------------------------------------------------
+
+def percentiles(x, q, axis = None, presorted = False):
+  """ return the percentiles q (in %, scalar or sequence) of the values in x, over the given axis (default over all values),
+      using linear interpolation as numpy.percentile does, but with a single partial sort for all requested percentiles
+      (for a sequence q, the first axis of the result corresponds to the percentiles); if presorted is True, the values
+      are assumed to be sorted already along the axis, and no sorting is done at all
+  """
+  x = numpy.asarray(x)
+  if axis is None:
+    (x, axis) = (x.ravel(), 0)
+  n = x.shape[axis]
+  q = numpy.asarray(q, dtype = float)
+  pos = (q.ravel()/100.0)*(n - 1)
+  lo = numpy.floor(pos).astype(int)
+  hi = numpy.minimum(lo + 1, n - 1)
+  if presorted:
+    part = x
+  else:
+    part = numpy.partition(x, numpy.unique(numpy.hstack((lo, hi))), axis = axis)
+  shape = [1]*x.ndim
+  shape[axis] = len(pos)
+  xlo = numpy.take(part, lo, axis = axis)
+  result = xlo + (pos - lo).reshape(shape)*(numpy.take(part, hi, axis = axis) - xlo)
+  result = numpy.rollaxis(result, axis, 0)
+  if q.ndim == 0:
+    return result[0]
+  return result
+
+
+#---------------------------------------------------------------------------------------------------
+# Run-length encoding of level exceedances
+#---------------------------------------------------------------------------------------------------
+
+def runLengths(mask):
+  """ find all runs of True values along the last axis of a 1D or 2D boolean array, in a single pass
+      return a tuple (rows, starts, lengths) of integer arrays (for a 1D array, rows is all zero)
+  """
+  mask = numpy.asarray(mask, dtype = bool)
+  m = numpy.atleast_2d(mask).astype(numpy.int8)
+  pad = numpy.zeros((m.shape[0], 1), dtype = numpy.int8)
+  edges = numpy.diff(numpy.hstack((pad, m, pad)), axis = 1)
+  # runs start at +1 edges and stop at -1 edges; nonzero() returns both in the same (row-major) order
+  (rows, starts) = numpy.nonzero(edges == 1)
+  (rows2, stops) = numpy.nonzero(edges == -1)
+  return (rows, starts, stops - starts)
+
+
+def exceedances(z, thresholds, dt = 1.0, duration = 0.0, bins = None):
+  """ calculate exceedance statistics of the level array z for a sequence of thresholds at once
+      - dt: time step between the levels (s)
+      - duration: minimum duration (s) of a run above the threshold to be counted as an event
+      - bins: if given, the edges (s) of a histogram of the durations of the runs above each threshold
+      return a dict with for each threshold (all arrays have the length of thresholds):
+      - 'events': the number of runs of levels above the threshold lasting at least the given duration
+      - 'samples': the number of levels above the threshold
+      - 'time': the total time (s) above the threshold
+      - 'histogram': (only if bins is given) array (thresholds x bins) with the counts of the run durations
+  """
+  z = numpy.asarray(z).ravel()
+  thresholds = numpy.atleast_1d(numpy.asarray(thresholds, dtype = float))
+  nt = len(thresholds)
+  (rows, starts, lengths) = runLengths(z[numpy.newaxis,:] >= thresholds[:,numpy.newaxis])
+  result = {}
+  result['events'] = numpy.bincount(rows[lengths >= duration/dt], minlength = nt)[:nt]
+  result['samples'] = numpy.bincount(rows, weights = lengths, minlength = nt)[:nt].astype(int)
+  result['time'] = result['samples']*dt
+  if bins is not None:
+    edges = numpy.asarray(bins, dtype = float)
+    nb = len(edges) - 1
+    ib = numpy.searchsorted(edges, lengths*dt, side = 'right') - 1
+    valid = (ib >= 0) & (ib < nb)
+    counts = numpy.bincount(rows[valid]*nb + ib[valid], minlength = nt*nb)[:nt*nb]
+    result['histogram'] = counts.reshape((nt, nb))
+  return result
+
+
+#---------------------------------------------------------------------------------------------------
+# Sliding window statistics
+#---------------------------------------------------------------------------------------------------
+
+def slidingMaximum(x, w):
+  """ return the maximum of x[i:i+w] for all i (van Herk/Gil-Werman algorithm: prefix and suffix maxima within blocks
+      of length w, the array counterpart of a monotonic deque, so the cost is independent of the window length w)
+  """
+  x = numpy.asarray(x, dtype = float)
+  n = len(x)
+  nb = -(-n // w) # number of blocks
+  blocks = numpy.empty(nb*w)
+  blocks[:n] = x
+  blocks[n:] = -numpy.Inf
+  blocks = blocks.reshape((nb, w))
+  prefix = numpy.maximum.accumulate(blocks, axis = 1).ravel()
+  suffix = numpy.maximum.accumulate(blocks[:,::-1], axis = 1)[:,::-1].ravel()
+  return numpy.maximum(suffix[:n-w+1], prefix[w-1:n])
+
+
+def slidingMinimum(x, w):
+  """ return the minimum of x[i:i+w] for all i (see slidingMaximum) """
+  return -slidingMaximum(-numpy.asarray(x, dtype = float), w)
+
+
+#---------------------------------------------------------------------------------------------------
+# Resampling of levels
+#---------------------------------------------------------------------------------------------------
+
+RESAMPLEMETHODS = ['energy', 'max', 'min', 'sample']
+
+
+def blockReduce(z, factor, method = 'energy'):
+  """ reduce consecutive blocks of the given number of levels along the last axis of z to a single level, using the given
+      method: 'energy' (energy-equivalent level), 'max', 'min' or 'sample' (first level of each block); a partial final
+      block is reduced over the levels that are available
+  """
+  z = numpy.asarray(z)
+  if not method in RESAMPLEMETHODS:
+    raise Exception('unknown resampling method "%s" - choose from %s' % (method, ', '.join(RESAMPLEMETHODS)))
+  if method == 'sample':
+    return z[...,::factor].copy()
+  n = z.shape[-1]
+  nb = -(-n // factor)
+  pad = {'energy': 0.0, 'max': -numpy.Inf, 'min': numpy.Inf}[method]
+  blocks = numpy.empty(z.shape[:-1] + (nb*factor,))
+  blocks[...,:n] = fromdB(z) if method == 'energy' else z
+  blocks[...,n:] = pad
+  blocks = blocks.reshape(z.shape[:-1] + (nb, factor))
+  if method == 'energy':
+    counts = numpy.minimum(factor, n - factor*numpy.arange(nb)) # number of levels in each block
+    return todB(numpy.sum(blocks, axis = -1)/counts)
+  return {'max': numpy.max, 'min': numpy.min}[method](blocks, axis = -1)
+
+
+def resampleLevels(z, dt, newdt, method = 'energy'):
+  """ resample levels with time step dt (along the last axis of z) to the new time step, which should be an integer
+      multiple (downsampling, see blockReduce for the methods) or an integer fraction (upsampling by repetition) of dt
+  """
+  ratio = float(newdt)/dt
+  factor = int(round(ratio if ratio >= 1.0 else 1.0/ratio))
+  if abs((factor if ratio >= 1.0 else 1.0/factor) - ratio) > 1e-6*ratio:
+    raise Exception('the new time step (%s s) is not an integer multiple or fraction of the time step (%s s)' % (str(newdt), str(dt)))
+  if ratio >= 1.0:
+    return blockReduce(z, factor, method)
+  return numpy.repeat(z, factor, axis = -1)
+
+
+#---------------------------------------------------------------------------------------------------
+# Quantized level codec
+#---------------------------------------------------------------------------------------------------
+
+class LevelCodec(object):
+  """ compact encoding of level arrays as 16-bit integers in steps of the given resolution (dB), relative to an offset
+      per block of values (so each block can span 655 dB at 0.01 dB resolution); optionally, the integers are delta
+      encoded (differences between consecutive values, which compress better) and each block is zlib-compressed
+  """
+  def __init__(self, resolution = 0.01, delta = False, compress = False, block = 65536):
+    object.__init__(self)
+    self.resolution = resolution
+    self.delta = delta
+    self.compress = compress
+    self.block = block
+
+  def parameters(self):
+    """ return the codec parameters as a dict (which can be passed to the constructor) """
+    return {'resolution': self.resolution, 'delta': self.delta, 'compress': self.compress, 'block': self.block}
+
+  def encode(self, z):
+    """ encode an array of levels (flattened in C order) to a string; each block consists of the offset (in steps) and the
+        length of the data (in bytes), followed by the data
+    """
+    z = numpy.asarray(z, dtype = float).ravel()
+    if not numpy.all(numpy.isfinite(z)):
+      raise Exception('LevelCodec: impossible to encode levels that are not finite')
+    result = []
+    for i in range(0, len(z), self.block):
+      steps = numpy.round(z[i:i+self.block]/self.resolution)
+      offset = numpy.round(0.5*(steps.min() + steps.max()))
+      q = steps - offset
+      if numpy.any(numpy.abs(q) > 32767):
+        raise Exception('LevelCodec: the range of levels is too large for the resolution (%s dB)' % str(self.resolution))
+      q = q.astype('<i2')
+      if self.delta:
+        q[1:] = q[1:] - q[:-1] # wraps around in 16-bit integer arithmetic, which is undone when decoding
+      data = q.tostring()
+      if self.compress:
+        data = zlib.compress(data, 1) # fastest compression level, delta encoding matters more for the size
+      result.append(struct.pack('<qI', int(offset), len(data)) + data)
+    return ''.join(result)
+
+  def decode(self, data, count):
+    """ decode a string with the given number of levels to a numpy array """
+    z = numpy.empty(count)
+    (i, pos) = (0, 0)
+    hsize = struct.calcsize('<qI')
+    while i < count:
+      (offset, size) = struct.unpack('<qI', data[pos:pos+hsize])
+      block = data[pos+hsize:pos+hsize+size]
+      if self.compress:
+        block = zlib.decompress(block)
+      q = numpy.fromstring(block, dtype = '<i2')
+      if self.delta:
+        q = numpy.cumsum(q, dtype = '<i2')
+      z[i:i+len(q)] = (q + float(offset))*self.resolution
+      (i, pos) = (i + len(q), pos + hsize + size)
+    return z
+
+
+#---------------------------------------------------------------------------------------------------
+# Binary storage of level arrays
+#---------------------------------------------------------------------------------------------------
+
+BINARYMAGIC = 'NOYSIM\x01\x00' # file signature (8 bytes, last two bytes are the format version)
+BINARYALIGN = 16 # the raw data starts at a multiple of this number of bytes
+
+
+def saveArray(filename, z, dt = 1.0, metadata = None, codec = None):
+  """ save an array of levels to a binary file: signature, header length (8 digits), json header (dt, dtype, shape,
+      length, metadata dict and codec parameters), followed by the raw array data (C order), or by the array data encoded
+      with the given LevelCodec
+  """
+  z = numpy.ascontiguousarray(z)
+  header = {'dt': dt, 'dtype': z.dtype.str, 'shape': list(z.shape), 'length': (z.shape[-1] if z.ndim > 0 else 1),
+            'metadata': (metadata if metadata is not None else {})}
+  if codec is not None:
+    header['codec'] = codec.parameters()
+  header = json.dumps(header)
+  # pad the header with spaces so that the array data is aligned (this allows efficient memory mapping)
+  size = len(BINARYMAGIC) + 8 + len(header) + 1
+  header += ' '*((-size) % BINARYALIGN) + '\n'
+  f = open(filename, 'wb')
+  f.write(BINARYMAGIC + ('%08d' % len(header)) + header)
+  if codec is not None:
+    f.write(codec.encode(z))
+  else:
+    z.tofile(f)
+  f.close()
+
+
+def isBinaryFile(filename):
+  """ return True if the file starts with the signature of a binary level file """
+  f = open(filename, 'rb')
+  magic = f.read(len(BINARYMAGIC))
+  f.close()
+  return (magic == BINARYMAGIC)
+
+
+def loadArray(filename, mmap = None):
+  """ load an array of levels from a binary file (see saveArray), returning a tuple (z, header)
+      if mmap is given ('r', 'r+' or 'c', as for numpy.memmap), the array data is memory-mapped instead of read
+      (encoded arrays are always decoded into memory)
+  """
+  f = open(filename, 'rb')
+  if f.read(len(BINARYMAGIC)) != BINARYMAGIC:
+    f.close()
+    raise Exception('loadArray: "%s" is not a binary level file' % filename)
+  n = int(f.read(8))
+  header = json.loads(f.read(n))
+  dtype = numpy.dtype(str(header['dtype']))
+  shape = tuple(header['shape'])
+  if 'codec' in header:
+    codec = LevelCodec(**dict([(str(key), value) for (key, value) in header['codec'].iteritems()]))
+    z = codec.decode(f.read(), int(numpy.prod(shape))).astype(dtype).reshape(shape)
+    f.close()
+  elif mmap is None:
+    z = numpy.fromfile(f, dtype = dtype, count = int(numpy.prod(shape))).reshape(shape)
+    f.close()
+  else:
+    offset = f.tell()
+    f.close()
+    z = numpy.memmap(filename, dtype = dtype, mode = mmap, offset = offset, shape = shape)
+  return (z, header)
+
+
 #---------------------------------------------------------------------------------------------------
 # Noise level time series
 #---------------------------------------------------------------------------------------------------
 
-class Histogram:
-  """ class for histogram manipulation """
-  def __init__(self, x, n):
-    self._x = x # the bin labels
-    self._n = n # the bin amounts
+class Histogram(object):
+  """ histogram of levels with bins of equal width, centred at multiples of the width; the counts are either a 1D array,
+      or a 2D array with one row per timeseries (all rows sharing the same bins)
+  """
+  def __init__(self, x, n, width = 1.0):
+    object.__init__(self)
+    self._x = numpy.asarray(x, dtype = float) # the bin labels (centres)
+    self._n = numpy.asarray(n, dtype = float) # the bin amounts
+    self._width = width # the bin width
+
+  def labels(self):
+    """ return the bin labels (centre levels) """
+    return self._x
+
+  def counts(self):
+    """ return the bin amounts """
+    return self._n
+
+  def width(self):
+    """ return the bin width (dB) """
+    return self._width
+
+  def edges(self):
+    """ return the bin edges (one more than the number of bins) """
+    return numpy.hstack((self._x - 0.5*self._width, self._x[-1:] + 0.5*self._width))
+
+  def total(self):
+    """ return the total number of values (per row) """
+    return numpy.sum(self._n, axis = -1)
+
+  def distribution(self):
+    """ return the relative amount of values (%) in each bin """
+    return 100.0*self._n/numpy.expand_dims(self.total(), -1)
+
+  def exceedance(self):
+    """ return the cumulative exceedance curve: the percentage of values that is at least the lower edge of each bin """
+    return 100.0*numpy.cumsum(self._n[...,::-1], axis = -1)[...,::-1]/numpy.expand_dims(self.total(), -1)
+
+  def percentile(self, p):
+    """ estimate the level exceeded p% of the time (scalar p), interpolating linearly within the bins (the accuracy is
+        limited by the bin width), for each row
+    """
+    n = numpy.atleast_2d(self._n)
+    c = numpy.cumsum(n, axis = 1)
+    target = (1.0 - p/100.0)*c[:,-1]
+    i = numpy.minimum(numpy.sum(c < target[:,numpy.newaxis], axis = 1), n.shape[1] - 1)
+    rows = numpy.arange(n.shape[0])
+    below = c[rows,i] - n[rows,i]
+    frac = numpy.clip((target - below)/numpy.maximum(n[rows,i], 1.0), 0.0, 1.0)
+    result = self._x[i] + (frac - 0.5)*self._width
+    if self._n.ndim == 1:
+      return result[0]
+    return result
+
+  def combine(self):
+    """ return the histogram of all rows together """
+    return Histogram(self._x, numpy.atleast_2d(self._n).sum(axis = 0), width = self._width)
+
+  def __add__(self, other):
+    """ combine the counts of two histograms with the same bin width (the bins of the result span both ranges) """
+    if abs(self._width - other._width) > 1e-9*self._width:
+      raise Exception('impossible to combine histograms with different bin widths')
+    (k1, k2) = (numpy.round(self._x[0]/self._width), numpy.round(other._x[0]/other._width))
+    k0 = min(k1, k2)
+    nb = int(max(k1 + self._n.shape[-1], k2 + other._n.shape[-1]) - k0)
+    n = numpy.zeros(numpy.broadcast(self._n[...,:1], other._n[...,:1]).shape[:-1] + (nb,))
+    n[...,int(k1-k0):int(k1-k0)+self._n.shape[-1]] += self._n
+    n[...,int(k2-k0):int(k2-k0)+other._n.shape[-1]] += other._n
+    return Histogram((k0 + numpy.arange(nb))*self._width, n, width = self._width)
 
   def plot(self):
     """ plot the histogram """
-    pylab.plot(self._x, self._n, linewidth = 1.0)
+    pylab.plot(self._x, numpy.transpose(self._n), linewidth = 1.0)
+
+
+def histogram(z, width = 1.0, r = None):
+  """ return the histogram of the levels z with bins of the given width (dB), centred at multiples of the width, within
+      the level range r = (min, max) (values outside the range are counted in the first or last bin; default the range
+      of the values); for a 2D array, the histogram of each row is calculated
+  """
+  z = numpy.asarray(z, dtype = float)
+  k = numpy.floor(z/width + 0.5).astype(int) # bin number of each value
+  if r is None:
+    (kmin, kmax) = (k.min(), k.max())
+  else:
+    (kmin, kmax) = (int(numpy.floor(r[0]/width + 0.5)), int(numpy.floor(r[1]/width + 0.5)))
+  nb = kmax - kmin + 1
+  k = numpy.clip(k, kmin, kmax) - kmin
+  if z.ndim == 1:
+    n = numpy.bincount(k, minlength = nb)
+  else:
+    rows = z.shape[0]
+    k = k + nb*numpy.arange(rows)[:,numpy.newaxis]
+    n = numpy.bincount(k.ravel(), minlength = rows*nb).reshape((rows, nb))
+  return Histogram((kmin + numpy.arange(nb))*width, n, width = width)
 
 
 class TimeSeries(object):
-  """ time series of noise levels """
-  def __init__(self, z, dt = 1.0):
+  """ time series of noise levels
+      derived quantities (energy, sorted levels, Leq, percentiles, indicators) are cached, and the cache is cleared by all
+      methods that change the levels; when the array returned by amplitudes() is changed directly, call invalidate()
+      with copy = False, the timeseries is a view on the given array; read-only arrays (e.g. memory-mapped files) are
+      copied before they are changed (copy-on-write)
+  """
+  def __init__(self, z, dt = 1.0, copy = True):
     """ initialize the time series with a series of values (list or numpy array) """
     object.__init__(self)
     self._dt = dt # time step (seconds)
-    self._z = numpy.asarray(z).copy()
+    self._z = levelArray(z, copy = copy)
+    self._metadata = {} # free-form information (e.g. receiver, start time), stored together with binary files
+    self._cache = {} # cached derived quantities
+
+  def invalidate(self):
+    """ clear the cached derived quantities (needed after changing the levels through the amplitudes() array) """
+    self._cache = {}
+
+  def makeWritable(self):
+    """ copy the values if they cannot be changed in place (copy-on-write for read-only arrays) """
+    if not self._z.flags.writeable:
+      self._z = self._z.copy()
+
+  def cached(self, key, function):
+    """ return the cached quantity with the given key, calculating it with function() if not available """
+    if not key in self._cache:
+      self._cache[key] = function()
+    return self._cache[key]
 
   def amplitudes(self):
     """ return the raw values of the timeseries, as a numpy array """
@@ -406,9 +875,15 @@ class TimeSeries(object):
     """ return a simple string representation of the timeseries """
     return '[' + ', '.join([('%.1f'%x) for x in self.amplitudes()]) + ']'
 
+  def metadata(self):
+    """ return the dictionary with metadata of the timeseries """
+    return self._metadata
+
   def copy(self):
     """ return a (deep) copy of the time series """
-    return TimeSeries(z = self.amplitudes(), dt = self.dt())
+    ts = TimeSeries(z = self.amplitudes(), dt = self.dt())
+    ts._metadata = dict(self.metadata())
+    return ts
 
   def timeindex(self, t):
     """ return the time index for a given time t (in seconds) """
@@ -416,22 +891,25 @@ class TimeSeries(object):
 
   def __getitem__(self, t):
     """ retrieve the value at the given time [s] (no bounds checking) """
-    return self.amplitudes()[self.timeindex(t)]
+    return self.amplitudes()[int(self.timeindex(t))]
 
   def __setitem__(self, t, value):
     """ set the value at the given time [s] (no bounds checking) """
-    self.amplitudes()[self.timeindex(t)] = value
+    self.makeWritable()
+    self.amplitudes()[int(self.timeindex(t))] = value
+    self.invalidate()
 
   def __iadd__(self, other):
     """ concatenation of timeseries or values + assignment """
     if type(other) == float:
       # add a single value at the end
-      self._z = numpy.hstack([self.amplitudes(), other])
+      self._z = numpy.hstack([self.amplitudes(), numpy.asarray([other], dtype = self._z.dtype)])
     else:
       # concatenation of timeseries
       if self.dt() != other.dt():
         raise 'impossible to concatenate 2 time series with different sample rate'
       self._z = numpy.hstack([self.amplitudes(), other.amplitudes()])
+    self.invalidate()
     return self
 
   def __add__(self, other):
@@ -442,24 +920,31 @@ class TimeSeries(object):
 
   def correct(self, level):
     """ correct the timeseries with the given level """
+    self.makeWritable()
     self._z += level
+    self.invalidate()
     return self
 
   def addLevel(self, level):
     """ add a constant level to the timeseries values """
     self._z = plusdB(self._z, level)
+    self.invalidate()
     return self
 
   def addTimeseries(self, ts):
     """ add another timeseries to the current timeseries, sample by sample, in decibel """
     self._z = plusdB(self._z, ts.amplitudes())
+    self.invalidate()
 
   def save(self, filename, format = '%.4f'):
-    """ save the timeseries to a textfile """
-    f = open(filename, 'w')
-    for v in self.amplitudes():
-      f.write((format + '\n') % v)
-    f.close()
+    """ save the timeseries to a textfile, with one value per line """
+    numpy.savetxt(filename, self.amplitudes(), fmt = format)
+
+  def saveBinary(self, filename, codec = None):
+    """ save the timeseries to a binary file (see saveArray, optionally encoded with a LevelCodec), which can be loaded
+        with loadTimeSeries
+    """
+    saveArray(filename, self.amplitudes(), dt = self.dt(), metadata = self.metadata(), codec = codec)
 
   def view(self, start, duration):
     """ return a view (= reference) of a temporal section of the timeseries (numpy array) """
@@ -468,33 +953,112 @@ class TimeSeries(object):
     iEnd   = int(numpy.clip(iBegin + self.timeindex(duration), iBegin+1, n))
     return self.amplitudes()[iBegin:iEnd]
 
-  def section(self, start, duration):
-    """ return a temporal section of the timeseries as a new timeseries (start and duration are given in seconds) """
-    return TimeSeries(self.view(start,duration), dt = self.dt())
+  def section(self, start, duration, copy = True):
+    """ return a temporal section of the timeseries as a new timeseries (start and duration are given in seconds);
+        if copy is False, the section is a read-only view on the values of this timeseries (changing the section then
+        copies its values first, such that this timeseries and its cached indicators remain valid)
+    """
+    if copy:
+      return TimeSeries(self.view(start, duration), dt = self.dt())
+    return TimeSeries(readOnlyView(self.view(start, duration)), dt = self.dt(), copy = False)
+
+  def resample(self, newdt, method = 'energy'):
+    """ return the timeseries resampled to a new time step (s), as a new timeseries (see resampleLevels); downsampling
+        is done per block with method 'energy', 'max', 'min' or 'sample', upsampling by repetition of the values
+    """
+    return TimeSeries(numpy.asarray(resampleLevels(self.amplitudes(), self.dt(), newdt, method), dtype = PRECISION), dt = newdt, copy = False)
+
+  def energy(self):
+    """ return the (cached) linear energy values of the timeseries, as a numpy array """
+    return self.cached('energy', lambda: fromdB(self.amplitudes()))
+
+  def sortedLevels(self):
+    """ return the (cached) sorted values of the timeseries, as a numpy array """
+    return self.cached('sorted', lambda: numpy.sort(self.amplitudes()))
 
   def percentile(self, p):
-    """ return percentile values with p a scalar or sequence of percentiles (in %) """
-    return numpy.percentile(self.amplitudes(), 100.0 - numpy.asarray(p))
-
-  def statdist(self, r = (0,100)):
-    """ calculate the statistical distribution (histogram) within the integer level range r = (min,max) """
-    (minr,maxr) = r
-    x = range(minr, maxr+1)
-    n = maxr - minr + 1
-    y = numpy.zeros(n)
-    for v in self.amplitudes():
-      b = utils.numeric.restrict(int(round(v)),r)
-      y[b - minr] += 1
-    return Histogram(x, y)
+    """ return percentile values with p a scalar or sequence of percentiles (in %), using the cached sorted levels """
+    return percentiles(self.sortedLevels(), 100.0 - numpy.asarray(p), presorted = True)
+
+  def windows(self, window, hop = None):
+    """ return the start indices and the length (in samples) of all complete sliding windows of the given duration,
+        with the start of consecutive windows hop seconds apart (default one sample)
+    """
+    w = int(self.timeindex(window))
+    if hop is None:
+      h = 1
+    else:
+      h = int(self.timeindex(hop))
+    if (w < 1) or (w > len(self)) or (h < 1):
+      raise Exception('invalid sliding window (%s s) or hop (%s s) for a time series of %.1f s' % (str(window), str(hop), self.duration()))
+    return (numpy.arange(0, len(self) - w + 1, h), w, h)
+
+  def rollingLeq(self, window, hop = None):
+    """ return the energy equivalent level over sliding windows of the given duration (s), every hop seconds, as a new timeseries
+        (the value at time t is the level over [t, t+window]); a cumulative energy sum is used, so the cost is O(n)
+    """
+    (starts, w, h) = self.windows(window, hop)
+    # energy relative to the maximum, to preserve accuracy of the cumulative sum
+    zmax = self.maximum()
+    cumulative = numpy.hstack(([0.0], numpy.cumsum(fromdB(self.amplitudes() - zmax), dtype = numpy.float64)))
+    levels = todB((cumulative[starts + w] - cumulative[starts])/w) + zmax
+    return TimeSeries(numpy.asarray(levels, dtype = PRECISION), dt = h*self.dt(), copy = False)
+
+  def rollingMaximum(self, window, hop = None):
+    """ return the maximum level over sliding windows of the given duration (s), every hop seconds, as a new timeseries """
+    (starts, w, h) = self.windows(window, hop)
+    return TimeSeries(slidingMaximum(self.amplitudes(), w)[starts], dt = h*self.dt(), copy = False)
+
+  def rollingMinimum(self, window, hop = None):
+    """ return the minimum level over sliding windows of the given duration (s), every hop seconds, as a new timeseries """
+    (starts, w, h) = self.windows(window, hop)
+    return TimeSeries(slidingMinimum(self.amplitudes(), w)[starts], dt = h*self.dt(), copy = False)
+
+  def rollingPercentile(self, p, window, hop = None, resolution = 0.1):
+    """ return the level exceeded p% of the time (e.g. p = 10.0 for LA10) over sliding windows of the given duration (s),
+        every hop seconds, as a new timeseries; the levels are binned with the given resolution (dB) into a histogram
+        that is updated incrementally as the window slides, so results are accurate to within half the resolution
+    """
+    (starts, w, h) = self.windows(window, hop)
+    z = self.amplitudes()
+    zmin = self.minimum()
+    bins = numpy.floor((z - zmin)/resolution + 0.5).astype(int)
+    nbins = numpy.max(bins) + 1
+    # ranks of the sorted levels in between which is interpolated (as in numpy.percentile)
+    position = (1.0 - p/100.0)*(w - 1)
+    ranks = numpy.asarray([int(position) + 1, min(int(position) + 2, w)])
+    weights = numpy.asarray([1.0 - (position - int(position)), position - int(position)])
+    hist = numpy.bincount(bins[:w], minlength = nbins)
+    result = numpy.empty(len(starts))
+    result[0] = numpy.dot(weights, numpy.searchsorted(numpy.cumsum(hist), ranks))
+    for i in range(1, len(starts)):
+      (a, b) = (starts[i-1], starts[i])
+      if h == 1:
+        hist[bins[a]] -= 1
+        hist[bins[a+w]] += 1
+      elif h < w:
+        hist -= numpy.bincount(bins[a:b], minlength = nbins)
+        hist += numpy.bincount(bins[a+w:b+w], minlength = nbins)
+      else:
+        hist = numpy.bincount(bins[b:b+w], minlength = nbins)
+      result[i] = numpy.dot(weights, numpy.searchsorted(numpy.cumsum(hist), ranks))
+    return TimeSeries(numpy.asarray(zmin + resolution*result, dtype = PRECISION), dt = h*self.dt(), copy = False)
+
+  def statdist(self, r = (0,100), width = 1.0):
+    """ calculate the statistical distribution (histogram) within the level range r = (min,max), with the given bin width """
+    return histogram(self.amplitudes(), width = width, r = r)
 
   def ncn(self, reference, threshold = 3.0, duration = 3.0):
     """ return the number of events that exceed the reference level (eg. LA50, LA95) with at least the
         threshold value (default 3 dBA), for at least the given duration in seconds (default 3 seconds)
     """
-    z = numpy.zeros(len(self))
-    z[numpy.where(self.amplitudes() >= (reference + threshold))[0]] = 1
-    t = ''.join(map(lambda x: {0:'a',1:'b'}[x],z)).split('a')
-    return len([p for p in t if len(p) >= duration*self.fs()])
+    return int(self.exceedances(reference + threshold, duration = duration)['events'][0])
+
+  def exceedances(self, thresholds, duration = 0.0, bins = None):
+    """ return exceedance statistics (number of events, samples and time above, histogram of event durations)
+        for a sequence of threshold levels at once (see the exceedances function)
+    """
+    return exceedances(self.amplitudes(), thresholds, dt = self.dt(), duration = duration, bins = bins)
 
   def minimum(self):
     """ return the minimum value of the timeseries """
@@ -514,11 +1078,11 @@ class TimeSeries(object):
 
   def leq(self):
     """ return L(A)eq value of the timeseries, asserting that it consists of dB(A) values """
-    return averagedB(self.amplitudes())
+    return self.cached('leq', lambda: todB(numpy.mean(self.energy(), dtype = numpy.float64)))
 
   def sel(self):
     """ return (A)SEL value of the timeseries, asserting that it consists of dB(A) values """
-    return todB(fromdB(sumdB(self.amplitudes()))*self.dt())
+    return todB(numpy.sum(self.energy(), dtype = numpy.float64)*self.dt())
 
   def madmax(self, threshold = 60.0, drop = 5.0, droptime = 25.0, mindt = 3.0):
     """ calculate the noise events (and levels) according to the MadMax algorithm
@@ -554,9 +1118,7 @@ class TimeSeries(object):
 
   def intermittencyRatio(self):
     """ Calculate the intermittency ratio according to Wunderli et al., J. Expo. Sci. Environ. Epidemiol. 2015:1-11 (2015) """
-    energyTotal = numpy.sum(fromdB(self._z))
-    energyEvent = numpy.sum(fromdB(self._z[self._z >= (self.leq() + 3.0)]))
-    return 100.0*energyEvent/energyTotal
+    return self.indicators(['IR'])['IR']
 
   def plot(self, locs = None, interval = None, color = 'black', linewidth = 1.0):
     """ plot the timeseries """
@@ -575,49 +1137,529 @@ class TimeSeries(object):
       pylab.axis((0.0, len(self), interval[0], interval[1]))
     pylab.xlabel('time [s]')
 
+  def periodIndicators(self, start = 0.0, periods = None):
+    """ return period indicators (Lday, Levening, Lnight, Lden) and hourly levels, given the clock time of the first
+        sample in seconds after midnight (see the periodIndicators function)
+    """
+    return periodIndicators(self, start = start, periods = periods)
+
+  def pyramid(self, factor = 4):
+    """ return a multi-resolution pyramid of the timeseries for fast browsing and plotting (see LevelPyramid) """
+    return LevelPyramid(self, factor = factor)
+
   # list of the indicators that can be calculated
   INDICATORLIST = ['LAeq', 'ASEL', 'LAmax', 'LAmin', 'LA01', 'LA05', 'LA10', 'LA50', 'LA90', 'LA95', 'LA99',
                    'sigma', 'Ncn', 'MM60', 'IR', 'TNI', 'NPL']
+  # indicators that are calculated by default (the others only when asked for by name)
+  DEFAULTINDICATORS = ['LAeq', 'LAmax', 'LA01', 'LA05', 'LA10', 'LA50', 'LA90', 'sigma', 'IR', 'TNI', 'NPL']
+  # percentile indicators, with the percentage of time the level is exceeded
+  PERCENTILES = {'LA01': 1.0, 'LA05': 5.0, 'LA10': 10.0, 'LA50': 50.0, 'LA90': 90.0, 'LA95': 95.0, 'LA99': 99.0}
+  # indicators that are needed to calculate other indicators
+  DEPENDENCIES = {'Ncn': ['LA50'], 'IR': ['LAeq'], 'TNI': ['LA10', 'LA90'], 'NPL': ['LAeq', 'sigma']}
+
+  def indicators(self, names = None):
+    """ calculate a set of level time series indicators (assuming dBA values)
+        names is a list of indicators drawn from INDICATORLIST (default DEFAULTINDICATORS); the levels are converted to
+        energy only once, all percentile levels are obtained from a single partial sort, and only the requested
+        indicators are calculated (see TimeSeriesCollection.indicators); indicators are cached, so only those not
+        requested before are calculated
+    """
+    if names is None:
+      names = self.DEFAULTINDICATORS
+    known = self.cached('indicators', dict)
+    missing = [name for name in names if not name in known]
+    if len(missing) > 0:
+      collection = TimeSeriesCollection(self.amplitudes()[numpy.newaxis,:], dt = self.dt(), copy = False)
+      for (name, value) in collection.indicators(missing).iteritems():
+        known[name] = int(value[0]) if name in ['Ncn', 'MM60'] else value[0]
+    return dict([(name, known[name]) for name in names])
 
-  def indicators(self):
-    """ calculate a set of level time series indicators (assuming dBA values) """
+  def basicIndicators(self):
+    """ calculate a set of basic indicators (assuming dBA values) """
+    return self.indicators(['LAeq', 'LAmin', 'LAmax', 'LA10', 'LA50', 'LA90', 'sigma'])
+
+
+def loadTimeSeries(filename, dt = 1.0, mmap = None):
+  """ load a timeseries from a binary file, or from a textfile with one value per line (the time step dt is only used
+      for textfiles); binary files can be memory-mapped by passing a numpy.memmap mode ('r', 'r+' or 'c') as mmap
+  """
+  if not isBinaryFile(filename):
+    return TimeSeries(numpy.atleast_1d(numpy.loadtxt(filename)), dt = dt)
+  (z, header) = loadArray(filename, mmap = mmap)
+  if z.ndim != 1:
+    raise Exception('loadTimeSeries: "%s" does not contain a one-dimensional array' % filename)
+  ts = TimeSeries(z, dt = header['dt'], copy = False) # avoid copying the (possibly memory-mapped) data
+  ts._metadata = header['metadata']
+  return ts
+
+
+#---------------------------------------------------------------------------------------------------
+# Collection of noise level time series
+#---------------------------------------------------------------------------------------------------
+
+class TimeSeriesCollection(object):
+  """ collection of noise level time series with a common time step (e.g. at a set of receivers), stored as a single
+      (timeseries x samples) array, so that indicators can be calculated for all timeseries at once
+  """
+  def __init__(self, z, dt = 1.0, copy = True):
+    """ initialize the collection with a two-dimensional array of values (one row per timeseries), without copying the
+        values if copy is False
+    """
+    object.__init__(self)
+    self._dt = dt # time step (seconds)
+    self._z = levelArray(numpy.array(z, ndmin = 2, copy = False), copy = copy)
+    self._metadata = {} # free-form information (e.g. receiver names), stored together with binary files
+
+  def amplitudes(self):
+    """ return the raw values of all timeseries, as a two-dimensional numpy array """
+    return self._z
+
+  def metadata(self):
+    """ return the dictionary with metadata of the collection """
+    return self._metadata
+
+  def __len__(self):
+    """ return the number of timeseries in the collection """
+    return self.amplitudes().shape[0]
+
+  def samples(self):
+    """ return the number of values in each timeseries """
+    return self.amplitudes().shape[1]
+
+  def dt(self):
+    """ return the timestep (s) """
+    return self._dt
+
+  def duration(self):
+    """ return the duration (s) """
+    return self.samples()*self.dt()
+
+  def times(self):
+    """ return a numpy array with the time values """
+    return numpy.arange(self.samples())*self.dt()
+
+  def copy(self):
+    """ return a (deep) copy of the collection """
+    c = TimeSeriesCollection(self.amplitudes(), dt = self.dt())
+    c._metadata = dict(self.metadata())
+    return c
+
+  def __getitem__(self, i):
+    """ return timeseries i as a TimeSeries object, or a collection with the selected timeseries if i is a slice or a
+        sequence of indices; these are read-only views on the values of the collection (a TimeSeries copies its values
+        before they are changed, see TimeSeries)
+    """
+    if isinstance(i, (int, long, numpy.integer)):
+      return TimeSeries(readOnlyView(self.amplitudes()[i]), dt = self.dt(), copy = False)
+    return TimeSeriesCollection(readOnlyView(self.amplitudes()[i]), dt = self.dt(), copy = False)
+
+  def __iter__(self):
+    """ return an iterator over the timeseries in the collection """
+    return iter([self[i] for i in range(len(self))])
+
+  def view(self, start, duration):
+    """ return a view (= reference) of a temporal section of all timeseries (two-dimensional numpy array) """
+    n = self.samples()
+    iBegin = int(numpy.clip(numpy.round(start/self.dt()), 0, n-1))
+    iEnd   = int(numpy.clip(iBegin + numpy.round(duration/self.dt()), iBegin+1, n))
+    return self.amplitudes()[:,iBegin:iEnd]
+
+  def section(self, start, duration, copy = True):
+    """ return a temporal section of all timeseries as a new collection (start and duration are given in seconds),
+        which is a read-only view on the values of this collection if copy is False
+    """
+    if copy:
+      return TimeSeriesCollection(self.view(start, duration), dt = self.dt())
+    return TimeSeriesCollection(readOnlyView(self.view(start, duration)), dt = self.dt(), copy = False)
+
+  def resample(self, newdt, method = 'energy'):
+    """ return all timeseries resampled to a new time step (s), as a new collection (see TimeSeries.resample) """
+    return TimeSeriesCollection(numpy.asarray(resampleLevels(self.amplitudes(), self.dt(), newdt, method), dtype = PRECISION),
+                                dt = newdt, copy = False)
+
+  def save(self, filename, format = '%.4f'):
+    """ save the collection to a textfile, with one line per sample and one column per timeseries """
+    numpy.savetxt(filename, self.amplitudes().T, fmt = format)
+
+  def saveBinary(self, filename, codec = None):
+    """ save the collection to a binary file (see saveArray, optionally encoded with a LevelCodec), which can be loaded
+        with loadTimeSeriesCollection
+    """
+    saveArray(filename, self.amplitudes(), dt = self.dt(), metadata = self.metadata(), codec = codec)
+
+  def statdist(self, r = (0,100), width = 1.0):
+    """ calculate the statistical distribution (histogram) of all timeseries, with one row of counts per timeseries """
+    return histogram(self.amplitudes(), width = width, r = r)
+
+  def percentile(self, p):
+    """ return percentile values of all timeseries with p a scalar or sequence of percentiles (in %) """
+    return percentiles(self.amplitudes(), 100.0 - numpy.asarray(p), axis = 1)
+
+  def leq(self):
+    """ return the L(A)eq values of all timeseries """
+    return averagedB(self.amplitudes(), axis = 1)
+
+  def indicators(self, names = None):
+    """ calculate a set of level time series indicators (assuming dBA values) for all timeseries at once
+        names is a list of indicators drawn from TimeSeries.INDICATORLIST (default TimeSeries.DEFAULTINDICATORS)
+        return a dict with for each indicator an array with the values for all timeseries
+    """
+    if names is None:
+      names = TimeSeries.DEFAULTINDICATORS
+    for name in names:
+      if not name in TimeSeries.INDICATORLIST:
+        raise Exception('unknown indicator "%s" - choose from %s' % (name, ', '.join(TimeSeries.INDICATORLIST)))
+    needed = set(names)
+    for name in names:
+      needed.update(TimeSeries.DEPENDENCIES.get(name, []))
+    z = self.amplitudes()
+    (nts, n) = z.shape
     result = {}
     # energy-equivalent levels
-    result['LAeq']  = self.leq()
-    #result['ASEL']  = self.sel()
-    # percentile levels
-    result['LAmax'] = self.maximum()
-    #result['LAmin'] = self.minimum()
-    result['LA01']  = self.percentile(1.0)
-    result['LA05']  = self.percentile(5.0)
-    result['LA10']  = self.percentile(10.0)
-    result['LA50']  = self.percentile(50.0)
-    result['LA90']  = self.percentile(90.0)
-    #result['LA95']  = self.percentile(95.0)
-    #result['LA99']  = self.percentile(99.0)
+    if needed & set(['LAeq', 'ASEL', 'IR']):
+      energy = fromdB(z)
+      energyTotal = numpy.sum(energy, axis = 1, dtype = numpy.float64)
+      result['LAeq'] = todB(energyTotal/n)
+      result['ASEL'] = todB(energyTotal*self.dt())
+    # percentile levels (the minimum and maximum are included in the same partial sort)
+    pnames = [name for name in TimeSeries.PERCENTILES if name in needed]
+    pnames += [name for name in ['LAmin', 'LAmax'] if name in needed]
+    if len(pnames) > 0:
+      p = [{'LAmin': 100.0, 'LAmax': 0.0}.get(name, TimeSeries.PERCENTILES.get(name)) for name in pnames]
+      result.update(zip(pnames, self.percentile(p)))
     # noise event indicators
-    result['sigma'] = self.stdev()
-    #result['Ncn']   = self.ncn(reference = result['LA50'])
-    #result['MM60']  = len(self.madmax())
-    result['IR']    = self.intermittencyRatio()
+    if 'sigma' in needed:
+      result['sigma'] = numpy.std(z, axis = 1)
+    if 'Ncn' in needed:
+      # events exceeding LA50 + 3 dB for at least 3 seconds (see TimeSeries.ncn)
+      (rows, starts, lengths) = runLengths(z >= (result['LA50'] + 3.0)[:,numpy.newaxis])
+      result['Ncn'] = numpy.bincount(rows[lengths >= 3.0/self.dt()], minlength = nts)[:nts]
+    if 'MM60' in needed:
+      result['MM60'] = numpy.asarray([len(ts.madmax()) for ts in self])
+    if 'IR' in needed:
+      energyEvent = numpy.sum(numpy.where(z >= (result['LAeq'] + 3.0)[:,numpy.newaxis], energy, 0.0), axis = 1, dtype = numpy.float64)
+      result['IR'] = 100.0*energyEvent/energyTotal
     # hybrid indicators
-    result['TNI']   = 4.0*(result['LA10'] - result['LA90']) + result['LA90'] - 30.0 # traffic noise index
-    result['NPL']   = result['LAeq'] + 2.56 * result['sigma'] # noise pollution level
-    return result
+    if 'TNI' in needed:
+      result['TNI'] = 4.0*(result['LA10'] - result['LA90']) + result['LA90'] - 30.0 # traffic noise index
+    if 'NPL' in needed:
+      result['NPL'] = result['LAeq'] + 2.56 * result['sigma'] # noise pollution level
+    return dict([(name, result[name]) for name in names])
 
-  def basicIndicators(self):
-    """ calculate a set of basic indicators (assuming dBA values) """
+
+def loadTimeSeriesCollection(filename, mmap = None):
+  """ load a collection of timeseries from a binary file (see loadTimeSeries) """
+  (z, header) = loadArray(filename, mmap = mmap)
+  if z.ndim != 2:
+    raise Exception('loadTimeSeriesCollection: "%s" does not contain a two-dimensional array' % filename)
+  c = TimeSeriesCollection(z, dt = header['dt'], copy = False) # avoid copying the (possibly memory-mapped) data
+  c._metadata = header['metadata']
+  return c
+
+
+#---------------------------------------------------------------------------------------------------
+# Spectral time series
+#---------------------------------------------------------------------------------------------------
+
+class SpectralTimeSeries(object):
+  """ time series of band spectra at a number of receivers, stored as a single (time x receivers x bands) array that
+      is preallocated for a chunk of timesteps and doubled in size when full, so that appending spectra does not create
+      any objects and takes amortized constant time
+  """
+  def __init__(self, f, receivers, dt = 1.0, start = 0.0, chunk = 1024):
+    """ initialize an empty time series for the given frequencies (list) and number of receivers """
+    object.__init__(self)
+    self._f = numpy.asarray(f, dtype = float) # band frequencies
+    self._dt = dt # time step (seconds)
+    self._start = start # time of the first timestep (seconds)
+    self._chunk = chunk # number of timesteps that is allocated initially
+    self._n = 0 # number of timesteps stored
+    self._z = numpy.empty((chunk, receivers, len(self._f)), dtype = PRECISION) # in the precision at creation time
+    self._metadata = {} # free-form information, stored together with binary files
+
+  def append(self, z):
+    """ add the spectra at all receivers for the next timestep (array or list of lists, receivers x bands) """
+    if self._n == len(self._z):
+      # grow geometrically, such that n appends copy O(n) timesteps in total
+      z0 = self._z
+      self._z = numpy.empty((max(self._chunk, 2*len(z0)),) + z0.shape[1:], dtype = z0.dtype)
+      self._z[:self._n] = z0[:self._n]
+    self._z[self._n] = z
+    self._n += 1
+
+  def amplitudes(self):
+    """ return the raw values, as a (time x receivers x bands) numpy array (view) """
+    return self._z[:self._n]
+
+  def metadata(self):
+    """ return the dictionary with metadata of the time series """
+    return self._metadata
+
+  def frequencies(self):
+    """ return frequency values (Hz) """
+    return self._f
+
+  def __len__(self):
+    """ return the number of timesteps """
+    return self._n
+
+  def receivers(self):
+    """ return the number of receivers """
+    return self._z.shape[1]
+
+  def dt(self):
+    """ return the timestep (s) """
+    return self._dt
+
+  def times(self):
+    """ return a numpy array with the time values """
+    return self._start + numpy.arange(len(self))*self.dt()
+
+  def receiver(self, r):
+    """ return the spectra at receiver r over time, as a (time x bands) numpy array (view) """
+    return self.amplitudes()[:,r,:]
+
+  def spectrum(self, i, r):
+    """ return the spectrum at receiver r at timestep i, as a band spectrum object """
+    z = self.amplitudes()[i,r]
+    if numpy.array_equal(self._f, FOCTAVE):
+      return OctaveBandSpectrum(z)
+    if numpy.array_equal(self._f, FTERTS):
+      return TertsBandSpectrum(z)
+    return Spectrum(f = self._f, z = z)
+
+  def weights(self, weighting = 'A'):
+    """ return the weighting values for the frequency bands ('A', 'C' or 'Z') """
+    if weighting == 'Z':
+      return numpy.zeros(len(self._f))
+    if not weighting in ['A', 'C']:
+      raise Exception('unknown frequency weighting "%s"' % weighting)
+    if numpy.array_equal(self._f, FOCTAVE):
+      return numpy.asarray({'A': AOCTAVE, 'C': COCTAVE}[weighting])
+    if numpy.array_equal(self._f, FTERTS):
+      return numpy.asarray({'A': ATERTS, 'C': CTERTS}[weighting])
+    raise Exception('frequency weighting is only available for octave and 1/3-octave band spectra')
+
+  def levels(self, weighting = 'A'):
+    """ return the weighted total levels as a collection of timeseries (one per receiver) """
+    z = sumdB(self.amplitudes() + self.weights(weighting).astype(self._z.dtype), axis = 2)
+    return TimeSeriesCollection(numpy.asarray(numpy.transpose(z), dtype = PRECISION), dt = self.dt(), copy = False)
+
+  def leq(self):
+    """ return the energy equivalent level in each band at each receiver, as a (receivers x bands) numpy array """
+    return averagedB(self.amplitudes(), axis = 0)
+
+  def percentile(self, p):
+    """ return the levels exceeded p% of the time in each band at each receiver, with p a scalar or sequence of
+        percentiles (in %), as a ([percentiles x] receivers x bands) numpy array
+    """
+    return percentiles(self.amplitudes(), 100.0 - numpy.asarray(p), axis = 0)
+
+  def saveBinary(self, filename, codec = None):
+    """ save the time series to a binary file (see saveArray, optionally encoded with a LevelCodec) """
+    metadata = dict(self.metadata())
+    metadata.update({'frequencies': self._f.tolist(), 'start': self._start})
+    saveArray(filename, self.amplitudes(), dt = self.dt(), metadata = metadata, codec = codec)
+
+
+def loadSpectralTimeSeries(filename, mmap = None):
+  """ load a spectral time series from a binary file (see loadTimeSeries) """
+  (z, header) = loadArray(filename, mmap = mmap)
+  if z.ndim != 3:
+    raise Exception('loadSpectralTimeSeries: "%s" does not contain a three-dimensional array' % filename)
+  metadata = header['metadata']
+  sts = SpectralTimeSeries(metadata.pop('frequencies'), z.shape[1], dt = header['dt'], start = metadata.pop('start'))
+  (sts._z, sts._n) = (z, len(z)) # avoid copying the (possibly memory-mapped) data
+  sts._metadata = metadata
+  return sts
+
+
+#---------------------------------------------------------------------------------------------------
+# Multi-resolution level pyramid
+#---------------------------------------------------------------------------------------------------
+
+class LevelPyramid(object):
+  """ successive decimations of a timeseries, storing the minimum, maximum and energy-mean level per block, for fast
+      browsing and plotting of long timeseries: level k of the pyramid contains blocks of factor**k samples
+  """
+  def __init__(self, ts, factor = 4):
+    object.__init__(self)
+    if factor < 2:
+      raise Exception('LevelPyramid: the decimation factor should be at least 2')
+    self._ts = ts
+    self._factor = int(factor)
+    # each level is a tuple (minima, maxima, energy sums, sample counts), level 0 are the raw samples
+    self._levels = [None]
+    z = ts.amplitudes()
+    current = (z, z, fromdB(z), numpy.ones(len(z)))
+    while len(current[0]) > 1:
+      current = self._decimate(current)
+      self._levels.append(current)
+
+  def _decimate(self, level):
+    """ reduce a level with the decimation factor (the last, partial block is padded with neutral values) """
+    (zmin, zmax, energy, count) = level
+    n = len(zmin)
+    nb = -(-n // self._factor)
+    result = []
+    for (x, pad, reduce) in [(zmin, numpy.Inf, numpy.min), (zmax, -numpy.Inf, numpy.max), (energy, 0.0, numpy.sum),
+                             (count, 0.0, numpy.sum)]:
+      blocks = numpy.empty(nb*self._factor)
+      blocks[:n] = x
+      blocks[n:] = pad
+      result.append(reduce(blocks.reshape((nb, self._factor)), axis = 1))
+    return tuple(result)
+
+  def factor(self):
+    """ return the decimation factor between successive levels """
+    return self._factor
+
+  def depth(self):
+    """ return the number of levels (including the raw samples at level 0) """
+    return len(self._levels)
+
+  def blocksize(self, level):
+    """ return the number of samples per block at the given level """
+    return self._factor**level
+
+  def level(self, level):
+    """ return a tuple (minima, maxima, energy-mean levels) of arrays for all blocks at the given level """
+    if level == 0:
+      z = self._ts.amplitudes()
+      return (z, z, z)
+    (zmin, zmax, energy, count) = self._levels[level]
+    return (zmin, zmax, todB(energy/count))
+
+  def select(self, samples, pixels):
+    """ return the coarsest level that still has at least the given number of blocks (pixels) for a number of samples """
+    level = 0
+    while (level + 1 < self.depth()) and (samples // self.blocksize(level + 1) >= pixels):
+      level += 1
+    return level
+
+  def query(self, start = 0.0, duration = None, pixels = 1000):
+    """ return a tuple (times, minima, maxima, means) of arrays that summarise the levels in the given time range (s)
+        with at least the given number of points (pixels), taken from the coarsest appropriate level of the pyramid
+        (times are the starting times of the blocks, means are energy-equivalent levels)
+    """
+    n = len(self._ts)
+    dt = self._ts.dt()
+    if duration is None:
+      duration = n*dt - start
+    i0 = int(numpy.clip(numpy.floor(start/dt), 0, n - 1))
+    i1 = int(numpy.clip(numpy.ceil((start + duration)/dt), i0 + 1, n))
+    level = self.select(i1 - i0, pixels)
+    size = self.blocksize(level)
+    (b0, b1) = (i0 // size, -(-i1 // size))
+    if level == 0:
+      z = self._ts.amplitudes()[b0:b1]
+      return (dt*numpy.arange(b0, b1), z, z, z)
+    (zmin, zmax, energy, count) = self._levels[level]
+    return (dt*size*numpy.arange(b0, b1), zmin[b0:b1], zmax[b0:b1], todB(energy[b0:b1]/count[b0:b1]))
+
+  def plot(self, start = 0.0, duration = None, pixels = 1000, color = 'black', linewidth = 1.0):
+    """ plot the range between minimum and maximum levels and the energy-mean level in the given time range """
+    (t, zmin, zmax, zmean) = self.query(start = start, duration = duration, pixels = pixels)
+    pylab.fill_between(t, zmin, zmax, color = color, alpha = 0.25, linewidth = 0.0)
+    pylab.plot(t, zmean, color = color, linewidth = linewidth)
+    pylab.xlabel('time [s]')
+
+
+#---------------------------------------------------------------------------------------------------
+# Period indicators (Lday, Levening, Lnight, Lden)
+#---------------------------------------------------------------------------------------------------
+
+class PeriodAccumulator(object):
+  """ accumulates the sound energy of a level timeseries per hour in a single pass over chunks of samples, and derives
+      hourly levels and period indicators (Lday, Levening, Lnight, Lden) from these
+      - dt: time step (s)
+      - start: clock time of the first sample, in seconds after midnight
+      - periods: list of tuples (name, first hour, last hour (exclusive), penalty in dB) covering the whole day
+  """
+  # periods and penalties according to the European Environmental Noise Directive (2002/49/EC)
+  PERIODS = [('Lday', 7, 19, 0.0), ('Levening', 19, 23, 5.0), ('Lnight', 23, 7, 10.0)]
+
+  def __init__(self, dt = 1.0, start = 0.0, periods = None):
+    object.__init__(self)
+    self._dt = dt
+    self._start = start
+    self._periods = periods if periods is not None else self.PERIODS
+    self._samples = 0 # number of samples accumulated so far
+    self._energy = numpy.zeros(0) # energy sum per hour since midnight of the first day
+    self._count = numpy.zeros(0) # number of samples per hour since midnight of the first day
+    # period index and penalty factor for each hour of the day
+    self._period = -numpy.ones(24, dtype = int)
+    for (i, (name, first, last, penalty)) in enumerate(self._periods):
+      hours = numpy.arange(first, last + (24 if last <= first else 0)) % 24
+      self._period[hours] = i
+    if numpy.any(self._period < 0):
+      raise Exception('PeriodAccumulator: the periods do not cover the whole day')
+
+  def add(self, z):
+    """ accumulate the next chunk of levels (list or numpy array) """
+    z = numpy.asarray(z).ravel()
+    n = len(z)
+    if n == 0:
+      return
+    hours = ((self._start + (self._samples + numpy.arange(n))*self._dt) // 3600.0).astype(int)
+    m = hours[-1] + 1
+    if m > len(self._energy):
+      self._energy = numpy.hstack((self._energy, numpy.zeros(m - len(self._energy))))
+      self._count = numpy.hstack((self._count, numpy.zeros(m - len(self._count))))
+    h0 = hours[0]
+    self._energy[h0:m] += numpy.bincount(hours - h0, weights = fromdB(numpy.asarray(z, dtype = float)))
+    self._count[h0:m] += numpy.bincount(hours - h0)
+    self._samples += n
+
+  def hourly(self):
+    """ return a tuple (hours, levels) with the Leq for each clock hour that contains samples, with hours counted from
+        midnight of the first day (so hour 25 is 1:00-2:00 on the second day)
+    """
+    hours = numpy.nonzero(self._count)[0]
+    return (hours, todB(self._energy[hours]/self._count[hours]))
+
+  def hourOfDay(self):
+    """ return a tuple (hours, levels) with the Leq for each hour of the day (0-23) over all days that contain samples """
+    hours = numpy.arange(len(self._energy)) % 24
+    energy = numpy.bincount(hours, weights = self._energy, minlength = 24)
+    count = numpy.bincount(hours, weights = self._count, minlength = 24)
+    present = numpy.nonzero(count)[0]
+    return (present, todB(energy[present]/count[present]))
+
+  def indicators(self):
+    """ return a dict with the level for each period (None if the period contains no samples), and 'Lden': the
+        energy average of all levels with the period penalties applied (equal to the standard Lden for whole days)
+    """
+    period = self._period[numpy.arange(len(self._energy)) % 24]
+    energy = numpy.bincount(period, weights = self._energy, minlength = len(self._periods))
+    count = numpy.bincount(period, weights = self._count, minlength = len(self._periods))
     result = {}
-    result['LAeq']  = self.leq()
-    result['LAmin'] = self.minimum()
-    result['LAmax'] = self.maximum()
-    result['LA10']  = self.percentile(10.0)
-    result['LA50']  = self.percentile(50.0)
-    result['LA90']  = self.percentile(90.0)
-    result['sigma'] = self.stdev()
+    for (i, (name, first, last, penalty)) in enumerate(self._periods):
+      result[name] = todB(energy[i]/count[i]) if count[i] > 0 else None
+    penalties = fromdB(numpy.asarray([penalty for (name, first, last, penalty) in self._periods]))
+    result['Lden'] = todB(numpy.sum(energy*penalties)/numpy.sum(count)) if self._samples > 0 else None
     return result
 
 
+def periodIndicators(source, dt = 1.0, start = 0.0, periods = None, chunk = 1000000):
+  """ calculate period indicators (see PeriodAccumulator) for a TimeSeries, a level array, or a binary level file,
+      processing the levels in chunks of the given number of samples (binary files are memory-mapped and never read
+      into memory completely; the time step is then taken from the file)
+      return a tuple (indicators dict, hourly levels as a tuple (hours, levels))
+  """
+  if isinstance(source, basestring):
+    (z, header) = loadArray(source, mmap = 'r')
+    dt = header['dt']
+  elif isinstance(source, TimeSeries):
+    (z, dt) = (source.amplitudes(), source.dt())
+  else:
+    z = numpy.asarray(source)
+  acc = PeriodAccumulator(dt = dt, start = start, periods = periods)
+  for i in range(0, len(z), chunk):
+    acc.add(z[i:i+chunk])
+  return (acc.indicators(), acc.hourly())
+
+
 #---------------------------------------------------------------------------------------------------
 # Test code
 #---------------------------------------------------------------------------------------------------
@@ -647,6 +1689,29 @@ if __name__ == '__main__':
     print parsedB('-150.0')
     print parsedB('-Inf')
 
+  # benchmark of decibel calculus: speed and accuracy of the fast paths and approximate mode
+  if 0:
+    import timeit
+    x = LOWDB + 300.0*numpy.random.rand(1000000)
+    e = 10.0**(0.1*x)
+    out = numpy.empty_like(x)
+    tests = [('fromdB reference',    lambda: 10.0**(0.1*x)),
+             ('fromdB',              lambda: fromdB(x)),
+             ('fromdB out',          lambda: fromdB(x, out = out)),
+             ('fromdB approximate',  lambda: fromdB(x, approximate = True)),
+             ('todB reference',      lambda: 10.0*numpy.log10(numpy.clip(e, 10.0**(0.1*LOWDB), numpy.Inf))),
+             ('todB',                lambda: todB(e)),
+             ('todB out',            lambda: todB(e, out = out)),
+             ('todB approximate',    lambda: todB(e, approximate = True)),
+             ('scalar reference',    lambda: 10.0*numpy.log10(numpy.clip(10.0**(0.1*55.0) + 10.0**(0.1*60.0), 1e-10, numpy.Inf))),
+             ('scalar plusdB',       lambda: plusdB(55.0, 60.0))]
+    for (label, f) in tests:
+      number = {True: 100000, False: 10}[label.startswith('scalar')]
+      print '%20s: %.3f us per value' % (label, 1e6*min(timeit.repeat(f, number = number, repeat = 3))/(number*(1 if label.startswith('scalar') else len(x))))
+    print 'maximum error fromdB approximate: %.6f dB' % numpy.max(numpy.abs(10.0*numpy.log10(fromdB(x, approximate = True)) - x))
+    print 'maximum error todB approximate:   %.6f dB' % numpy.max(numpy.abs(todB(e, approximate = True) - x))
+    print 'maximum error fromdB/todB:        %.2e dB' % numpy.max(numpy.abs(todB(fromdB(x)) - x))
+
   # test band spectrum arithmetic
   if 0:
     a = OctaveBandSpectrum([80., 82., 81., 79., 81., 82., 78., 76.])
@@ -692,6 +1757,88 @@ if __name__ == '__main__':
     #pylab.figure()
     #pylab.plot(range(600), x)
 
+  # test resampling
+  if 0:
+    ts = TimeSeries(60.0 + 10.0*numpy.random.randn(1000), dt = 0.1)
+    for method in RESAMPLEMETHODS:
+      print method, ts.resample(1.0, method = method).amplitudes()[:5]
+    print ts.resample(0.05).amplitudes()[:6], ts.leq(), ts.resample(60.0).amplitudes()
+
+  # test exceedance statistics
+  if 0:
+    ts = TimeSeries(60.0 + 10.0*numpy.random.randn(28800), dt = 0.125)
+    print 'Ncn:', ts.ncn(reference = ts.percentile(50.0))
+    stats = ts.exceedances([60.0, 65.0, 70.0, 75.0], duration = 1.0, bins = [0.0, 0.5, 1.0, 2.0, 5.0])
+    for key in ['events', 'samples', 'time', 'histogram']:
+      print key, stats[key]
+
+  # test binary storage of timeseries
+  if 0:
+    import os, time
+    ts = TimeSeries(60.0 + 10.0*numpy.random.randn(5000000), dt = 0.125)
+    ts.metadata()['receiver'] = 'R1'
+    t0 = time.time()
+    ts.saveBinary('test.bin')
+    t1 = time.time()
+    ts2 = loadTimeSeries('test.bin')
+    t2 = time.time()
+    ts3 = loadTimeSeries('test.bin', mmap = 'r')
+    print 'save: %.3fs, load: %.3fs, mmap: %.3fs' % (t1-t0, t2-t1, time.time()-t2)
+    print numpy.all(ts2.amplitudes() == ts.amplitudes()), ts3.dt(), ts3.metadata(), ts3.leq() - ts.leq()
+    del ts3
+    os.remove('test.bin')
+  # test histograms
+  if 0:
+    ts = TimeSeries(60.0 + 10.0*numpy.random.randn(28800), dt = 0.125)
+    h = ts.statdist(width = 0.5)
+    print h.percentile(10.0), ts.percentile(10.0)
+    h2 = h + TimeSeries(70.0 + 5.0*numpy.random.randn(28800)).statdist(width = 0.5)
+    pylab.figure()
+    pylab.plot(h2.labels(), h2.exceedance())
+
+  # test timeseries collection
+  if 0:
+    c = TimeSeriesCollection(60.0 + 10.0*numpy.random.randn(100, 3600), dt = 1.0)
+    m = c.indicators(['LAeq', 'LA10', 'LA90', 'Ncn', 'IR'])
+    for label in ['LAeq', 'LA10', 'LA90', 'Ncn', 'IR']:
+      print '%6s: %s' % (label, m[label][:5])
+    print c[0].indicators(['LAeq', 'LA10', 'LA90', 'Ncn', 'IR'])
+
+  # test period indicators
+  if 0:
+    ts = TimeSeries(60.0 + 10.0*numpy.random.randn(2*24*3600), dt = 1.0)
+    (ind, (hours, levels)) = ts.periodIndicators(start = 6*3600.0)
+    print ind
+    print hours[:4], levels[:4]
+
+  # test spectral time series
+  if 0:
+    sts = SpectralTimeSeries(FOCTAVE, receivers = 4, dt = 0.5)
+    for i in range(3000):
+      sts.append(60.0 + 10.0*numpy.random.randn(4, len(FOCTAVE)))
+    print sts.leq()
+    print sts.levels('A').indicators(['LAeq', 'LA10', 'LA90'])
+
+  # test level codec
+  if 0:
+    import os
+    c = TimeSeriesCollection(60.0 + numpy.cumsum(0.1*numpy.random.randn(100, 86400), axis = 1), dt = 1.0)
+    for codec in [None, LevelCodec(), LevelCodec(delta = True, compress = True)]:
+      c.saveBinary('test.bin', codec = codec)
+      error = numpy.max(numpy.abs(loadTimeSeriesCollection('test.bin').amplitudes() - c.amplitudes()))
+      print '%8d bytes, maximum error %.4f dB' % (os.path.getsize('test.bin'), error)
+    os.remove('test.bin')
+
+  # test level pyramid
+  if 0:
+    ts = TimeSeries(60.0 + 10.0*numpy.random.randn(7*24*3600*8), dt = 0.125)
+    p = ts.pyramid()
+    for (start, duration) in [(0.0, None), (3600.0, 3600.0), (7200.0, 60.0)]:
+      (t, zmin, zmax, zmean) = p.query(start, duration, pixels = 800)
+      print start, duration, len(t), t[0], zmin.min(), zmax.max(), averagedB(zmean)
+    pylab.figure()
+    p.plot(start = 3600.0, duration = 3600.0)
+
 
   try:
     pylab.show()
@@ -154,6 +154,7 @@ class VehicleInfo(object):
     self.emodel = configuration.emodel() # necessary to get the names of the relevant vehicle emission classes
     # dynamic information, filled during simulation
     self.vtypes = {} # dictionary with vehicle ID's and vehicle types
+    self.templates = {} # vehicle with default values for each vehicle class
     self.counts = {} # dictionary with vehicle counts on all sections (one list with vehicle ID's for every emission class)
     for i in range(AIMSUN.AKIInfNetNbSectionsANG()):
       sectionID = AIMSUN.AKIInfNetGetSectionANGId(i)
@@ -195,33 +196,64 @@ class VehicleInfo(object):
                         maxspeed = vMaxSpeed, maxdecel = vMaxDecel, maxaccel = vMaxAccel,
                         position = vPosition, direction = vDirection, speed = vSpeed, acceleration = vAcceleration)
 
-  def getVehicles(self, timeSta, timeStep):
-    """ return a list with all the vehicles currently in the network, taking into account the viewport """
-    vehicles = []
+  def template(self, vehicleClass):
+    """ return a vehicle of the given class with default values, for the properties that are not known to Aimsun """
+    if not vehicleClass in self.templates:
+      self.templates[vehicleClass] = vehicleClass()
+    return self.templates[vehicleClass]
+
+  def createVehicleArray(self, infos, timeStep):
+    """ create a VehicleArray from a list of (static, dynamic) aimsun information objects, and the simulation timeStep
+        (see createVehicle)
+    """
+    n = len(infos)
+    vehicles = emission.VehicleArray(n)
+    coordinates = numpy.empty((n, 6)) # front and back positions
+    speeds = numpy.empty((n, 2)) # current and previous speeds
+    for i, (sInf, dInf) in enumerate(infos):
+      cat, vehicleClass = self.getVehicleType(sInf.idVeh, sInf.length, sInf.width)
+      vehicles.assign(i, self.template(vehicleClass))
+      (vehicles.vids[i], vehicles.lengths[i], vehicles.widths[i], vehicles.cats[i]) = (sInf.idVeh, sInf.length, sInf.width, cat)
+      (vehicles.maxspeeds[i], vehicles.maxdecels[i], vehicles.maxaccels[i]) = (sInf.maxDesiredSpeed, -sInf.maxDeceleration, sInf.maxAcceleration)
+      coordinates[i] = (dInf.xCurrentPos, dInf.yCurrentPos, dInf.zCurrentPos, dInf.xCurrentPosBack, dInf.yCurrentPosBack, dInf.zCurrentPosBack)
+      speeds[i] = (dInf.CurrentSpeed, dInf.PreviousSpeed)
+    # calculate position (middle point) and direction (bearing and gradient) of all vehicles at once
+    (front, back) = (coordinates[:,:3], coordinates[:,3:])
+    vehicles.positions[:] = 0.5*(front + back)
+    delta = front - back
+    vehicles.bearings[:] = numpy.degrees(numpy.arctan2(delta[:,1], delta[:,0]))
+    vehicles.gradients[:] = numpy.degrees(numpy.arcsin(delta[:,2]/numpy.sqrt(numpy.sum(delta**2, axis = 1))))
+    # speed [km/h] and acceleration [m/s^2]
+    vehicles.speeds[:] = speeds[:,0]
+    vehicles.accelerations[:] = (speeds[:,0] - speeds[:,1])/(3.6*timeStep)
+    return vehicles
+
+  def snapshot(self):
+    """ return a list with the (sectionID, static information, dynamic information) of all the vehicles currently in the
+        network (the sectionID is None for vehicles on junctions)
+    """
+    result = []
     # fetch vehicles on sections
     for i in range(AIMSUN.AKIInfNetNbSectionsANG()):
       sectionID = AIMSUN.AKIInfNetGetSectionANGId(i)
       for j in range(AIMSUN.AKIVehStateGetNbVehiclesSection(sectionID, True)):
-        sInf = AIMSUN.AKIVehGetVehicleStaticInfSection(sectionID, j)
-        dInf = AIMSUN.AKIVehStateGetVehicleInfSection(sectionID, j)
-        vehicle = self.createVehicle(sInf, dInf, timeStep)
-        if self.viewport(vehicle):
-          vehicles.append(vehicle)
-        # side-effect: update vehicle counts for this section
-        clist = self.counts[sectionID][vehicle.cat()-1]
-        if not vehicle.vid() in clist:
-          # the vehicle is new, so add it to the section count
-          clist.append(vehicle.vid())
+        result.append((sectionID, AIMSUN.AKIVehGetVehicleStaticInfSection(sectionID, j), AIMSUN.AKIVehStateGetVehicleInfSection(sectionID, j)))
     # fetch vehicles on junctions
     for i in range(AIMSUN.AKIInfNetNbJunctions()):
       junctionID = AIMSUN.AKIInfNetGetJunctionId(i)
       for j in range(AIMSUN.AKIVehStateGetNbVehiclesJunction(junctionID)):
-        sInf = AIMSUN.AKIVehGetVehicleStaticInfJunction(junctionID, j)
-        dInf = AIMSUN.AKIVehStateGetVehicleInfJunction(junctionID, j)
-        vehicle = self.createVehicle(sInf, dInf, timeStep)
-        if self.viewport(vehicle):
-          vehicles.append(vehicle)
-    # side-effect: update pass-bys
+        result.append((None, AIMSUN.AKIVehGetVehicleStaticInfJunction(junctionID, j), AIMSUN.AKIVehStateGetVehicleInfJunction(junctionID, j)))
+    return result
+
+  def countVehicle(self, sectionID, vID, cat):
+    """ update the vehicle counts of the given section """
+    clist = self.counts[sectionID][cat-1]
+    if not vID in clist:
+      # the vehicle is new, so add it to the section count
+      clist.append(vID)
+
+  def updatePassbys(self, timeSta, vehicles):
+    """ update the vehicle pass-bys at the origin """
     for vehicle in vehicles:
       # fetch x-coordinate (1 for positive or zero, -1 for negative)
       vloc = int(math.copysign(1.0, vehicle.position().x))
@@ -230,6 +262,41 @@ class VehicleInfo(object):
       if (vID in self.vlocs) and (vloc != self.vlocs[vID]):
         self.passbys.append((timeSta, vID, self.emodel.categoryNames()[vehicle.cat()-1], vehicle.speed()))
       self.vlocs[vID] = vloc
+
+  def getVehicles(self, timeSta, timeStep):
+    """ return a list with all the vehicles currently in the network, taking into account the viewport """
+    vehicles = []
+    for (sectionID, sInf, dInf) in self.snapshot():
+      vehicle = self.createVehicle(sInf, dInf, timeStep)
+      # keep the section and the distance along the section (used by the flow-based emission mode)
+      (vehicle.section, vehicle.distance) = (sectionID, dInf.CurrentPos)
+      vehicles.append(vehicle)
+      # side-effect: update vehicle counts for this section
+      if sectionID is not None:
+        self.countVehicle(sectionID, vehicle.vid(), vehicle.cat())
+    # only keep the vehicles within the viewport (checked for all vehicles at once)
+    if len(vehicles) > 0:
+      mask = self.viewport.mask(vehicles)
+      vehicles = [vehicle for vehicle, inside in zip(vehicles, mask) if inside]
+    # side-effect: update pass-bys
+    self.updatePassbys(timeSta, vehicles)
+    return vehicles
+
+  def getVehicleArray(self, timeSta, timeStep):
+    """ return a VehicleArray with all the vehicles currently in the network, taking into account the viewport
+        (see getVehicles; the vehicles can be used directly in the batch emission calculations)
+    """
+    snapshot = self.snapshot()
+    vehicles = self.createVehicleArray([(sInf, dInf) for (sectionID, sInf, dInf) in snapshot], timeStep)
+    # side-effect: update vehicle counts
+    for (sectionID, sInf, dInf), vID, cat in zip(snapshot, vehicles.vids, vehicles.cats):
+      if sectionID is not None:
+        self.countVehicle(sectionID, int(vID), int(cat))
+    # only keep the vehicles within the viewport
+    if len(vehicles) > 0:
+      vehicles = vehicles.take(self.viewport.mask(vehicles))
+    # side-effect: update pass-bys
+    self.updatePassbys(timeSta, vehicles)
     return vehicles
 
   def saveToWorksheet(self, excelFile, sheetName):
@@ -280,51 +347,92 @@ class NoiseImmission(object):
   def __init__(self, configuration):
     object.__init__(self)
     self.configuration = configuration
-    self.results = [] # list with noise results at each timestep
+    self.spectra = None # spectral time series with the immission at all receivers (created at the first timestep)
     self.receivers = self.configuration.receivers()
     self.rpos = [r.position for r in self.receivers]
+    self.vids = set() # ids of the vehicles within the viewport at the previous timestep
 
   def update(self, timeSta, vehicles):
     """ calculates emissions, propagation and immission, and saves results; should be called once each timestep """
-    # calculate the list of sources
-    sources = []
-    for vehicle in vehicles:
-      sources += self.configuration.emodel().sources(vehicle = vehicle)
+    # release the vehicles that left the network or the viewport since the previous timestep from the emission model
+    vids = set([vehicle.vid() for vehicle in vehicles])
+    self.configuration.emodel().release(self.vids - vids)
+    self.vids = vids
+    # calculate the batch of sources (with the vehicles of the timestep grouped, if an emission cache is used)
+    cache = self.configuration.emissionCache()
+    if cache is not None:
+      sources = cache.stepSourceBatch(vehicles)
+    else:
+      sources = self.configuration.emodel().stepSourceBatch(vehicles)
     # calculate immission at receivers
-    immi = [self.configuration.pmodel().totalImmission(sources, receiver) for receiver in self.receivers]
-    laeqs = [spectrum.laeq() for spectrum in immi]
-    # add background level (only to the total level because nothing is known about the spectral shape of the background)
-    bg = self.configuration.background()
-    if bg != None:
-      laeqs = [acoustics.plusdB(x, bg) for x in laeqs]
+    immi = [self.configuration.pmodel().totalBatchImmission(sources, receiver) for receiver in self.receivers]
     # store the results
-    self.results.append((timeSta, immi, laeqs))
+    if self.spectra is None:
+      self.spectra = acoustics.SpectralTimeSeries(immi[0].frequencies(), len(self.receivers),
+                                                  dt = AIMSUN.AKIGetSimulationStepTime(), start = timeSta)
+    self.spectra.append([spectrum.amplitudes() for spectrum in immi])
+    laeqs = self.addBackground(acoustics.sumdB(self.spectra.amplitudes()[-1] + self.spectra.weights('A'), axis = 1))
     # finally, return a dict of levels for all receivers
     return dict(zip(self.rpos, laeqs))
 
+  def exitVehicle(self, vid):
+    """ release a vehicle that reached its destination from the emission model """
+    self.configuration.emodel().release([vid])
+    self.vids.discard(vid)
+
+  def finish(self):
+    """ called at the end of the simulation, before the results are saved """
+    pass
+
+  def addBackground(self, levels):
+    """ add the background level to the given A-weighted levels (only to the total level because nothing is known about
+        the spectral shape of the background)
+    """
+    bg = self.configuration.background()
+    if bg is not None:
+      return acoustics.plusdB(levels, bg)
+    return levels
+
+  def timesteps(self):
+    """ return the number of simulated timesteps """
+    if self.spectra is None:
+      return 0
+    return len(self.spectra)
+
+  def timeseries(self):
+    """ return the A-weighted SPL timeseries at all receivers as a collection (one timeseries per receiver) """
+    levels = self.spectra.levels('A')
+    levels.amplitudes()[:] = self.addBackground(levels.amplitudes())
+    return levels
+
   def saveTimeseries(self, excelFile, sheetName, passbys):
     """ save the A-weighted SPL timeseries to the given Excel worksheet """
-    # fill passby dictionary
-    pbdict = {}
-    for (t, vID, cat, speed) in passbys:
-      if not (t in pbdict):
-        pbdict[t] = []
-      pbdict[t] += [(cat, speed)]
     # write out header
     header = ['Time'] + [('Rcvr%.2d' % (i+1)) for i in range(len(self.receivers))] + ['Passbys', 'Category', 'Speed']
     for i, token in enumerate(header):
       excelFile.setValue(sheetName, 0, i, token)
+    if self.timesteps() == 0:
+      return
+    # fill passby dictionary (indexed by timestep)
+    pbdict = {}
+    (start, dt) = (self.spectra.times()[0], self.spectra.dt())
+    for (t, vID, cat, speed) in passbys:
+      i = int(round((t - start)/dt))
+      if not (i in pbdict):
+        pbdict[i] = []
+      pbdict[i] += [(cat, speed)]
     # write out data
     pbcol = len(self.rpos) + 1
-    for i, (t, immi, laeqs) in enumerate(self.results):
+    levels = self.timeseries().amplitudes()
+    for i, t in enumerate(self.spectra.times()):
       excelFile.setValue(sheetName, i+1, 0, t, 'float')
-      for j, laeq in enumerate(laeqs):
+      for j, laeq in enumerate(levels[:,i]):
         excelFile.setValue(sheetName, i+1, j+1, laeq, 'float')
       pb = 0
-      if t in pbdict:
-        pb = len(pbdict[t])
-        excelFile.setValue(sheetName, i+1, pbcol+1, str(pbdict[t][0][0])) # cat of first pass-by
-        excelFile.setValue(sheetName, i+1, pbcol+2, float(pbdict[t][0][1]), 'float') # speed of first pass-by
+      if i in pbdict:
+        pb = len(pbdict[i])
+        excelFile.setValue(sheetName, i+1, pbcol+1, str(pbdict[i][0][0])) # cat of first pass-by
+        excelFile.setValue(sheetName, i+1, pbcol+2, float(pbdict[i][0][1]), 'float') # speed of first pass-by
       excelFile.setValue(sheetName, i+1, pbcol, pb)
 
   def saveSpectra(self, excelFile):
@@ -337,10 +445,24 @@ class NoiseImmission(object):
         header = ['Time'] + [(f + 'Hz') for f in acoustics.LOCTAVE]
         for i, token in enumerate(header):
           excelFile.setValue(sheetName, 0, i, token)
-        for i, (t, immi, laeqs) in enumerate(self.results):
-          excelFile.setValue(sheetName, i+1, 0, t, 'float')
-          for j, level in enumerate(immi[r].amplitudes()):
-            excelFile.setValue(sheetName, i+1, j+1, level, 'float')
+        if self.timesteps() > 0:
+          for i, (t, levels) in enumerate(zip(self.spectra.times(), self.spectra.receiver(r))):
+            excelFile.setValue(sheetName, i+1, 0, t, 'float')
+            for j, level in enumerate(levels):
+              excelFile.setValue(sheetName, i+1, j+1, level, 'float')
+
+  def saveBinary(self, basename):
+    """ save the A-weighted SPL timeseries (and the spectra, if needed) to compact binary files, with the given
+        filename without extension (the files can be loaded with acoustics.loadTimeSeriesCollection and
+        acoustics.loadSpectralTimeSeries)
+    """
+    if self.timesteps() > 0:
+      codec = acoustics.LevelCodec(delta = True, compress = True)
+      levels = self.timeseries()
+      levels.metadata()['receivers'] = [str(p) for p in self.rpos]
+      levels.saveBinary(basename + '-levels.bin', codec = codec)
+      if self.configuration.saveSpectra():
+        self.spectra.saveBinary(basename + '-spectra.bin', codec = codec)
 
   def saveIndicators(self, excelFile, sheetName):
     """ save a series of acoustical indicators for each receiver to the given Excel worksheet """
@@ -349,13 +471,66 @@ class NoiseImmission(object):
     header = ['Indicator'] + [('Rcvr%.2d' % (i+1)) for i in range(nrecv)]
     for i, token in enumerate(header):
       excelFile.setValue(sheetName, 0, i, token)
-    # construct timeseries objects and calculate indicators (only meaningful if at least one timestep was simulated)
-    if len(self.results) > 0:
-      dt = AIMSUN.AKIGetSimulationStepTime()
-      tsList = [acoustics.TimeSeries(z = [laeqs[i] for (t, immi, laeqs) in self.results], dt = dt) for i in range(nrecv)]
-      indicators = [ts.indicators() for ts in tsList]
+    # calculate indicators for all receivers at once (only meaningful if at least one timestep was simulated)
+    if self.timesteps() > 0:
+      indicators = self.timeseries().indicators()
       # write out results
-      for i, indicator in enumerate(acoustics.TimeSeries.INDICATORLIST):
+      for i, indicator in enumerate(acoustics.TimeSeries.DEFAULTINDICATORS):
         excelFile.setValue(sheetName, i+1, 0, indicator)
         for j in range(nrecv):
-          excelFile.setValue(sheetName, i+1, j+1, indicators[j][indicator], 'float')
+          excelFile.setValue(sheetName, i+1, j+1, float(indicators[indicator][j]), 'float')
+
+
+# Note: in the flow-based emission mode, the vehicles on each section are only used to update the flows and mean
+# speeds of the section, for each vehicle category. At the end of each aggregation interval, the sections are
+# represented by equivalent line sources (see emission.FlowSources), and the immission is calculated once for the
+# whole interval. The resulting time series has one value per aggregation interval, and can be compared with the
+# (energetically averaged) time series of the dynamic mode. Vehicles on junctions are not included.
+
+class FlowImmission(NoiseImmission):
+  """ class for calculating and saving noise immissions with the flow-based emission mode """
+  def __init__(self, configuration):
+    NoiseImmission.__init__(self, configuration)
+    self.flows = self.configuration.flowSources()
+    self.interval = self.configuration.getFloat('emodel-flow-interval') # aggregation interval (s)
+    self.start = None # start time of the current aggregation interval
+    self.end = None # end time of the last timestep
+    self.levels = {} # levels of the last aggregation interval, for all receivers
+
+  def update(self, timeSta, vehicles):
+    """ overload the NoiseImmission implementation: the flows are updated at each timestep, while the immission is only
+        calculated at the end of each aggregation interval (the levels of the last interval are returned)
+    """
+    if self.start is None:
+      self.start = timeSta
+    for vehicle in vehicles:
+      if vehicle.section is not None:
+        self.flows.add(vehicle.section, vehicle, vehicle.distance)
+    step = AIMSUN.AKIGetSimulationStepTime()
+    self.end = timeSta + step
+    if (self.end - self.start) > (self.interval - 0.5*step):
+      self.aggregate()
+    return self.levels
+
+  def aggregate(self):
+    """ calculate and store the immission of the flows during the current aggregation interval """
+    sources = self.flows.sourceBatch(self.end - self.start)
+    immi = [self.configuration.pmodel().totalBatchImmission(sources, receiver) for receiver in self.receivers]
+    if self.spectra is None:
+      self.spectra = acoustics.SpectralTimeSeries(immi[0].frequencies(), len(self.receivers), dt = self.interval, start = self.start)
+    self.spectra.append([spectrum.amplitudes() for spectrum in immi])
+    laeqs = self.addBackground(acoustics.sumdB(self.spectra.amplitudes()[-1] + self.spectra.weights('A'), axis = 1))
+    self.levels = dict(zip(self.rpos, laeqs))
+    # start a new aggregation interval
+    self.flows.clear()
+    self.start = None
+
+  def finish(self):
+    """ overload the NoiseImmission implementation: calculate the immission of the last (incomplete) interval """
+    if self.start is not None:
+      self.aggregate()
+
+
+def createNoiseImmission(configuration):
+  """ construct the noise immission object for the emission mode given in the configuration """
+  return {'dynamic': NoiseImmission, 'flow': FlowImmission}[configuration.emissionMode()](configuration)
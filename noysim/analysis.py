@@ -9,8 +9,9 @@ import pylab
 import openpyxl
 
 import acoustics
+import trafficsim
 from geo import Point, Direction
-from emission import QLDCar as LightVehicle, QLDBDouble as HeavyVehicle
+from emission import QLDCar as LightVehicle, QLDBDouble as HeavyVehicle, VehicleArray
 
 
 #---------------------------------------------------------------------------------------------------
@@ -43,9 +44,10 @@ def loadLevels(filename):
 
 class Logger(object):
   """ class for loading and iterating logger files """
-  def __init__(self, filename):
+  def __init__(self, filename, arrays = False):
     object.__init__(self)
     self.filename = filename
+    self.arrays = arrays # if True, the vehicles of each timestep are returned as a VehicleArray instead of a list
     self.file = None # handle to the open file
     self.t = 0.0
 
@@ -62,19 +64,35 @@ class Logger(object):
     vClass = {False: LightVehicle, True: HeavyVehicle}[(vLength>10.0)]
     return vClass(vid = vID, position = vPosition, direction = vDirection, speed = vSpeed, acceleration = vAcceleration)
 
+  def createVehicleArray(self, records):
+    """ create a VehicleArray based on the supplied list of logger line tokens (see createVehicle) """
+    values = numpy.asarray([[float(x) for x in tokens[:7]] for tokens in records]).reshape(-1, 7)
+    vehicles = VehicleArray(len(values))
+    # simple check between light and heavy vehicles
+    heavy = (values[:,1] > 10.0)
+    vehicles.assign(~heavy, LightVehicle())
+    vehicles.assign(heavy, HeavyVehicle())
+    # fill in vehicle parameters
+    vehicles.vids[:] = values[:,0]
+    vehicles.positions[:,:2] = values[:,2:4]
+    vehicles.bearings[:] = values[:,4]
+    vehicles.speeds[:] = values[:,5]
+    vehicles.accelerations[:] = values[:,6]
+    return vehicles
+
   def __iter__(self):
     """ return the iterator """
     return self
 
   def next(self):
-    """ return (t, vehicleList) for each timestep in the logger file """
+    """ return (t, vehicleList) for each timestep in the logger file (or (t, VehicleArray) if arrays is True) """
     if self.t == None:
       # end of file was reached in previous step
       raise StopIteration
     if self.file == None:
       self.file = open(self.filename, 'r')
       self.t = float(self.file.readline().strip())
-    vehicles = []
+    records = []
     currentTime = self.t
     # fetch all vehicles
     while True:
@@ -90,8 +108,10 @@ class Logger(object):
         break
       else:
         # new vehicle
-        vehicles.append(self.createVehicle(tokens))
-    return (currentTime, vehicles)
+        records.append(tokens)
+    if self.arrays:
+      return (currentTime, self.createVehicleArray(records))
+    return (currentTime, [self.createVehicle(tokens) for tokens in records])
 
 
 #---------------------------------------------------------------------------------------------------
@@ -115,12 +135,47 @@ def plotMadmax(ts, threshold = 60.0, drop = 5.0, droptime = 25.0, mindt = 3.0, b
   pylab.hist(eLevels, bins = bins)
 
 
+#---------------------------------------------------------------------------------------------------
+# Numerical precision
+#---------------------------------------------------------------------------------------------------
+
+def comparePrecision(report = True, **kwargs):
+  """ run the same simulation (see trafficsim.simulateLevelHistory, to which the keyword arguments are passed) in float64
+      and in float32 precision (see acoustics.setPrecision), and quantify the error of the float32 results
+      return a dict with the maximum absolute level difference at each receiver ('levels'), the absolute difference of
+      each indicator at each receiver ('indicators'), and the memory size of the level arrays in bytes ('bytes')
+  """
+  previous = acoustics.precision()
+  results = {}
+  try:
+    for name in ['float64', 'float32']:
+      acoustics.setPrecision(name)
+      (passbytimes, elevels, tsList) = trafficsim.simulateLevelHistory(**kwargs)
+      collection = acoustics.TimeSeriesCollection([ts.amplitudes() for ts in tsList], dt = tsList[0].dt())
+      results[name] = (collection.amplitudes(), collection.indicators(acoustics.TimeSeries.INDICATORLIST))
+  finally:
+    acoustics.setPrecision({numpy.float32: 'float32', numpy.float64: 'float64'}[previous])
+  ((z64, ind64), (z32, ind32)) = (results['float64'], results['float32'])
+  result = {'levels': numpy.max(numpy.abs(z32.astype(numpy.float64) - z64), axis = 1),
+            'indicators': dict([(name, numpy.abs(numpy.asarray(ind32[name], dtype = numpy.float64) - ind64[name])) for name in ind64]),
+            'bytes': {'float64': z64.nbytes, 'float32': z32.nbytes}}
+  if report:
+    print 'float32 versus float64 (%d receivers, %d samples, %d versus %d bytes):' % (z64.shape + (z32.nbytes, z64.nbytes))
+    print '  %-8s %s' % ('levels', ' '.join([('%.6f' % x) for x in result['levels']]))
+    for name in acoustics.TimeSeries.INDICATORLIST:
+      print '  %-8s %s' % (name, ' '.join([('%.6f' % x) for x in result['indicators'][name]]))
+  return result
+
+
 #---------------------------------------------------------------------------------------------------
 # Test code
 #---------------------------------------------------------------------------------------------------
 
 if __name__ == '__main__':
-  pass
+
+  # test the float32 precision mode
+  if 0:
+    comparePrecision(duration = 600.0, rate = 1000, pheavy = 10.0)
 
   try:
     pylab.show()
@@ -18,7 +18,8 @@ from wx.lib.agw.floatspin import FloatSpin, EVT_FLOATSPIN
 
 import version
 from geo import Point
-from emission import ImagineModel, SkewedNormalImagineCorrectionModel, DistributionImagineCorrectionModel, Roadsurface, RectangularViewport
+from acoustics import PRECISIONS, setPrecision
+from emission import ImagineModel, SkewedNormalImagineCorrectionModel, DistributionImagineCorrectionModel, LookupModel, EmissionCache, FlowSources, Roadsurface, RectangularViewport, DynamicViewport
 from propagation import ISO9613Environment, ISO9613Model, Receiver
 
 
@@ -28,7 +29,7 @@ from propagation import ISO9613Environment, ISO9613Model, Receiver
 
 # general emission model parameters
 CFGEMODEL = [('emodel-name',                        'Imagine'), # kind of emission model
-                                                                # options: 'Imagine', 'Imagine+SkewedNormal', 'Imagine+Distribution', ('Lookup': not implemented yet)
+                                                                # options: 'Imagine', 'Imagine+SkewedNormal', 'Imagine+Distribution', 'Lookup'
              # for the meaning of the Imagine parameters: see Deliverable 11 of the Imagine project
              # flags to switch corrections on/off (switching off corrections will make the model run faster)
              ('emodel-imagine-flag-acceleration',   'True'),
@@ -55,13 +56,25 @@ CFGEMODEL = [('emodel-name',                        'Imagine'), # kind of emissi
              # parameters for distributions on emission levels in case of 'Imagine+SkewedNormal' or 'Imagine+Distribution'
              ('emodel-random-seed',                 'None'), # seed value for random number generation (None = no seed set)
              ('emodel-skewednormal-stdev',          '0.0,0.0,0.0,0.0,0.0'), # one stdev for each Imagine vehicle category
-             ('emodel-skewednormal-skew',           '0.0,0.0,0.0,0.0,0.0')] # one skewness value for each Imagine vehicle category
-             # parameters for the lookup table emission model
-             # no parameters yet
+             ('emodel-skewednormal-skew',           '0.0,0.0,0.0,0.0,0.0'), # one skewness value for each Imagine vehicle category
+             # parameters for the lookup table emission model (resolution of the tables)
+             ('emodel-lookup-speed-step',           '1.0'), # in km/h
+             ('emodel-lookup-acceleration-step',    '0.25'), # in m/s^2
+             ('emodel-lookup-gradient-max',         '10.0'), # maximum absolute gradient, in degrees
+             # cache for the emission spectra of vehicles in similar states (applicable to all emission models)
+             ('emodel-cache-size',                  '0'), # maximum number of cached spectra (0 = no cache)
+             # emission mode: 'dynamic' (the emission of each vehicle is calculated at each timestep) or 'flow' (the
+             # flows and mean speeds on the sections are turned into equivalent line sources, evaluated once per
+             # aggregation interval; vehicles on junctions and random corrections are not included)
+             ('emodel-mode',                        'dynamic'),
+             ('emodel-flow-interval',               '900.0'), # aggregation interval (in seconds) for the 'flow' mode
+             ('emodel-flow-spacing',                '10.0')] # distance between the line source points (in m) for the 'flow' mode
 
 # viewport parameters (covering the area in which vehicles have to taken into account)
 CFGVIEWPORT = [('viewport-rectangle', '-1000.0,-1000.0,1000.0,1000.0'), # dimensions of a rectangular viewport
-               ('viewport-dynamic',   'True')] # if True, the viewport is constructed dynamically
+               ('viewport-dynamic',   'True'), # if True, the viewport is constructed dynamically (within the rectangle)
+               ('viewport-margin',    '20.0')] # dynamic viewport: vehicles heard more than this margin (in dB) below the
+                                               # background level (or below 0 dBA) at all receivers are not considered
 
 # propagation model parameters
 CFGPMODEL = [('pmodel-name',                                'ISO9613'), # propagation model (only ISO 9613 implemented)
@@ -85,7 +98,9 @@ CFGOUTPUT = [('output-path',    ''), # absolute path to the output directory (if
             ('output-filename', ''), # specific filename for output of the results
                                      # (if empty, the file has the form of out_xxx_a_b_c.xls(x) with auto-generated xxx)
             ('output-extension', 'xlsx'), # output file extension ('xls' or 'xlsx')
-            ('output-spectra',  'True')] # if True, octave-band spectra are output for all receivers
+            ('output-spectra',  'True'), # if True, octave-band spectra are output for all receivers
+            ('output-binary',   'False'), # if True, levels (and spectra) are also saved to compact binary files
+            ('output-precision', 'float64')] # numerical precision of the calculated levels and spectra ('float64' or 'float32')
 
 
 # the configuration is just one big dictionary with string keys and values
@@ -95,6 +110,12 @@ DEFAULTDICT = {}
 for section in SECTIONS:
   DEFAULTDICT.update(dict(DEFAULT[section]))
 
+# parameters added after the first version of the configuration file format; configuration files without them can
+# still be loaded, and get the default values
+OPTIONAL = ['emodel-lookup-speed-step', 'emodel-lookup-acceleration-step', 'emodel-lookup-gradient-max',
+            'emodel-cache-size', 'emodel-mode', 'emodel-flow-interval', 'emodel-flow-spacing', 'viewport-margin',
+            'output-binary', 'output-precision']
+
 
 #---------------------------------------------------------------------------------------------------
 # Main configuration class
@@ -134,11 +155,15 @@ class Configuration(object):
     for section in SECTIONS:
       for key, value in config.items(section):
         temp[section + '-' + key] = value.strip()
-    # check if all necessary key-value pairs are present
+    # check if all necessary key-value pairs are present (parameters added later get their default values)
     for key in DEFAULTDICT.keys():
       if not key in temp:
-        raise Exception('Parameter "%s" is missing in configuration "%s"' % (key, filename))
+        if not key in OPTIONAL:
+          raise Exception('Parameter "%s" is missing in configuration "%s"' % (key, filename))
+        temp[key] = DEFAULTDICT[key]
     self.data = temp
+    # the precision applies to all level arrays created afterwards, so it is set before any model is constructed
+    setPrecision(self.precision())
 
   def set(self, key, value):
     """ set the key to the given value """
@@ -205,8 +230,10 @@ class Configuration(object):
         # construct distribution correction emission model with default (Australian) corrections
         self._emodel = DistributionImagineCorrectionModel(seed = seed)
       elif emodelname == 'lookup':
-        # this has to be filled in if the LookupModel emission model is to be used
-        raise NotImplementedError
+        # construct lookup table emission model (the tables are calculated when first needed)
+        self._emodel = LookupModel(vstep = self.getFloat('emodel-lookup-speed-step'),
+                                   astep = self.getFloat('emodel-lookup-acceleration-step'),
+                                   gmax = self.getFloat('emodel-lookup-gradient-max'))
       else:
         raise Exception('configuration file: Emission model "%s" not known - use "Imagine", "Imagine+SkewedNormal", "Imagine+Distribution" or "Lookup"' % emodelname)
       # all current models use the Imagine model as a base, so update the corrections
@@ -226,6 +253,29 @@ class Configuration(object):
       self._emodel.fleet['studs'] = self.getBool('emodel-imagine-fleet-studs')
     return self._emodel
 
+  def emissionCache(self):
+    """ construct an emission cache for the emission model, or return None if no cache is used """
+    if not hasattr(self, '_emissionCache'):
+      size = self.getInt('emodel-cache-size')
+      if size > 0:
+        self._emissionCache = EmissionCache(self.emodel(), size = size)
+      else:
+        self._emissionCache = None
+    return self._emissionCache
+
+  def emissionMode(self):
+    """ return the emission mode ('dynamic' or 'flow') """
+    mode = self.get('emodel-mode').lower()
+    if not mode in ('dynamic', 'flow'):
+      raise Exception('configuration file: Emission mode "%s" not known - use "dynamic" or "flow"' % mode)
+    return mode
+
+  def flowSources(self):
+    """ construct the flow sources object for the 'flow' emission mode """
+    if not hasattr(self, '_flowSources'):
+      self._flowSources = FlowSources(self.emodel(), spacing = self.getFloat('emodel-flow-spacing'))
+    return self._flowSources
+
   def environment(self):
     """ construct an environment object based on the stored parameters """
     if not hasattr(self, '_environment'):
@@ -292,14 +342,29 @@ class Configuration(object):
       self._saveSpectra = self.getBool('output-spectra')
     return self._saveSpectra
 
+  def saveBinary(self):
+    """ return True if the levels have to be saved to binary files also """
+    if not hasattr(self, '_saveBinary'):
+      self._saveBinary = self.getBool('output-binary')
+    return self._saveBinary
+
+  def precision(self):
+    """ return the numerical precision of the calculations ('float64' or 'float32') """
+    value = self.get('output-precision').lower()
+    if not value in PRECISIONS:
+      raise Exception('configuration file: Precision "%s" not known - use "float64" or "float32"' % value)
+    return value
+
   def viewport(self):
     """ construct the viewport """
     if not hasattr(self, '_viewport'):
       (minx, miny, maxx, maxy) = tuple([float(x) for x in self.get('viewport-rectangle').strip('()').split(',')])
       if self.getBool('viewport-dynamic'):
         # use the dynamically created viewport
-        #return DynamicViewport() # TODO: define this class (see above)
-        self._viewport = RectangularViewport(minx, miny, maxx, maxy)
+        level = 0.0 if (self.background() is None) else self.background()
+        self._viewport = DynamicViewport(minx, miny, maxx, maxy, receivers = self.receivers(), emodel = self.emodel(),
+                                         pmodel = self.pmodel(), road = self.road(), level = level,
+                                         margin = self.getFloat('viewport-margin'))
       else:
         # use the rectangular viewport
         self._viewport = RectangularViewport(minx, miny, maxx, maxy)
@@ -532,4 +597,5 @@ if __name__ == '__main__':
     print cfg.outputFilename()
     print cfg.outputExtension()
     print cfg.saveSpectra()
+    print cfg.precision()
     print cfg.viewport()
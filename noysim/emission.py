@@ -3,6 +3,9 @@
 #
 # Noise emission model functions and classes
 
+import bisect
+import collections
+import math
 import warnings
 import random
 
@@ -10,7 +13,7 @@ import numpy
 import pylab
 
 from geo import Point, Direction, asPoint, asDirection
-from acoustics import LOWDB, fromdB, TertsBandSpectrum
+from acoustics import LOWDB, FOFFSET, FOCTAVE, FTERTSARRAY, fromdB, todB, sumdB, precision, TertsBandSpectrum, OctaveBandSpectrum
 import numeric
 
 
@@ -144,9 +147,14 @@ class Roadsurface(object):
     return s
 
 
+def omnidirectional(theta, phi, f):
+  """ directivity function of an omnidirectional source """
+  return 0.0
+
+
 class Source(object):
   """ base source class, which serves as the output of an emission model """
-  def __init__(self, position, direction, emission, directivity = lambda theta, phi, f: 0.0):
+  def __init__(self, position, direction, emission, directivity = omnidirectional):
     object.__init__(self)
     self.position = position # Point(x,y,z) in m
     self.direction = direction # Direction(bearing,gradient) of the source, in degrees (0-360)
@@ -167,6 +175,88 @@ class Source(object):
                   directivity = self.directivity)
 
 
+# source heights with a directivity pattern, as indexed by the height codes of a SourceBatch (see ImagineDirectivity)
+DIRECTIVITYHEIGHTS = (0.01, 0.30, 0.75)
+
+class SourceBatch(object):
+  """ batch of N sources, with all properties stored in contiguous arrays (the input of the batch propagation
+      calculations, see PropagationModel.batchImmission)
+      Instead of a directivity function for each source, the directivity is given by the vehicle category and a height
+      code (index in DIRECTIVITYHEIGHTS), and is calculated for all sources at once with batchDirectivity; sources
+      with category 0 are omnidirectional.
+  """
+  def __init__(self, positions, bearings, gradients, emissions, cats, hcodes):
+    object.__init__(self)
+    self.positions = numpy.asarray(positions, dtype = float).reshape(-1, 3) # (N x 3) source positions, in m
+    self.bearings = numpy.asarray(bearings, dtype = float) # (N) source bearings, in degrees
+    self.gradients = numpy.asarray(gradients, dtype = float) # (N) source gradients, in degrees
+    self.emissions = numpy.asarray(emissions, dtype = precision()).reshape(-1, len(FTERTSARRAY)) # (N x 31) emission spectra
+    self.cats = numpy.asarray(cats, dtype = int) # (N) vehicle categories (0 for omnidirectional sources)
+    self.hcodes = numpy.asarray(hcodes, dtype = int) # (N) source height codes
+
+  def __len__(self):
+    return len(self.cats)
+
+  def __str__(self):
+    """ return a string representation of the source batch """
+    return '[Source batch (%d sources)]' % len(self)
+
+  def octaveBands(self):
+    """ return the (N x 8) octave band emission spectra of the sources """
+    z = self.emissions[:,FOFFSET:(FOFFSET+3*len(FOCTAVE))].reshape((len(self), len(FOCTAVE), 3))
+    return sumdB(z, axis = 2)
+
+  def source(self, i):
+    """ return the i-th source of the batch as a Source object """
+    if self.cats[i] == 0:
+      directivity = omnidirectional
+    else:
+      directivity = ImagineDirectivity(cat = self.cats[i], h = DIRECTIVITYHEIGHTS[self.hcodes[i]])
+    return Source(position = Point(*self.positions[i]),
+                  direction = Direction(self.bearings[i], self.gradients[i]),
+                  emission = TertsBandSpectrum(self.emissions[i]),
+                  directivity = directivity)
+
+  def sources(self):
+    """ return the list of sources of the batch as Source objects """
+    return [self.source(i) for i in range(len(self))]
+
+
+def sourceBatch(sources):
+  """ construct a SourceBatch from a list of Source objects (only the Imagine directivity pattern is supported) """
+  (cats, hcodes) = ([], [])
+  for source in sources:
+    if source.directivity is omnidirectional:
+      (cat, hcode) = (0, 0)
+    elif isinstance(source.directivity, ImagineDirectivity):
+      if not source.directivity.h in DIRECTIVITYHEIGHTS:
+        raise Exception('no directivity defined for sources at height %.2f' % source.directivity.h)
+      (cat, hcode) = (source.directivity.cat, DIRECTIVITYHEIGHTS.index(source.directivity.h))
+    else:
+      raise Exception('source batches only support omnidirectional sources and the Imagine directivity pattern')
+    cats.append(cat)
+    hcodes.append(hcode)
+  directions = [asDirection(source.direction) for source in sources]
+  return SourceBatch(positions = [asPoint(source.position).coordinates() for source in sources],
+                     bearings = [d.bearing for d in directions],
+                     gradients = [d.gradient for d in directions],
+                     emissions = [source.emission.amplitudes() for source in sources],
+                     cats = cats, hcodes = hcodes)
+
+
+def concatenateSourceBatches(batches):
+  """ return a single SourceBatch with the sources of all given batches """
+  batches = list(batches)
+  if len(batches) == 0:
+    return SourceBatch([], [], [], [], [], [])
+  return SourceBatch(positions = numpy.concatenate([b.positions for b in batches]),
+                     bearings = numpy.concatenate([b.bearings for b in batches]),
+                     gradients = numpy.concatenate([b.gradients for b in batches]),
+                     emissions = numpy.concatenate([b.emissions for b in batches]),
+                     cats = numpy.concatenate([b.cats for b in batches]),
+                     hcodes = numpy.concatenate([b.hcodes for b in batches]))
+
+
 class EmissionModel(object):
   """ base emission model interface - to be filled in by derived classes """
   def __init__(self):
@@ -188,6 +278,18 @@ class EmissionModel(object):
     """ shorthand function, calculating the total emission associated with the given vehicle and road surface """
     raise NotImplementedError
 
+  def release(self, vids):
+    """ notify the model that the vehicles with the given ids have left the network (or the viewport), such that any
+        information kept about them can be discarded (to be overloaded by models that keep such information)
+    """
+    pass
+
+  def stepSourceBatch(self, vehicles, road):
+    """ return the sources of all vehicles of a timestep as a SourceBatch (to be overloaded by models with a batch
+        calculation)
+    """
+    return sourceBatch([source for vehicle in vehicles for source in self.sources(vehicle, road)])
+
 
 class Viewport(object):
   """ viewport function object, acting as a vehicle filter
@@ -204,6 +306,21 @@ class Viewport(object):
     """ should return True only if the vehicle has to be taken into account """
     return True # the default is to consider all vehicles
 
+  def mask(self, vehicles):
+    """ return a boolean array, which is True for the vehicles (list or VehicleArray) that have to be taken into account
+        (by default, __call__ is applied to each vehicle; to be overloaded by subclasses with a vectorized implementation)
+    """
+    return numpy.asarray([self(vehicle) for vehicle in vehicles], dtype = bool)
+
+  def vectorized(self, cls):
+    """ return True if the vectorized mask of the given viewport class applies to this viewport, i.e. if __call__ was
+        not overloaded by a subclass of cls (whose filter would otherwise be ignored by the mask of cls)
+    """
+    for c in type(self).__mro__:
+      if '__call__' in c.__dict__:
+        return c is cls
+    return False
+
 
 #---------------------------------------------------------------------------------------------------
 # Specialized vehicle and road surface classes
@@ -285,6 +402,162 @@ class ReferenceRoadsurface(Roadsurface):
     Roadsurface.__init__(self, cat, temperature, chipsize, age, wet, tc)
 
 
+#---------------------------------------------------------------------------------------------------
+# Vehicle arrays
+#---------------------------------------------------------------------------------------------------
+
+# columns of a VehicleArray (name, type), in the order of the Vehicle properties
+VEHICLECOLUMNS = [('vids', numpy.int64), ('lengths', numpy.float32), ('widths', numpy.float32), ('heights', numpy.float32),
+                  ('weights', numpy.float32), ('cats', numpy.int8), ('axles', numpy.int8), ('doublemount', bool),
+                  ('studs', bool), ('fuels', 'S8'), ('cc', numpy.float32), ('maxspeeds', numpy.float32),
+                  ('maxdecels', numpy.float32), ('maxaccels', numpy.float32), ('positions', numpy.float64),
+                  ('bearings', numpy.float64), ('gradients', numpy.float64), ('speeds', numpy.float64),
+                  ('accelerations', numpy.float64)]
+
+class VehicleArray(object):
+  """ struct-of-arrays storage of the state of N vehicles (e.g. all vehicles in the network at a timestep)
+      Each vehicle property is a numpy column (positions is an (N x 3) array), such that the emission of all vehicles
+      can be calculated at once with the batch methods of the emission models (vehicleArrays accepts a VehicleArray).
+      Indexing and iteration return VehicleView objects, which have the accessor methods of Vehicle, so that code
+      written for lists of Vehicle objects keeps working.
+  """
+  def __init__(self, n = 0):
+    """ create an array of n vehicles, with all properties set to zero """
+    object.__init__(self)
+    for name, dtype in VEHICLECOLUMNS:
+      setattr(self, name, numpy.zeros((n, 3) if (name == 'positions') else n, dtype = dtype))
+
+  def __len__(self):
+    return len(self.vids)
+
+  def __getitem__(self, i):
+    """ return a view on the i-th vehicle, or a new VehicleArray with (copies of) the vehicles in the given slice """
+    if isinstance(i, slice):
+      return self.take(numpy.arange(len(self))[i])
+    if (i < -len(self)) or (i >= len(self)):
+      raise IndexError('vehicle index out of range')
+    return VehicleView(self, i % len(self))
+
+  def __iter__(self):
+    return (VehicleView(self, i) for i in range(len(self)))
+
+  def __str__(self):
+    """ return a string representation of the vehicle array """
+    return '[Vehicle array (%d vehicles)]' % len(self)
+
+  def assign(self, index, vehicle):
+    """ set the properties of the vehicles at the given index (integer, slice, boolean mask or index array) to those of
+        the given vehicle (Vehicle or VehicleView)
+    """
+    direction = asDirection(vehicle.direction())
+    values = [vehicle.vid(), vehicle.length(), vehicle.width(), vehicle.height(), vehicle.weight(), vehicle.cat(),
+              vehicle.axles(), vehicle.doublemount(), vehicle.studs(), vehicle.fuel(), vehicle.cc(), vehicle.maxspeed(),
+              vehicle.maxdecel(), vehicle.maxaccel(), asPoint(vehicle.position()).coordinates(), direction.bearing,
+              direction.gradient, vehicle.speed(), vehicle.acceleration()]
+    for (name, dtype), value in zip(VEHICLECOLUMNS, values):
+      getattr(self, name)[index] = value
+
+  def take(self, indices):
+    """ return a new VehicleArray with the vehicles at the given indices (or boolean mask) """
+    result = VehicleArray()
+    for name, dtype in VEHICLECOLUMNS:
+      setattr(result, name, getattr(self, name)[indices])
+    return result
+
+  def move(self, dx = 0.0, dy = 0.0, dz = 0.0):
+    """ move the location of all vehicles (dx, dy and dz can be scalars or arrays) """
+    self.positions[:,0] += dx
+    self.positions[:,1] += dy
+    self.positions[:,2] += dz
+
+  def arrays(self):
+    """ return a dict with the arrays needed by the batch emission calculations (see vehicleArrays) """
+    return {'cats': self.cats.astype(int), 'speeds': self.speeds, 'accelerations': self.accelerations,
+            'gradients': self.gradients, 'positions': self.positions, 'bearings': self.bearings,
+            'axles': self.axles.astype(float), 'doublemount': self.doublemount, 'vids': self.vids}
+
+  def vehicles(self):
+    """ return a list with the vehicles as (independent) Vehicle objects """
+    return [view.copy() for view in self]
+
+
+class VehicleView(object):
+  """ lightweight view on a single vehicle of a VehicleArray, with the accessor methods of Vehicle
+      the view does not copy any data, so changes to the array are visible through the view (and vice versa)
+  """
+  __slots__ = ('array', 'index')
+
+  def __init__(self, array, index):
+    self.array = array # the VehicleArray
+    self.index = index # the index of the vehicle in the array
+
+  def vid(self):
+    return int(self.array.vids[self.index])
+
+  def length(self):
+    return float(self.array.lengths[self.index])
+  def width(self):
+    return float(self.array.widths[self.index])
+  def height(self):
+    return float(self.array.heights[self.index])
+  def weight(self):
+    return float(self.array.weights[self.index])
+
+  def cat(self):
+    return int(self.array.cats[self.index])
+  def axles(self):
+    return int(self.array.axles[self.index])
+  def doublemount(self):
+    return bool(self.array.doublemount[self.index])
+  def studs(self):
+    return bool(self.array.studs[self.index])
+  def fuel(self):
+    return str(self.array.fuels[self.index])
+  def cc(self):
+    return float(self.array.cc[self.index])
+
+  def maxspeed(self):
+    return float(self.array.maxspeeds[self.index])
+  def maxdecel(self):
+    return float(self.array.maxdecels[self.index])
+  def maxaccel(self):
+    return float(self.array.maxaccels[self.index])
+
+  def position(self):
+    return Point(*self.array.positions[self.index])
+  def direction(self):
+    return Direction(self.array.bearings[self.index], self.array.gradients[self.index])
+  def speed(self):
+    return float(self.array.speeds[self.index])
+  def acceleration(self):
+    return float(self.array.accelerations[self.index])
+
+  def __str__(self):
+    """ return a string representation of the vehicle """
+    return str(self.copy())
+
+  def copy(self, cls = None):
+    """ create a copy of the vehicle, as an independent Vehicle object """
+    if cls is None:
+      cls = Vehicle
+    return cls(vid = self.vid(), length = self.length(), width = self.width(), height = self.height(), weight = self.weight(),
+               cat = self.cat(), axles = self.axles(), doublemount = self.doublemount(), studs = self.studs(), fuel = self.fuel(),
+               cc = self.cc(), maxspeed = self.maxspeed(), maxdecel = self.maxdecel(), maxaccel = self.maxaccel(),
+               position = self.position(), direction = self.direction(), speed = self.speed(), acceleration = self.acceleration())
+
+  def move(self, dx = 0.0, dy = 0.0, dz = 0.0):
+    """ move the location of the vehicle """
+    self.array.positions[self.index] += (dx, dy, dz)
+
+
+def vehicleArray(vehicles):
+  """ construct a VehicleArray from a list of Vehicle objects """
+  result = VehicleArray(len(vehicles))
+  for i, vehicle in enumerate(vehicles):
+    result.assign(i, vehicle)
+  return result
+
+
 #---------------------------------------------------------------------------------------------------
 # Specialized viewport classes
 #---------------------------------------------------------------------------------------------------
@@ -306,18 +579,101 @@ class RectangularViewport(Viewport):
       return True
     return False
 
+  def inside(self, positions):
+    """ return a boolean array, which is True for the given (N x 2) or (N x 3) positions inside the rectangle """
+    p = numpy.asarray(positions, dtype = float)
+    return (self.minx <= p[:,0]) & (p[:,0] <= self.maxx) & (self.miny <= p[:,1]) & (p[:,1] <= self.maxy)
+
+  def mask(self, vehicles):
+    """ overload the Viewport implementation """
+    if not self.vectorized(RectangularViewport):
+      return Viewport.mask(self, vehicles)
+    return self.inside(vehiclePositions(vehicles))
+
+
+class DynamicViewport(RectangularViewport):
+  """ special case of a rectangular viewport, for which the dimensions are automatically tailored to give an optimal
+      tradeoff between speed and accuracy, based on the receivers, the emission model and the propagation model
+      For each receiver and vehicle category, an influence radius is calculated, beyond which a vehicle of that
+      category driving at constant speed (the maximum emission up to the maximum speed vmax of the category on a level
+      road, see ImagineModel.maximumEmission, with the maximum Imagine source directivity of the category) would be
+      heard at a level more than margin dB below the given level (e.g. the background level). Only vehicles within the
+      given rectangle and within the influence radius for their category of at least one receiver are taken into
+      account; the rectangle of the viewport is shrunk to the bounding box of these areas. Accelerating vehicles can be
+      a few dB louder than this bound, which should be covered by the margin.
+  """
+  def __init__(self, minx, miny, maxx, maxy, receivers, emodel, pmodel, road = ReferenceRoadsurface(), level = 0.0, margin = 20.0,
+               vmax = None):
+    RectangularViewport.__init__(self, minx, miny, maxx, maxy)
+    self.level = level # reference level at the receivers (dBA)
+    self.margin = margin # level margin (dB)
+    # octave band emission spectra at constant speed (with 4 axles for heavy vehicles) and maximum directivity
+    # correction of the 5 categories
+    emissions = emodel.maximumEmission(road, vmax = vmax, gmax = 0.0, axles = 4, amax = 0.0)
+    emissions = numpy.asarray([TertsBandSpectrum(z).octaveBandSpectrum().amplitudes() for z in emissions])
+    directivity = [max([ImagineDirectivity(cat = cat, h = h)(theta = theta, phi = phi, f = f) for h in [0.01, 0.30, 0.75]
+                        for theta in range(0, 181, 15) for phi in range(0, 91, 15) for f in OctaveBandSpectrum().frequencies()])
+                   for cat in range(1, 6)]
+    emissions += numpy.asarray(directivity)[:,numpy.newaxis]
+    # influence area of each receiver, for each category (receivers x categories)
+    self.receivers = numpy.asarray([receiver.position.coordinates()[:2] for receiver in receivers]).reshape(-1, 2)
+    self.radii = numpy.asarray([self.influenceRadii(receiver, pmodel, emissions) for receiver in receivers]).reshape(-1, 5)
+    # shrink the rectangle to the bounding box of the influence areas
+    if len(receivers) > 0:
+      r = numpy.max(self.radii, axis = 1)[:,numpy.newaxis]
+      (self.minx, self.miny) = numpy.maximum((minx, miny), numpy.min(self.receivers - r, axis = 0))
+      (self.maxx, self.maxy) = numpy.minimum((maxx, maxy), numpy.max(self.receivers + r, axis = 0))
+
+  def __str__(self):
+    """ return a string representation of the viewport """
+    radii = ', '.join(['/'.join(['%.0f' % r for r in rr]) for rr in self.radii])
+    return '[DynamicViewport (%s, %s, %s, %s), radii per category (%s) m]' % (self.minx, self.miny, self.maxx, self.maxy, radii)
+
+  def influenceRadii(self, receiver, pmodel, emissions):
+    """ return the distances from the receiver beyond which vehicles with the given (5 x octave bands) emission spectra
+        (including directivity) cannot contribute significantly (limited to the farthest corner of the rectangle)
+    """
+    # attenuation along a line from the receiver, up to the farthest corner of the rectangle (the attenuation does not
+    # depend on the emission, so it is calculated once with a 0 dB source)
+    p = receiver.position
+    dmax = max([numpy.hypot(x - p.x, y - p.y) for x in (self.minx, self.maxx) for y in (self.miny, self.maxy)])
+    distances = numpy.logspace(0.0, numpy.log10(max(dmax, 1.0)), 100)
+    unit = OctaveBandSpectrum(z = numpy.zeros(len(FOCTAVE)))
+    levels = numpy.zeros((len(distances), len(emissions))) + LOWDB
+    for h in [0.01, 0.30, 0.75]:
+      for i, d in enumerate(distances):
+        source = Source(position = Point(p.x + d, p.y, h), direction = Direction(0.0, 0.0), emission = unit)
+        attenuation = pmodel.immission(source, receiver).amplitudes() + unit.aweights()
+        levels[i] = numpy.maximum(levels[i], sumdB(emissions + attenuation, axis = 1))
+    # the radius is the first distance beyond which all levels are below the threshold
+    result = numpy.zeros(len(emissions)) + distances[0]
+    for cat in range(len(emissions)):
+      above = numpy.flatnonzero(levels[:,cat] >= self.level - self.margin)
+      if len(above) > 0:
+        result[cat] = distances[min(above[-1] + 1, len(distances) - 1)]
+    return result
+
+  def __call__(self, vehicle):
+    """ check if the vehicle is situated inside the rectangle and within the influence radius of a receiver """
+    if not RectangularViewport.__call__(self, vehicle):
+      return False
+    p = vehicle.position()
+    for (x, y), r in zip(self.receivers, self.radii[:,vehicle.cat()-1]):
+      if (p.x - x)**2 + (p.y - y)**2 <= r**2:
+        return True
+    return False
 
-# TODO:
-# - define the class below
-# - uncomment the line in Configuration.viewport so it is used
-# class DynamicViewport(RectangularViewport):
-#   """ special case of a rectangular viewport, for which the dimensions are automatically tailored
-#       to give optimal tradeoff between speed and accuracy, based on various network and receiver properties
-#   """
-#   def __init__(self):
-#     # perform calculations for minx, miny, maxx, maxy
-#     # finally create the viewport
-#     RectangularViewport.__init__(minx, miny, maxx, maxy)
+  def mask(self, vehicles):
+    """ overload the Viewport implementation """
+    if not self.vectorized(DynamicViewport):
+      return Viewport.mask(self, vehicles)
+    p = vehiclePositions(vehicles)[:,:2]
+    if isinstance(vehicles, VehicleArray):
+      cats = vehicles.cats.astype(int)
+    else:
+      cats = numpy.asarray([vehicle.cat() for vehicle in vehicles], dtype = int)
+    d2 = numpy.sum((p[:,numpy.newaxis,:] - self.receivers[numpy.newaxis,:,:])**2, axis = 2)
+    return self.inside(p) & numpy.any(d2 <= self.radii[:,cats-1].T**2, axis = 1)
 
 
 #---------------------------------------------------------------------------------------------------
@@ -383,6 +739,48 @@ STUDS = {'A':  numpy.asarray([ 0.0,  0.0,  0.0,  0.0,  0.0,  0.0,  0.0,  0.0,  0
          'B':  numpy.asarray([ 0.0,  0.0,  0.0,  0.0,  0.0,  0.0,  0.0,  0.0, -4.1, -6.0, -8.5, -4.1,  1.7,  0.6, -4.6, -3.9,
                               -2.7, -4.2,-11.7,-11.7,-14.9,-17.6,-21.8,-21.6,-19.2,-14.6, -9.9,-10.2,  0.0,  0.0,  0.0])}
 
+# the Imagine model constants stacked per coefficient into (category x bands) arrays, for the batch calculations
+# (row 0 is not used, such that the rows can be indexed with the category numbers 1 to 5)
+IMAGINEARRAYS = dict([(key, numpy.vstack([numpy.zeros(31)] + [IMAGINE[cat][key] for cat in range(1, 6)]))
+                      for key in ['AR', 'BR', 'AP', 'BP', 'CP']])
+
+# source heights (low, high), maximum accelerations and temperature coefficient factors per category (row 0 not used)
+IMAGINEHEIGHTS = numpy.asarray([(0.0, 0.0), (0.01, 0.30), (0.01, 0.75), (0.01, 0.75), (0.30, 0.30), (0.30, 0.30)])
+IMAGINEHCODES = numpy.asarray([(0, 0), (0, 1), (0, 2), (0, 2), (1, 1), (1, 1)]) # codes of the heights in DIRECTIVITYHEIGHTS
+IMAGINEMAXACCEL = numpy.asarray([0.0, 2.0, 1.0, 1.0, 4.0, 4.0])
+IMAGINEMAXSPEED = numpy.asarray([0.0, 130.0, 110.0, 110.0, 50.0, 130.0]) # typical maximum speeds (km/h)
+IMAGINETCFACTOR = numpy.asarray([0.0, 1.0, 0.5, 0.5, 1.0, 1.0])
+
+# the (contiguous) range of bands for which Imagine supplies values; outside this range (at 20 Hz and at 12kHz and above),
+# the rolling and propulsion noise of all categories are always at LOWDB, and these bands are not calculated
+IMAGINEBANDS = numpy.flatnonzero(numpy.any(numpy.vstack([IMAGINEARRAYS['AR'][1:], IMAGINEARRAYS['AP'][1:]]) > LOWDB, axis = 0))
+IMAGINEBANDS = slice(IMAGINEBANDS[0], IMAGINEBANDS[-1] + 1)
+
+
+def vehiclePositions(vehicles):
+  """ return the (N x 3) positions of the given list of vehicles (or VehicleArray) """
+  if isinstance(vehicles, VehicleArray):
+    return vehicles.positions
+  return numpy.asarray([asPoint(vehicle.position()).coordinates() for vehicle in vehicles], dtype = float).reshape(-1, 3)
+
+
+def vehicleArrays(vehicles):
+  """ return a dict with the arrays needed by the batch emission calculations (see ImagineModel.batchSources)
+      for the given list of vehicles (or VehicleArray)
+  """
+  if isinstance(vehicles, VehicleArray):
+    return vehicles.arrays()
+  directions = [asDirection(vehicle.direction()) for vehicle in vehicles]
+  return {'cats': numpy.asarray([vehicle.cat() for vehicle in vehicles], dtype = int),
+          'speeds': numpy.asarray([vehicle.speed() for vehicle in vehicles], dtype = float),
+          'accelerations': numpy.asarray([vehicle.acceleration() for vehicle in vehicles], dtype = float),
+          'gradients': numpy.asarray([d.gradient for d in directions], dtype = float),
+          'positions': vehiclePositions(vehicles),
+          'bearings': numpy.asarray([d.bearing for d in directions], dtype = float),
+          'axles': numpy.asarray([vehicle.axles() for vehicle in vehicles], dtype = float),
+          'doublemount': numpy.asarray([vehicle.doublemount() for vehicle in vehicles], dtype = bool),
+          'vids': [vehicle.vid() for vehicle in vehicles]}
+
 
 class ImagineDirectivity(object):
   """ function object implementing the Harmonoise/Imagine directivity pattern
@@ -445,6 +843,82 @@ class ImagineDirectivity(object):
     return horizontal + vertical
 
 
+def batchDirectivity(cats, hcodes, theta, phi, f):
+  """ return the (N x M) directivity corrections of a batch of N sources (see SourceBatch), for arrays of N horizontal
+      and vertical angles (in degrees, see ImagineDirectivity), at M frequencies
+  """
+  (cats, hcodes) = (numpy.asarray(cats, dtype = int), numpy.asarray(hcodes, dtype = int))
+  f = numpy.asarray(f, dtype = float)
+  # restrict the angles to the correct range, and enforce horizontal and vertical symmetry
+  theta = numpy.mod(numpy.asarray(theta, dtype = float), 360.0)
+  theta = numpy.where(theta > 180.0, 360.0 - theta, theta)
+  phi = numpy.abs(numpy.mod(numpy.asarray(phi, dtype = float) + 180.0, 360.0) - 180.0)
+  phi = numpy.where(phi > 90.0, 180.0 - phi, phi)
+  # calculate horizontal directivity (depending on source height)
+  pi2theta = numpy.pi/2.0 - numpy.radians(theta)
+  sqrtcosphi = numpy.sqrt(numpy.cos(numpy.radians(phi)))
+  horn = numpy.outer((-1.5 + 2.5*numpy.abs(numpy.sin(pi2theta)))*sqrtcosphi, (1600.0 <= f) & (f <= 6300.0))
+  screening = (1.546*(pi2theta**3) - 1.425*(pi2theta**2) + 0.22*pi2theta + 0.6)*sqrtcosphi
+  horizontal = numpy.where((hcodes == 0)[:,numpy.newaxis], horn, 0.0)
+  horizontal += numpy.where(hcodes == 2, screening, 0.0)[:,numpy.newaxis]
+  # calculate vertical directivity (depending on vehicle category)
+  vertical = numpy.where(cats == 1, -phi/20.0, numpy.where((cats == 2) | (cats == 3), -phi/30.0, 0.0))
+  return numpy.where((cats > 0)[:,numpy.newaxis], horizontal + vertical[:,numpy.newaxis], 0.0)
+
+
+def imagineSourceBatch(cats, positions, bearings, gradients, emissions):
+  """ construct the SourceBatch with the low and high sources of N vehicles, given their categories, (N x 3) positions,
+      bearings, gradients and (N x 2 x 31) low and high source emission spectra
+  """
+  cats = numpy.asarray(cats, dtype = int)
+  sourcePositions = numpy.repeat(numpy.asarray(positions, dtype = float).reshape(-1, 1, 3), 2, axis = 1)
+  sourcePositions[:,:,2] += IMAGINEHEIGHTS[cats]
+  return SourceBatch(positions = sourcePositions.reshape(-1, 3),
+                     bearings = numpy.repeat(numpy.asarray(bearings, dtype = float), 2),
+                     gradients = numpy.repeat(numpy.asarray(gradients, dtype = float), 2),
+                     emissions = numpy.asarray(emissions).reshape(-1, 31),
+                     cats = numpy.repeat(cats, 2),
+                     hcodes = IMAGINEHCODES[cats].ravel())
+
+
+class ModelSettings(dict):
+  """ dictionary with settings of an emission model (correction flags or fleet parameters), which clears the compiled
+      constants of the model when it is changed, such that these are compiled again before the next calculation
+  """
+  def __init__(self, model, *args, **kwargs):
+    dict.__init__(self, *args, **kwargs)
+    self.model = model
+
+  def __setitem__(self, key, value):
+    dict.__setitem__(self, key, value)
+    self.model.compiled = None
+
+  def __delitem__(self, key):
+    dict.__delitem__(self, key)
+    self.model.compiled = None
+
+  def update(self, *args, **kwargs):
+    dict.update(self, *args, **kwargs)
+    self.model.compiled = None
+
+  def setdefault(self, key, value = None):
+    if not key in self:
+      self.model.compiled = None
+    return dict.setdefault(self, key, value)
+
+  def pop(self, key, *args):
+    self.model.compiled = None
+    return dict.pop(self, key, *args)
+
+  def popitem(self):
+    self.model.compiled = None
+    return dict.popitem(self)
+
+  def clear(self):
+    dict.clear(self)
+    self.model.compiled = None
+
+
 class ImagineModel(EmissionModel):
   """ Imagine road traffic noise emission model """
   def __init__(self):
@@ -453,9 +927,10 @@ class ImagineModel(EmissionModel):
     self.vref = 70.0
     self.vinterval = (0.1, 160.0)
     # flags for applying different types of corrections - to be adjusted after object creation if necessary
-    self.correction = {'acceleration': True, 'gradient': False, 'temperature': False,
-                       'surface': False, 'wetness': False, 'axles': True, 'fleet': False}
-    self.fleet = {'diesel': 19.0, 'tirewidth': 187.0, 'vans': 10.5, 'iress': (1.0, 35.0), 'studs': False}
+    self.correction = ModelSettings(self, {'acceleration': True, 'gradient': False, 'temperature': False,
+                                           'surface': False, 'wetness': False, 'axles': True, 'fleet': False})
+    self.fleet = ModelSettings(self, {'diesel': 19.0, 'tirewidth': 187.0, 'vans': 10.5, 'iress': (1.0, 35.0), 'studs': False})
+    self.compiled = None # model constants compiled for the current settings and road surface (see compile)
 
   def __str__(self):
     """ return a string representation of the emission model """
@@ -464,36 +939,95 @@ class ImagineModel(EmissionModel):
   def categoryNames(self):
     return ['Light', 'Medium', 'Heavy', 'Moped', 'Motorcycle']
 
-  def rollingNoise(self, vehicle, road):
-    # calculate base rolling noise
-    v = numpy.clip(vehicle.speed(), *self.vinterval)
-    z = IMAGINE[vehicle.cat()]['AR'] + IMAGINE[vehicle.cat()]['BR']*numpy.log10(v/self.vref)
-    # apply corrections
-    if self.correction['temperature'] == True:
-      z += self.temperatureCorrection(vehicle, road)
-    if self.correction['surface'] == True:
-      z += self.surfaceCorrection(vehicle, road)
-    if self.correction['wetness'] == True:
-      z += self.wetnessCorrection(vehicle, road)
-    if self.correction['axles'] == True:
+  def compile(self, road = ReferenceRoadsurface()):
+    """ fold all constant terms of the model into per-category offset arrays, for the current correction flags, fleet
+        parameters and the given road surface; this is done automatically before a calculation whenever one of these
+        has changed, such that only the speed, acceleration and gradient dependent terms remain to be calculated for each
+        vehicle (the compiled arrays only cover the bands in IMAGINEBANDS, the other bands are always at LOWDB)
+    """
+    # make sure that changes to the settings are noticed (e.g. after replacing the dicts)
+    if not isinstance(self.correction, ModelSettings):
+      self.correction = ModelSettings(self, self.correction)
+    if not isinstance(self.fleet, ModelSettings):
+      self.fleet = ModelSettings(self, self.fleet)
+    # fold the temperature, surface and fleet corrections into the base coefficients
+    (rolling, propulsion) = (IMAGINEARRAYS['AR'].copy(), IMAGINEARRAYS['AP'].copy())
+    for cat in range(1, 6):
+      vehicle = QLDCar(cat = cat)
+      if self.correction['temperature'] == True:
+        rolling[cat] += self.temperatureCorrection(vehicle, road)
+      if self.correction['surface'] == True:
+        rolling[cat] += self.surfaceCorrection(vehicle, road)
+      if self.correction['fleet'] == True:
+        rolling[cat] += self.fleetCorrectionRolling(vehicle, road)
+        propulsion[cat] += self.fleetCorrectionPropulsion(vehicle, road)
+    b = IMAGINEBANDS
+    c = {'correction': self.correction, 'fleet': self.fleet, 'road': self.roadSettings(road),
+         'AR': rolling[:,b].copy(), 'BR': IMAGINEARRAYS['BR'][:,b].copy(),
+         'AP': propulsion[:,b].copy(), 'BP': IMAGINEARRAYS['BP'][:,b].copy(), 'CP': IMAGINEARRAYS['CP'][:,b].copy(),
+         'acceleration': self.correction['acceleration'] == True, 'gradient': self.correction['gradient'] == True,
+         'axles': self.correction['axles'] == True, 'wetness': None, 'studs': None}
+    # speed dependent corrections for light vehicles, with their constant parts
+    if (self.correction['wetness'] == True) and road.wet():
+      c['wetness'] = 15.0*numpy.log10(FTERTSARRAY[b]) - 48.0
+    if (self.correction['fleet'] == True) and (self.fleet['studs'] == True):
+      c['studs'] = (STUDS['A'][b].copy(), STUDS['B'][b].copy())
+    self.compiled = c
+    return c
+
+  def compilation(self, road):
+    """ return the compiled model constants for the given road surface, compiling them first if necessary """
+    c = self.compiled
+    if (c is None) or (c['correction'] is not self.correction) or (c['fleet'] is not self.fleet) or (c['road'] != self.roadSettings(road)):
+      c = self.compile(road)
+    return c
+
+  def expandBands(self, z):
+    """ return the full 31-band spectra for the given values in the bands of IMAGINEBANDS (last axis), at LOWDB elsewhere """
+    result = numpy.empty(z.shape[:-1] + (31,), dtype = z.dtype)
+    result.fill(LOWDB)
+    result[...,IMAGINEBANDS] = z
+    return result
+
+  def rollingBands(self, vehicle, road):
+    """ return the rolling noise of a vehicle in the bands of IMAGINEBANDS """
+    c = self.compilation(road)
+    cat = vehicle.cat()
+    v = min(max(vehicle.speed(), self.vinterval[0]), self.vinterval[1])
+    logv = math.log10(v/self.vref)
+    z = c['AR'][cat] + c['BR'][cat]*logv
+    # apply the speed and vehicle dependent corrections
+    if cat == 1:
+      if c['wetness'] is not None:
+        z += numpy.maximum(0.0, c['wetness'] - 12.0*logv)
+      if c['studs'] is not None:
+        z += c['studs'][0] + c['studs'][1]*math.log10(min(max(v, 50.0), 90.0)/self.vref)
+    if (cat == 3) and c['axles']:
       z += self.axlesCorrection(vehicle, road)
-    if self.correction['fleet'] == True:
-      z += self.fleetCorrectionRolling(vehicle, road)
     return z
 
-  def propulsionNoise(self, vehicle, road):
-    # calculate base propulsion noise
-    v = numpy.clip(vehicle.speed(), *self.vinterval)
-    z = IMAGINE[vehicle.cat()]['AP'] + IMAGINE[vehicle.cat()]['BP']*((v - self.vref)/self.vref)
-    # apply corrections
-    if self.correction['acceleration'] == True:
-      z += self.accelerationCorrection(vehicle, road)
-    if self.correction['gradient'] == True:
-      z += self.gradientCorrection(vehicle, road)
-    if self.correction['fleet'] == True:
-      z += self.fleetCorrectionPropulsion(vehicle, road)
+  def propulsionBands(self, vehicle, road):
+    """ return the propulsion noise of a vehicle in the bands of IMAGINEBANDS """
+    c = self.compilation(road)
+    cat = vehicle.cat()
+    v = min(max(vehicle.speed(), self.vinterval[0]), self.vinterval[1])
+    z = c['AP'][cat] + c['BP'][cat]*((v - self.vref)/self.vref)
+    # apply the acceleration and gradient corrections, as an equivalent acceleration (see batchAccelerationTerm)
+    x = 0.0
+    if c['acceleration']:
+      x += min(max(vehicle.acceleration(), -1.0), IMAGINEMAXACCEL[cat])
+    if c['gradient']:
+      x += self.gradientTerm(cat, asDirection(vehicle.direction()).gradient)
+    if x != 0.0:
+      z += c['CP'][cat]*x
     return z
 
+  def rollingNoise(self, vehicle, road):
+    return self.expandBands(self.rollingBands(vehicle, road))
+
+  def propulsionNoise(self, vehicle, road):
+    return self.expandBands(self.propulsionBands(vehicle, road))
+
   def accelerationCorrection(self, vehicle, road):
     # restrict acceleration
     maxaccel = {1: 2.0, 2: 1.0, 3: 1.0, 4: 4.0, 5: 4.0}[vehicle.cat()]
@@ -501,22 +1035,27 @@ class ImagineModel(EmissionModel):
     return IMAGINE[vehicle.cat()]['CP'] * a
 
   def gradientCorrection(self, vehicle, road):
+    return IMAGINE[vehicle.cat()]['CP'] * self.gradientTerm(vehicle.cat(), asDirection(vehicle.direction()).gradient)
+
+  def gradientTerm(self, cat, gradient):
+    """ return the gradient correction for the given category and gradient (degrees), as an equivalent acceleration
+        (m/s^2) that multiplies the CP coefficients
+    """
     # calculate gradient as a percentage
-    alpha = 100.0*numpy.tan(asDirection(vehicle.direction()).gradientRadians())
-    cp = IMAGINE[vehicle.cat()]['CP']
+    alpha = 100.0*numpy.tan(numpy.radians(gradient))
     g = 9.81
-    if vehicle.cat() in [1, 4, 5]:
+    if cat in [1, 4, 5]:
       if alpha >= -2.0:
-        return cp * g * (alpha/100.0)
+        return g * (alpha/100.0)
       if (-8.0 < alpha) and (alpha < -2.0):
-        return cp * g * (-2.0/100.0)
+        return g * (-2.0/100.0)
       if alpha <= -8.0:
-        return -cp * g * ((alpha + 10.0)/100.0)
-    if vehicle.cat() in [2, 3]:
+        return -g * ((alpha + 10.0)/100.0)
+    if cat in [2, 3]:
       if alpha >= -2.0:
-        return cp * g * (alpha/100.0)
+        return g * (alpha/100.0)
       if alpha < -2.0:
-        return -cp * g * ((alpha + 4.0)/100.0)
+        return -g * ((alpha + 4.0)/100.0)
     raise Exception('Imagine model: condition for gradient correction not found')
 
   def temperatureCorrection(self, vehicle, road):
@@ -542,7 +1081,7 @@ class ImagineModel(EmissionModel):
       return 0.0
     # retrieve applicable model constants
     v = numpy.clip(vehicle.speed(), *self.vinterval)
-    return max(0.0, 15.0*numpy.log10(numpy.asarray(FTERTS)) - 12.0*numpy.log10(v/self.vref) - 48.0)
+    return numpy.maximum(0.0, 15.0*numpy.log10(FTERTSARRAY) - 12.0*numpy.log10(v/self.vref) - 48.0)
 
   def axlesCorrection(self, vehicle, road):
     if not (vehicle.cat() == 3):
@@ -560,12 +1099,15 @@ class ImagineModel(EmissionModel):
     # correction for percentage of delivery vans
     if vehicle.cat() == 1:
       z += 1.0 * (self.fleet['vans'] - 10.5)/100.0
-    # correction for winter/studded tires
-    if (self.fleet['studs'] == True) and (vehicle.cat() == 1):
-      v = numpy.clip(vehicle.speed(), 50.0, 90.0)
-      z += STUDS['A'] + STUDS['B']*numpy.log10(v/self.vref)
     return z
 
+  def studsCorrection(self, vehicle, road):
+    """ correction for winter/studded tires (part of the fleet corrections, if the studs fleet parameter is set) """
+    if not ((self.fleet['studs'] == True) and (vehicle.cat() == 1)):
+      return 0.0
+    v = numpy.clip(vehicle.speed(), 50.0, 90.0)
+    return STUDS['A'] + STUDS['B']*numpy.log10(v/self.vref)
+
   def fleetCorrectionPropulsion(self, vehicle, road):
     z = 0.0
     # correction for percentage of diesel vehicles
@@ -583,17 +1125,21 @@ class ImagineModel(EmissionModel):
     return z
 
   def sources(self, vehicle, road = ReferenceRoadsurface()):
+    # calculate rolling and propulsion noise
+    r = fromdB(self.rollingBands(vehicle, road))
+    p = fromdB(self.propulsionBands(vehicle, road))
+    # calculate low and high noise
+    lonoise = self.expandBands(10.0*numpy.log10(0.8*r + 0.2*p))
+    hinoise = self.expandBands(10.0*numpy.log10(0.2*r + 0.8*p))
+    return self.vehicleSources(vehicle, lonoise, hinoise)
+
+  def vehicleSources(self, vehicle, lonoise, hinoise):
+    """ construct the low and high sources of the vehicle, with the given emission spectra """
     # calculate position of sources
     pos = vehicle.position()
     h = {1: (0.01, 0.30), 2: (0.01, 0.75), 3: (0.01, 0.75), 4: (0.30, 0.30), 5: (0.30, 0.30)}[vehicle.cat()]
     lopos = Point(pos[0], pos[1], pos[2] + h[0])
     hipos = Point(pos[0], pos[1], pos[2] + h[1])
-    # calculate rolling and propulsion noise
-    r = fromdB(self.rollingNoise(vehicle, road))
-    p = fromdB(self.propulsionNoise(vehicle, road))
-    # calculate low and high noise
-    lonoise = 10.0*numpy.log10(0.8*r + 0.2*p)
-    hinoise = 10.0*numpy.log10(0.2*r + 0.8*p)
     # construct sources
     return [Source(position = lopos,
                    direction = asDirection(vehicle.direction()),
@@ -606,13 +1152,232 @@ class ImagineModel(EmissionModel):
 
   def emission(self, vehicle, road = ReferenceRoadsurface()):
     """ return the total emission as a single spectrum, assuming that all is emitted by the same source """
-    return TertsBandSpectrum(10.0*numpy.log10(fromdB(self.rollingNoise(vehicle,road)) + fromdB(self.propulsionNoise(vehicle,road))))
+    z = 10.0*numpy.log10(fromdB(self.rollingBands(vehicle, road)) + fromdB(self.propulsionBands(vehicle, road)))
+    return TertsBandSpectrum(self.expandBands(z))
+
+  def maximumEmission(self, road = ReferenceRoadsurface(), vmax = None, gmax = 10.0, axles = 10, amax = None):
+    """ return the maximum total emission spectra of the 5 categories as a (5 x 31) array, over all speeds up to the
+        maximum speed of each category (vmax, in km/h, default IMAGINEMAXSPEED), at the acceleration amax (in m/s^2,
+        default the maximum acceleration IMAGINEMAXACCEL), a gradient of gmax degrees (if the gradient correction is
+        applied) and the given number of axles (random corrections are not included)
+    """
+    vmax = IMAGINEMAXSPEED[1:] if (vmax is None) else vmax
+    amax = IMAGINEMAXACCEL[1:] if (amax is None) else (amax + numpy.zeros(5))
+    result = numpy.empty((5, 31))
+    for cat in range(1, 6):
+      v = numpy.linspace(self.vinterval[0], min(vmax[cat-1], self.vinterval[1]), 161)
+      cats = numpy.zeros(len(v), dtype = int) + cat
+      z = ImagineModel.batchEmission(self, cats, v, amax[cat-1] + numpy.zeros(len(v)), gmax + numpy.zeros(len(v)), road = road,
+                                     axles = axles + numpy.zeros(len(v), dtype = int))
+      result[cat-1] = numpy.max(z, axis = 0)
+    return result
+
+  def roadSettings(self, road):
+    """ return the road surface parameters on which the emissions depend (road surfaces with equal parameters give
+        equal emissions, even if they are different objects)
+    """
+    return (road.cat(), road.temperature(), road.chipsize(), road.age(), road.wet(), road.tc())
+
+  def settings(self, road):
+    """ return the model settings (correction flags, fleet and road surface parameters) on which the emissions depend """
+    return ((tuple(sorted(self.correction.items())), tuple(sorted(self.fleet.items())), self.vinterval, self.vref) +
+            self.roadSettings(road) + (precision(),))
+
+  # batch calculations: the methods below evaluate the model for N vehicles at once, given as arrays of categories
+  # (integers 1 to 5), speeds (km/h), accelerations (m/s^2) and gradients (degrees), and return (N x 31) arrays;
+  # the results are the same as those of the methods above for single vehicles
+
+  def batchCategories(self, cats):
+    """ check the categories of a batch of vehicles, and return them as an integer array """
+    cats = numpy.asarray(cats, dtype = int)
+    if numpy.any((cats < 1) | (cats > 5)):
+      raise Exception('Imagine model: vehicle categories should be between 1 and 5')
+    return cats
+
+  def batchRollingBands(self, cats, speeds, road, axles, doublemount):
+    """ rolling noise of a batch of vehicles in the bands of IMAGINEBANDS """
+    c = self.compilation(road)
+    cats = self.batchCategories(cats)
+    v = numpy.clip(numpy.asarray(speeds, dtype = float), *self.vinterval)
+    logv = numpy.log10(v/self.vref)[:,numpy.newaxis]
+    z = c['AR'][cats] + c['BR'][cats]*logv
+    light = (cats == 1)[:,numpy.newaxis]
+    # apply the speed and vehicle dependent corrections
+    if c['wetness'] is not None:
+      z += numpy.where(light, numpy.maximum(0.0, c['wetness'] - 12.0*logv), 0.0)
+    if c['studs'] is not None:
+      vstuds = numpy.clip(v, 50.0, 90.0)[:,numpy.newaxis]
+      z += numpy.where(light, c['studs'][0] + c['studs'][1]*numpy.log10(vstuds/self.vref), 0.0)
+    if c['axles']:
+      a = numpy.asarray(4.0 if (axles is None) else axles, dtype = float)/4.0
+      dm = numpy.asarray(True if (doublemount is None) else doublemount, dtype = bool)
+      corr = numpy.where(dm, 9.1*numpy.log10(a) + 0.8, 6.8*numpy.log10(a))
+      z += numpy.where(cats == 3, corr, 0.0)[:,numpy.newaxis]
+    return z
+
+  def batchRollingNoise(self, cats, speeds, road = ReferenceRoadsurface(), axles = None, doublemount = None):
+    """ rolling noise of a batch of vehicles (axles and doublemount default to 4 axles with double-mounted tires) """
+    return self.expandBands(self.batchRollingBands(cats, speeds, road, axles, doublemount))
+
+  def batchAccelerationTerm(self, cats, accelerations, gradients = None):
+    """ return the acceleration and gradient corrections of a batch of vehicles, as an equivalent acceleration (m/s^2)
+        that multiplies the CP coefficients of the propulsion noise (gradients in degrees, default zero)
+    """
+    cats = self.batchCategories(cats)
+    x = numpy.zeros(len(cats))
+    if self.correction['acceleration'] == True:
+      x += numpy.clip(numpy.asarray(accelerations, dtype = float), -1.0, IMAGINEMAXACCEL[cats])
+    if (self.correction['gradient'] == True) and (gradients is not None):
+      alpha = 100.0*numpy.tan(numpy.radians(numpy.asarray(gradients, dtype = float)))
+      heavy = (cats == 2) | (cats == 3)
+      # gradient factor as a percentage, see gradientTerm
+      steep = numpy.where(heavy, -(alpha + 4.0), numpy.where(alpha <= -8.0, -(alpha + 10.0), -2.0))
+      x += 9.81*numpy.where(alpha >= -2.0, alpha, steep)/100.0
+    return x
+
+  def batchPropulsionBands(self, cats, speeds, accelerations, gradients, road):
+    """ propulsion noise of a batch of vehicles in the bands of IMAGINEBANDS """
+    c = self.compilation(road)
+    cats = self.batchCategories(cats)
+    v = numpy.clip(numpy.asarray(speeds, dtype = float), *self.vinterval)
+    z = c['AP'][cats] + c['BP'][cats]*((v - self.vref)/self.vref)[:,numpy.newaxis]
+    # apply the acceleration and gradient corrections
+    z += c['CP'][cats] * self.batchAccelerationTerm(cats, accelerations, gradients)[:,numpy.newaxis]
+    return z
+
+  def batchPropulsionNoise(self, cats, speeds, accelerations, gradients = None, road = ReferenceRoadsurface()):
+    """ propulsion noise of a batch of vehicles (gradients in degrees, default zero) """
+    return self.expandBands(self.batchPropulsionBands(cats, speeds, accelerations, gradients, road))
+
+  def batchSources(self, cats, speeds, accelerations, gradients, positions, bearings, road = ReferenceRoadsurface(),
+                   axles = None, doublemount = None, vids = None):
+    """ calculate the low and high sources of a batch of N vehicles (see vehicleArrays to convert a list of vehicles)
+        return a tuple (emissions, positions, directions, heights), with the (N x 2 x 31) low and high source
+        emission spectra, the (N x 2 x 3) source positions, the (N x 2) vehicle directions (bearing, gradient)
+        and the (N x 2) source heights (the vehicle ids are only used by subclasses)
+    """
+    cats = self.batchCategories(cats)
+    gradients = numpy.zeros(len(cats)) if (gradients is None) else numpy.asarray(gradients, dtype = float)
+    emissions = self.batchSourceEmissions(cats, speeds, accelerations, gradients, road, axles, doublemount)
+    heights = IMAGINEHEIGHTS[cats]
+    sourcePositions = numpy.repeat(numpy.asarray(positions, dtype = float).reshape(-1, 1, 3), 2, axis = 1)
+    sourcePositions[:,:,2] += heights
+    directions = numpy.column_stack((numpy.asarray(bearings, dtype = float), gradients))
+    return (emissions, sourcePositions, directions, heights)
+
+  def sourceBatch(self, cats, speeds, accelerations, gradients, positions, bearings, road = ReferenceRoadsurface(),
+                  axles = None, doublemount = None, vids = None):
+    """ calculate the low and high sources of a batch of N vehicles as a SourceBatch of 2N sources (see batchSources) """
+    (emissions, sourcePositions, directions, heights) = self.batchSources(cats, speeds, accelerations, gradients, positions,
+                                                                          bearings, road = road, axles = axles,
+                                                                          doublemount = doublemount, vids = vids)
+    return imagineSourceBatch(cats, positions, directions[:,0], directions[:,1], emissions)
+
+  def stepSourceBatch(self, vehicles, road = ReferenceRoadsurface()):
+    """ overload the EmissionModel implementation """
+    a = vehicleArrays(vehicles)
+    return self.sourceBatch(a['cats'], a['speeds'], a['accelerations'], a['gradients'], a['positions'], a['bearings'],
+                            road = road, axles = a['axles'], doublemount = a['doublemount'], vids = a['vids'])
+
+  def batchSourceEmissions(self, cats, speeds, accelerations, gradients, road, axles, doublemount):
+    """ return the (N x 2 x 31) low and high source emission spectra of a batch of vehicles """
+    r = fromdB(self.batchRollingBands(cats, speeds, road, axles, doublemount))
+    p = fromdB(self.batchPropulsionBands(cats, speeds, accelerations, gradients, road))
+    emissions = numpy.empty((len(r), 2, 31), dtype = precision())
+    emissions.fill(LOWDB)
+    emissions[:,0,IMAGINEBANDS] = 10.0*numpy.log10(0.8*r + 0.2*p)
+    emissions[:,1,IMAGINEBANDS] = 10.0*numpy.log10(0.2*r + 0.8*p)
+    return emissions
+
+  def batchEmission(self, cats, speeds, accelerations, gradients = None, road = ReferenceRoadsurface(),
+                    axles = None, doublemount = None, vids = None):
+    """ return the total emission of a batch of vehicles as an (N x 31) array (see emission) """
+    r = fromdB(self.batchRollingBands(cats, speeds, road, axles, doublemount))
+    r += fromdB(self.batchPropulsionBands(cats, speeds, accelerations, gradients, road))
+    return self.expandBands(10.0*numpy.log10(r)).astype(precision())
 
 
 #---------------------------------------------------------------------------------------------------
 # Random corrected road traffic noise emission models
 #---------------------------------------------------------------------------------------------------
 
+class CorrectionStore(object):
+  """ store with the random corrections of the vehicles in the network
+      The corrections are kept in an array, together with a dict mapping the vehicle ids to their slot in the array. The
+      slots of vehicles that are released (when they leave the network or the viewport) are reused, such that the memory
+      use is bounded by the number of vehicles that are present at the same time. The corrections of new vehicles are taken
+      from blocks of values that are pre-sampled from the generator of their category; for a fixed seed, the corrections
+      only depend on the order in which the vehicles are first encountered.
+  """
+  def __init__(self, generators, blocksize = 1024):
+    object.__init__(self)
+    self.generators = generators # dict with correction generators for each vehicle category
+    self.blocksize = blocksize # number of corrections that are sampled at once for each category
+    self.clear()
+
+  def __str__(self):
+    """ return a string representation of the store """
+    return '[Correction store (%d/%d vehicles)]' % (len(self.slots), len(self.values))
+
+  def __len__(self):
+    return len(self.slots)
+
+  def __contains__(self, vid):
+    return vid in self.slots
+
+  def __getitem__(self, vid):
+    return self.values[self.slots[vid]]
+
+  def clear(self):
+    """ remove all vehicles and pre-sampled corrections from the store """
+    self.slots = {} # dict with the slot in the values array for each vehicle id
+    self.values = numpy.zeros(256) # array with the corrections
+    self.free = range(len(self.values))[::-1] # stack with the unused slots
+    self.blocks = {} # pre-sampled corrections and the index of the next one to use, for each category
+
+  def sample(self, cat):
+    """ return a new correction for the given vehicle category """
+    (block, i) = self.blocks.get(cat, ((), 0))
+    if i >= len(block):
+      (block, i) = (self.generators[cat].generate(self.blocksize), 0)
+    self.blocks[cat] = (block, i + 1)
+    return block[i]
+
+  def slot(self, vid, cat):
+    """ return the slot of a vehicle, adding the vehicle with a new correction if it was not encountered before """
+    if vid in self.slots:
+      return self.slots[vid]
+    if len(self.free) == 0:
+      # double the size of the values array
+      n = len(self.values)
+      self.values = numpy.concatenate((self.values, numpy.zeros(n)))
+      self.free = range(n, 2*n)[::-1]
+    slot = self.free.pop()
+    self.values[slot] = self.sample(cat)
+    self.slots[vid] = slot
+    return slot
+
+  def get(self, vid, cat):
+    """ return the correction of a vehicle, adding the vehicle to the store if it was not encountered before """
+    slot = self.slot(vid, cat) # (the values array may be reallocated)
+    return self.values[slot]
+
+  def batch(self, vids, cats):
+    """ return an array with the corrections of a batch of vehicles, given their ids and categories """
+    slots = [self.slots.get(vid) for vid in vids]
+    for i, slot in enumerate(slots):
+      if slot is None:
+        slots[i] = self.slot(vids[i], cats[i])
+    return self.values[slots]
+
+  def release(self, vids):
+    """ remove the given vehicles from the store (unknown vehicle ids are ignored) """
+    for vid in vids:
+      slot = self.slots.pop(vid, None)
+      if slot is not None:
+        self.free.append(slot)
+
+
 class ImagineCorrectionModel(ImagineModel):
   """ Road traffic noise emission model with random corrections on the emissions
       This model uses the Imagine model as a base, but adds a random (frequency-independent) sound power level correction
@@ -621,24 +1386,20 @@ class ImagineCorrectionModel(ImagineModel):
   def __init__(self, seed = None):
     ImagineModel.__init__(self)
     numeric.seed(seed)
-    self.corrections = {} # dict with a random correction for each vehicle, filled during simulation
     self.generators = {} # dict with correction generators for each vehicle category, to be filled in by subclasses
+    self.corrections = CorrectionStore(self.generators) # random correction for each vehicle, filled during simulation
 
   def __str__(self):
     """ return a string representation of the emission model """
     return '[Random correction emission model]'
 
   def getCorrection(self, vehicle):
-    """ return the correction for a given vehicle """
-    (vid, cat) = (vehicle.vid(), vehicle.cat())
-    if vid in self.corrections:
-      # vehicle was encountered before, so use the same correction
-      corr = self.corrections[vid]
-    else:
-      # new vehicle, so calculate a new correction and save it
-      corr = self.generators[cat].generate()
-      self.corrections[vid] = corr
-    return corr
+    """ return the correction for a given vehicle (the same correction is used until the vehicle is released) """
+    return self.corrections.get(vehicle.vid(), vehicle.cat())
+
+  def release(self, vids):
+    """ overload the EmissionModel implementation """
+    self.corrections.release(vids)
 
   def sources(self, vehicle, road = ReferenceRoadsurface()):
     """ overload the ImagineModel implementation """
@@ -659,6 +1420,29 @@ class ImagineCorrectionModel(ImagineModel):
     result.correct(corr)
     return result
 
+  def getCorrections(self, vids, cats):
+    """ return an array with the corrections for a batch of vehicles, given their ids and categories """
+    if vids is None:
+      raise Exception('random correction models need the vehicle ids for batch calculations')
+    return self.corrections.batch(vids, cats)
+
+  def batchSources(self, cats, speeds, accelerations, gradients, positions, bearings, road = ReferenceRoadsurface(),
+                   axles = None, doublemount = None, vids = None):
+    """ overload the ImagineModel implementation """
+    result = ImagineModel.batchSources(self, cats, speeds, accelerations, gradients, positions, bearings, road = road,
+                                       axles = axles, doublemount = doublemount)
+    emissions = result[0]
+    emissions += self.getCorrections(vids, cats)[:,numpy.newaxis,numpy.newaxis]
+    return result
+
+  def batchEmission(self, cats, speeds, accelerations, gradients = None, road = ReferenceRoadsurface(),
+                    axles = None, doublemount = None, vids = None):
+    """ overload the ImagineModel implementation """
+    result = ImagineModel.batchEmission(self, cats, speeds, accelerations, gradients, road = road,
+                                        axles = axles, doublemount = doublemount)
+    result += self.getCorrections(vids, cats)[:,numpy.newaxis]
+    return result
+
 
 class SkewedNormalImagineCorrectionModel(ImagineCorrectionModel):
   """ Emission model that samples random corrections from a skewed normal distribution """
@@ -699,13 +1483,418 @@ class DistributionImagineCorrectionModel(ImagineCorrectionModel):
 # Lookup table road traffic noise emission model
 #---------------------------------------------------------------------------------------------------
 
-# TODO: Implement lookup table model, for which the following has to be done
-# - create a class LookupModel, that is a subclass from ImagineModel, and overload the 'sources' and 'emission' methods
-#   (same way as the DistributionModel class above); a subclass from the Imagine model is necessary because the Lookup model
-#   may use the shape of the emission spectrum as from the Imagine model
-# - add necessary values to the default configuration (CFGEMODEL, see above) and create a new default configuration file,
-#   by running this script from the command line with the flag MAIN_CONFIG set to True
-# - update the method 'Configuration.emodel' (see below) such that a LookupModel object is created when appropriate
+class LookupModel(ImagineModel):
+  """ Imagine road traffic noise emission model, evaluated by interpolation in precomputed tables
+      For each vehicle category, the low and high source spectra and the total emission spectrum are tabulated on a grid
+      of speeds and (equivalent) accelerations, for the current correction flags, fleet parameters and road surface. The
+      acceleration and gradient corrections both multiply the CP coefficients, so the gradient is folded exactly into
+      the acceleration axis of the tables (see ImagineModel.batchAccelerationTerm). The tables are calculated when first
+      needed, and recalculated when the settings or the road surface change. With the default resolution (1 km/h and
+      0.25 m/s^2), the spectra differ less than 0.05 dB from those of the Imagine model (see the test code), and the
+      tables take about 5 MB per category in float64 precision.
+  """
+  def __init__(self, vstep = 1.0, astep = 0.25, gmax = 10.0):
+    ImagineModel.__init__(self)
+    self.vstep = vstep # speed resolution of the tables (km/h)
+    self.vratio = 0.05 # relative speed resolution of the tables at low speeds
+    self.astep = astep # (equivalent) acceleration resolution of the tables (m/s^2)
+    self.gmax = gmax # maximum absolute gradient covered by the tables (degrees)
+    self.tables = {} # tables with the low, high and total emission spectra, for each category (and axle configuration)
+    self.signature = None # settings for which the tables were calculated
+
+  def __str__(self):
+    """ return a string representation of the emission model """
+    return '[Lookup table emission model]'
+
+  def settings(self, road):
+    """ overload the ImagineModel implementation (the tables also depend on their resolution) """
+    return ImagineModel.settings(self, road) + (self.vstep, self.vratio, self.astep, self.gmax)
+
+  def grids(self):
+    """ return the speed and (equivalent) acceleration values at which the tables are calculated """
+    # speeds with steps of at most vstep, and relative steps of at most vratio at low speeds (where the logarithmic
+    # speed dependency of the rolling noise changes fast)
+    v = [self.vinterval[0]]
+    while v[-1] < self.vinterval[1]:
+      v.append(min(v[-1] + min(self.vstep, self.vratio*v[-1]), self.vinterval[1]))
+    v = numpy.asarray(v)
+    # range of equivalent accelerations, over all categories and all gradients up to gmax
+    g = numpy.linspace(-self.gmax, self.gmax, 2001)
+    x = numpy.hstack([self.batchAccelerationTerm(numpy.zeros(len(g), dtype = int) + cat, numpy.zeros(len(g)), g) for cat in range(1, 6)])
+    (xmin, xmax) = (numpy.min(x), numpy.max(x))
+    if self.correction['acceleration'] == True:
+      (xmin, xmax) = (xmin - 1.0, xmax + numpy.max(IMAGINEMAXACCEL))
+    # without acceleration and gradient corrections, the range collapses to a single value; keep at least one step
+    xmax = max(xmax, xmin + self.astep)
+    x = numpy.linspace(xmin, xmax, max(2, int(numpy.ceil((xmax - xmin)/self.astep)) + 1))
+    return (v, x)
+
+  def tableKey(self, cat, axles, doublemount):
+    """ return the key of the table for the given vehicle category and axle configuration """
+    if (cat == 3) and (self.correction['axles'] == True):
+      return (cat, int(axles), bool(doublemount))
+    return (cat,)
+
+  def table(self, key, road):
+    """ return the (speeds x accelerations x 3 x 31) table with the low, high and total emission spectra for the given
+        table key, calculating it if needed
+    """
+    signature = self.settings(road)
+    if signature != self.signature:
+      (self.tables, self.signature) = ({}, signature)
+      (self.vgrid, self.xgrid) = self.grids()
+      self.vlist = self.vgrid.tolist() # for fast scalar searches
+    if not key in self.tables:
+      (v, x) = (self.vgrid, self.xgrid)
+      cats = numpy.zeros(len(v), dtype = int) + key[0]
+      (axles, doublemount) = (key[1:] if (len(key) == 3) else (None, None))
+      (b, cp) = (IMAGINEBANDS, self.compilation(road)['CP'][key[0]])
+      r = fromdB(self.batchRollingBands(cats, v, road, axles, doublemount))[:,numpy.newaxis,:]
+      p = self.batchPropulsionBands(cats, v, numpy.zeros(len(v)), None, road) # without acceleration and gradient corrections
+      p = fromdB(p[:,numpy.newaxis,:] + cp*x[numpy.newaxis,:,numpy.newaxis])
+      table = numpy.empty((len(v), len(x), 3, 31), dtype = precision())
+      table.fill(LOWDB)
+      table[:,:,0,b] = 10.0*numpy.log10(0.8*r + 0.2*p)
+      table[:,:,1,b] = 10.0*numpy.log10(0.2*r + 0.8*p)
+      table[:,:,2,b] = 10.0*numpy.log10(r + p)
+      self.tables[key] = table
+    return self.tables[key]
+
+  def interpolate(self, table, speeds, x):
+    """ return the (N x 3 x 31) spectra for the given speeds and equivalent accelerations, by bilinear interpolation
+        (linear in dB) between the table values
+    """
+    (v, xgrid) = (self.vgrid, self.xgrid)
+    speeds = numpy.clip(speeds, v[0], v[-1])
+    i = numpy.minimum(numpy.searchsorted(v, speeds, side = 'right') - 1, len(v) - 2)
+    fj = (numpy.clip(x, xgrid[0], xgrid[-1]) - xgrid[0])/(xgrid[1] - xgrid[0])
+    j = numpy.minimum(fj.astype(int), len(xgrid) - 2)
+    wi = ((speeds - v[i])/(v[i+1] - v[i]))[:,numpy.newaxis,numpy.newaxis]
+    wj = (fj - j)[:,numpy.newaxis,numpy.newaxis]
+    return (1.0 - wi)*((1.0 - wj)*table[i,j] + wj*table[i,j+1]) + wi*((1.0 - wj)*table[i+1,j] + wj*table[i+1,j+1])
+
+  def lookup(self, vehicle, road):
+    """ return the (3 x 31) low, high and total emission spectra of a single vehicle """
+    cat = vehicle.cat()
+    table = self.table(self.tableKey(cat, vehicle.axles(), vehicle.doublemount()), road)
+    # equivalent acceleration (see ImagineModel.batchAccelerationTerm)
+    x = 0.0
+    if self.correction['acceleration'] == True:
+      x += min(max(vehicle.acceleration(), -1.0), IMAGINEMAXACCEL[cat])
+    if self.correction['gradient'] == True:
+      x += self.gradientTerm(cat, asDirection(vehicle.direction()).gradient)
+    # bilinear interpolation (see interpolate), with scalar indices and weights
+    (v, xgrid) = (self.vgrid, self.xgrid)
+    speed = min(max(vehicle.speed(), v[0]), v[-1])
+    i = min(bisect.bisect_right(self.vlist, speed) - 1, len(v) - 2)
+    fj = (min(max(x, xgrid[0]), xgrid[-1]) - xgrid[0])/(xgrid[1] - xgrid[0])
+    j = min(int(fj), len(xgrid) - 2)
+    (wi, wj) = ((speed - v[i])/(v[i+1] - v[i]), fj - j)
+    t = table[i:i+2,j:j+2]
+    return (1.0 - wi)*((1.0 - wj)*t[0,0] + wj*t[0,1]) + wi*((1.0 - wj)*t[1,0] + wj*t[1,1])
+
+  def sources(self, vehicle, road = ReferenceRoadsurface()):
+    """ overload the ImagineModel implementation """
+    z = self.lookup(vehicle, road)
+    return self.vehicleSources(vehicle, z[0], z[1])
+
+  def emission(self, vehicle, road = ReferenceRoadsurface()):
+    """ overload the ImagineModel implementation """
+    return TertsBandSpectrum(self.lookup(vehicle, road)[2])
+
+  def batchLookup(self, cats, speeds, accelerations, gradients, road, axles, doublemount):
+    """ return the (N x 3 x 31) low, high and total emission spectra of a batch of vehicles """
+    cats = self.batchCategories(cats)
+    speeds = numpy.asarray(speeds, dtype = float)
+    x = self.batchAccelerationTerm(cats, accelerations, gradients)
+    # group the vehicles that use the same table
+    axles = numpy.zeros(len(cats), dtype = int) + (4 if (axles is None) else numpy.asarray(axles, dtype = int))
+    doublemount = numpy.zeros(len(cats), dtype = bool) | (True if (doublemount is None) else numpy.asarray(doublemount, dtype = bool))
+    codes = 1000*cats
+    if self.correction['axles'] == True:
+      codes += numpy.where(cats == 3, 2*axles + doublemount, 0)
+    result = numpy.empty((len(cats), 3, 31), dtype = precision())
+    for code in numpy.unique(codes):
+      mask = (codes == code)
+      key = self.tableKey(code // 1000, (code % 1000) // 2, (code % 2) == 1)
+      result[mask] = self.interpolate(self.table(key, road), speeds[mask], x[mask])
+    return result
+
+  def batchSourceEmissions(self, cats, speeds, accelerations, gradients, road, axles, doublemount):
+    """ overload the ImagineModel implementation """
+    return self.batchLookup(cats, speeds, accelerations, gradients, road, axles, doublemount)[:,:2]
+
+  def batchEmission(self, cats, speeds, accelerations, gradients = None, road = ReferenceRoadsurface(),
+                    axles = None, doublemount = None, vids = None):
+    """ overload the ImagineModel implementation """
+    return self.batchLookup(cats, speeds, accelerations, gradients, road, axles, doublemount)[:,2]
+
+
+#---------------------------------------------------------------------------------------------------
+# Emission cache
+#---------------------------------------------------------------------------------------------------
+
+class EmissionCache(object):
+  """ bounded cache of the emission spectra of an Imagine based emission model
+      The low, high and total emission spectra are stored for quantized vehicle states (category, speed, acceleration,
+      gradient and axle configuration) and model settings (correction flags, fleet and road surface parameters), and the
+      least recently used spectra are removed when the cache is full. The vehicles of a timestep with the same key are
+      grouped, and the spectra that are not yet cached are calculated at once with the batch methods of the model. The
+      spectra are calculated at the quantized state; with the default resolution, they differ less than 0.05 dB from
+      the exact values. The random corrections of the ImagineCorrectionModel classes are applied per vehicle after the
+      lookup, so these remain exact.
+  """
+  def __init__(self, model, size = 100000, vratio = 0.002, astep = 0.005, gstep = 0.02):
+    object.__init__(self)
+    self.model = model # the emission model (ImagineModel or subclass)
+    self.size = size # maximum number of cached states
+    self.vratio = vratio # relative speed resolution
+    self.astep = astep # acceleration resolution (m/s^2)
+    self.gstep = gstep # gradient resolution (degrees)
+    self.ids = {} # integer id for each set of model settings, to keep the keys short
+    self.clear()
+
+  def __str__(self):
+    """ return a string representation of the emission cache """
+    return '[Emission cache for %s (%d/%d states)]' % (str(self.model), len(self.spectra), self.size)
+
+  def categoryNames(self):
+    return self.model.categoryNames()
+
+  def clear(self):
+    """ remove all cached spectra and reset the statistics """
+    self.spectra = collections.OrderedDict() # (3 x 31) spectra for each key, from least to most recently used
+    self.resetStatistics()
+
+  def resetStatistics(self):
+    """ reset the hit-rate statistics """
+    self.stats = {'lookups': 0, 'hits': 0, 'grouped': 0, 'misses': 0, 'evictions': 0}
+
+  def statistics(self):
+    """ return a dict with the number of vehicle lookups, the number of lookups found in the cache (hits), the number of
+        lookups that shared their key with another vehicle in the same timestep (grouped), the number of calculated
+        states (misses), the number of removed states (evictions), the current size and the hit rate (in %, the
+        percentage of lookups that did not need a calculation)
+    """
+    result = dict(self.stats)
+    result['size'] = len(self.spectra)
+    result['hitrate'] = 100.0*(result['lookups'] - result['misses'])/max(1, result['lookups'])
+    return result
+
+  def keys(self, cats, speeds, accelerations, gradients, axles, doublemount, road):
+    """ return the cache keys and the quantized states (speeds, accelerations and gradients) of a batch of vehicles """
+    model = self.model
+    settings = model.settings(road)
+    if not settings in self.ids:
+      self.ids[settings] = len(self.ids)
+    n = len(cats)
+    # quantize the states, after restricting them to the ranges that have an influence on the emission
+    logratio = math.log(1.0 + self.vratio)
+    vbins = numpy.round(numpy.log(numpy.clip(speeds, *model.vinterval))/logratio).astype(int)
+    abins = numpy.zeros(n, dtype = int)
+    if model.correction['acceleration'] == True:
+      abins = numpy.round(numpy.clip(accelerations, -1.0, IMAGINEMAXACCEL[cats])/self.astep).astype(int)
+    gbins = numpy.zeros(n, dtype = int)
+    if (model.correction['gradient'] == True) and (gradients is not None):
+      gbins = numpy.round(numpy.asarray(gradients)/self.gstep).astype(int)
+    # axle configuration (only relevant for category 3)
+    if model.correction['axles'] == True:
+      configs = numpy.where(cats == 3, 2*axles + doublemount, 0)
+    else:
+      configs = numpy.zeros(n, dtype = int)
+    keys = zip(cats.tolist(), configs.tolist(), vbins.tolist(), abins.tolist(), gbins.tolist(), n*[self.ids[settings]])
+    return (keys, numpy.exp(vbins*logratio), abins*self.astep, gbins*self.gstep)
+
+  def batchSpectra(self, cats, speeds, accelerations, gradients = None, road = ReferenceRoadsurface(),
+                   axles = None, doublemount = None, vids = None):
+    """ return the (N x 3 x 31) low, high and total emission spectra of a batch of vehicles (see ImagineModel.batchSources) """
+    cats = self.model.batchCategories(cats)
+    n = len(cats)
+    axles = numpy.zeros(n, dtype = int) + (4 if (axles is None) else numpy.asarray(axles, dtype = int))
+    doublemount = numpy.zeros(n, dtype = bool) | (True if (doublemount is None) else numpy.asarray(doublemount, dtype = bool))
+    (keys, v, a, g) = self.keys(cats, numpy.asarray(speeds, dtype = float), numpy.asarray(accelerations, dtype = float),
+                                gradients, axles, doublemount, road)
+    # group the vehicles with the same key
+    groups = {}
+    for i, key in enumerate(keys):
+      groups.setdefault(key, []).append(i)
+    self.stats['lookups'] += n
+    self.stats['grouped'] += n - len(groups)
+    # fetch the cached spectra (and mark them as most recently used)
+    found = {}
+    for key in groups:
+      if key in self.spectra:
+        found[key] = self.spectra.pop(key)
+        self.spectra[key] = found[key]
+        self.stats['hits'] += len(groups[key])
+    # calculate the missing spectra at the quantized states
+    missing = [key for key in groups if not key in found]
+    if len(missing) > 0:
+      rows = [groups[key][0] for key in missing]
+      z = self.model.batchSourceEmissions(cats[rows], v[rows], a[rows], g[rows], road, axles[rows], doublemount[rows])
+      total = todB(fromdB(z[:,0]) + fromdB(z[:,1]))
+      total[(z[:,0] <= LOWDB) & (z[:,1] <= LOWDB)] = LOWDB # bands that are not supplied by the model
+      for key, spectra, t in zip(missing, z, total):
+        found[key] = numpy.vstack((spectra, t))
+        self.spectra[key] = found[key]
+      self.stats['misses'] += len(missing)
+      while len(self.spectra) > self.size:
+        self.spectra.popitem(last = False)
+        self.stats['evictions'] += 1
+    # assemble the result, and apply the random corrections (if any) per vehicle
+    result = numpy.empty((n, 3, 31), dtype = precision())
+    for key, indices in groups.iteritems():
+      result[indices] = found[key]
+    if isinstance(self.model, ImagineCorrectionModel):
+      result += self.model.getCorrections(vids, cats)[:,numpy.newaxis,numpy.newaxis]
+    return result
+
+  def stepSpectra(self, vehicles, road = ReferenceRoadsurface()):
+    """ return the (N x 3 x 31) low, high and total emission spectra of all vehicles of a timestep """
+    a = vehicleArrays(vehicles)
+    return self.batchSpectra(a['cats'], a['speeds'], a['accelerations'], a['gradients'], road = road, axles = a['axles'],
+                             doublemount = a['doublemount'], vids = a['vids'])
+
+  def stepSourceBatch(self, vehicles, road = ReferenceRoadsurface()):
+    """ return the sources of all vehicles of a timestep as a SourceBatch """
+    a = vehicleArrays(vehicles)
+    z = self.batchSpectra(a['cats'], a['speeds'], a['accelerations'], a['gradients'], road = road, axles = a['axles'],
+                          doublemount = a['doublemount'], vids = a['vids'])
+    return imagineSourceBatch(a['cats'], a['positions'], a['bearings'], a['gradients'], z[:,:2])
+
+  def stepSources(self, vehicles, road = ReferenceRoadsurface()):
+    """ return the list of sources of all vehicles of a timestep """
+    result = []
+    if len(vehicles) > 0:
+      for vehicle, z in zip(vehicles, self.stepSpectra(vehicles, road)):
+        result += self.model.vehicleSources(vehicle, z[0], z[1])
+    return result
+
+  def sources(self, vehicle, road = ReferenceRoadsurface()):
+    """ calculate the list of emission sources associated with the given vehicle and road surface """
+    z = self.stepSpectra([vehicle], road)[0]
+    return self.model.vehicleSources(vehicle, z[0], z[1])
+
+  def emission(self, vehicle, road = ReferenceRoadsurface()):
+    """ return the total emission as a single spectrum """
+    return TertsBandSpectrum(self.stepSpectra([vehicle], road)[0,2])
+
+
+#---------------------------------------------------------------------------------------------------
+# Flow-based emission (equivalent line sources)
+#---------------------------------------------------------------------------------------------------
+
+class FlowSources(object):
+  """ equivalent line sources of the traffic flows on a set of links (e.g. Aimsun sections)
+      The vehicles observed on each link during an aggregation interval are reduced to a flow (vehicles/h) and a mean
+      speed (km/h) per vehicle category and axle configuration. Each link is represented by point sources every
+      'spacing' metres along its length, with the emission of a vehicle driving at the mean speed, corrected for the
+      number of vehicles per metre (flow/speed) and the length of the segment, such that the energy of the line source
+      equals the time-averaged energy of the individual vehicles. The geometry of the links is learned from the positions
+      of the observed vehicles as a function of their distance along the link, and is kept over the intervals (gaps are
+      interpolated). Accelerations and the random corrections of the ImagineCorrectionModel classes are not included.
+  """
+  def __init__(self, model, spacing = 10.0, vmin = 1.0):
+    object.__init__(self)
+    self.model = model # the emission model (ImagineModel or subclass)
+    self.spacing = spacing # distance between the point sources along the links (m)
+    self.vmin = vmin # lower limit on the mean speed (km/h), to keep the density of standing traffic finite
+    self.geometry = {} # mean vehicle position [x, y, z, n] per link and segment index
+    self.directions = {} # last observed vehicle direction per link (used for links with a single segment)
+    self.clear()
+
+  def __str__(self):
+    """ return a string representation of the flow sources """
+    return '[Flow sources of %d links (%d flows), spacing=%.1fm]' % (len(self.geometry), len(self.vids), self.spacing)
+
+  def clear(self):
+    """ start a new aggregation interval (the geometry of the links is kept) """
+    self.previous = getattr(self, 'vids', {}) # vehicles observed during the previous interval (these are not counted again)
+    self.vids = {} # ids of the observed vehicles per (link, category, axles, doublemount)
+    self.speeds = {} # sum of observed speeds and number of observations per (link, category, axles, doublemount)
+
+  def add(self, link, vehicle, distance):
+    """ add an observation of a vehicle on the given link, at the given distance along the link (m) """
+    key = (link, vehicle.cat(), vehicle.axles(), vehicle.doublemount())
+    if not key in self.vids:
+      self.vids[key] = set()
+      self.speeds[key] = [0.0, 0]
+    self.vids[key].add(vehicle.vid())
+    s = self.speeds[key]
+    s[0] += vehicle.speed()
+    s[1] += 1
+    # update the geometry of the link
+    p = asPoint(vehicle.position())
+    segments = self.geometry.setdefault(link, {})
+    i = int(math.floor(distance/self.spacing))
+    if i in segments:
+      g = segments[i]
+      g[0] += p.x
+      g[1] += p.y
+      g[2] += p.z
+      g[3] += 1
+    else:
+      segments[i] = [p.x, p.y, p.z, 1]
+    self.directions[link] = asDirection(vehicle.direction())
+
+  def flows(self, duration):
+    """ return a dict with the flow (vehicles/h) and mean speed (km/h) per (link, category, axles, doublemount),
+        for an aggregation interval of the given duration (s); the vehicles on the links at the start of the first
+        interval are included in its flow
+    """
+    result = {}
+    for key, vids in self.vids.iteritems():
+      count = len(vids - self.previous.get(key, set())) # vehicles that were already on the link are counted only once
+      result[key] = (3600.0*count/duration, self.speeds[key][0]/self.speeds[key][1])
+    return result
+
+  def segments(self, link):
+    """ return the (N x 3) centre points and (N x 2) directions (bearing, gradient) of the segments of the link """
+    segments = self.geometry[link]
+    index = numpy.asarray(sorted(segments))
+    g = numpy.asarray([segments[i] for i in index], dtype = float)
+    xyz = g[:,:3]/g[:,3:]
+    # interpolate the segments at which no vehicles were observed
+    full = numpy.arange(index[0], index[-1] + 1)
+    points = numpy.column_stack([numpy.interp(full, index, xyz[:,j]) for j in range(3)])
+    if len(points) == 1:
+      d = self.directions[link]
+      return (points, numpy.asarray([[d.bearing, d.gradient]]))
+    delta = numpy.gradient(points, axis = 0)
+    bearings = numpy.degrees(numpy.arctan2(delta[:,1], delta[:,0]))
+    gradients = numpy.degrees(numpy.arctan2(delta[:,2], numpy.hypot(delta[:,0], delta[:,1])))
+    return (points, numpy.column_stack((bearings, gradients)))
+
+  def sourceBatch(self, duration, road = ReferenceRoadsurface()):
+    """ return the point sources representing the flows on all links as a SourceBatch, for an aggregation interval of
+        the given duration (s)
+    """
+    batches = []
+    segments = {}
+    for key, (flow, speed) in sorted(self.flows(duration).iteritems()):
+      (link, cat, axles, doublemount) = key
+      if flow <= 0.0:
+        continue
+      if not link in segments:
+        segments[link] = self.segments(link)
+      (points, directions) = segments[link]
+      n = len(points)
+      speed = max(speed, self.vmin)
+      (emissions, positions, dirs, heights) = ImagineModel.batchSources(self.model, cat + numpy.zeros(n, dtype = int),
+                                                                        speed + numpy.zeros(n), numpy.zeros(n),
+                                                                        directions[:,1], points, directions[:,0], road = road,
+                                                                        axles = axles + numpy.zeros(n),
+                                                                        doublemount = numpy.zeros(n, dtype = bool) | doublemount)
+      # correct for the number of vehicles on each segment
+      emissions[:,:,IMAGINEBANDS] += 10.0*numpy.log10(self.spacing*flow/(1000.0*speed))
+      batches.append(imagineSourceBatch(cat + numpy.zeros(n, dtype = int), points, dirs[:,0], dirs[:,1], emissions))
+    return concatenateSourceBatches(batches)
+
+  def sources(self, duration, road = ReferenceRoadsurface()):
+    """ return the list of point sources representing the flows on all links, for an aggregation interval of the
+        given duration (s)
+    """
+    return self.sourceBatch(duration, road).sources()
 
 
 #---------------------------------------------------------------------------------------------------
@@ -722,6 +1911,98 @@ if __name__ == '__main__':
     g.plotData() # measured distribution
     g.plot() # fitted distribution
 
+  # comparison of the batch calculation of the Imagine model with the calculation per vehicle
+  if 0:
+    model = ImagineModel()
+    vehicles = [cls(vid = i, speed = numpy.random.uniform(10.0, 130.0), acceleration = numpy.random.uniform(-2.0, 2.0))
+                for (i, cls) in enumerate(1000*[QLDCar, QLDLightTruck, QLDBDouble, QLDMotorcycle])]
+    a = vehicleArrays(vehicles)
+    (emissions, positions, directions, heights) = model.batchSources(a['cats'], a['speeds'], a['accelerations'], a['gradients'],
+                                                                     a['positions'], a['bearings'], axles = a['axles'],
+                                                                     doublemount = a['doublemount'])
+    error = max([numpy.max(numpy.abs(emissions[i,j] - source.emission.amplitudes()))
+                 for (i, vehicle) in enumerate(vehicles) for (j, source) in enumerate(model.sources(vehicle))])
+    print 'maximum difference between batch and single vehicle emissions: %.2e dB' % error
+
+  # vehicle arrays give the same batch emissions as lists of vehicles, with a fraction of the memory
+  if 0:
+    model = ImagineModel()
+    vehicles = [cls(vid = i, speed = numpy.random.uniform(10.0, 130.0), acceleration = numpy.random.uniform(-2.0, 2.0))
+                for (i, cls) in enumerate(1000*[QLDCar, QLDLightTruck, QLDBDouble, QLDMotorcycle])]
+    array = vehicleArray(vehicles)
+    error = numpy.max(numpy.abs(model.stepSourceBatch(vehicles).emissions - model.stepSourceBatch(array).emissions))
+    print 'maximum difference between the emissions of the vehicle list and array: %.2e dB' % error
+    print 'vehicle views:', str(array[0]) == str(vehicles[0])
+    print 'slices:', [str(view) for view in array[-3:]] == [str(vehicle) for vehicle in vehicles[-3:]]
+    print 'array memory per vehicle: %d bytes' % (sum([getattr(array, name).nbytes for (name, dtype) in VEHICLECOLUMNS])/len(array))
+
+  # compiled model constants are recalculated after changing the corrections, fleet parameters or road surface
+  if 0:
+    model = ImagineModel()
+    vehicle = QLDCar(speed = 50.0)
+    road = Roadsurface(cat = 'DAC', temperature = 5.0, chipsize = 14.0, age = 2.0, wet = True, tc = 0.08)
+    print 'reference: %.2f dBA' % model.emission(vehicle).laeq()
+    model.correction['fleet'] = True
+    model.fleet['vans'] = 50.0
+    print 'fleet: %.2f dBA' % model.emission(vehicle).laeq()
+    for key in ['temperature', 'surface', 'wetness']:
+      model.correction[key] = True
+    print 'fleet and road surface: %.2f dBA' % model.emission(vehicle, road).laeq()
+    compiled = model.compilation(ReferenceRoadsurface())
+    model.emission(vehicle)
+    model.batchEmission([1, 2], [50.0, 60.0], [0.0, 0.0])
+    print 'compiled once for equal road surfaces:', model.compiled is compiled
+    model.fleet.pop('vans')
+    print 'compiled again after removing a fleet parameter:', model.compiled is None
+
+  # random corrections are reproducible, and the correction store stays small when vehicles are released
+  if 0:
+    for seed in [1, 1, 2]:
+      model = DistributionImagineCorrectionModel(seed = seed)
+      corrections = []
+      for vid in range(10000):
+        corrections.append(model.getCorrection(QLDCar(vid = vid)))
+        model.release([vid - 100])
+      print model.corrections, 'mean correction: %.4f dB' % numpy.mean(corrections)
+
+  # influence radius of receivers for the dynamic viewport, for different reference levels
+  if 0:
+    from propagation import ISO9613Model, Receiver
+    receivers = [Receiver(Point(0.0, -15.0, 2.0)), Receiver(Point(0.0, -60.0, 2.0))]
+    for level in [0.0, 30.0, 50.0, 70.0]:
+      viewport = DynamicViewport(-5000.0, -5000.0, 5000.0, 5000.0, receivers, ImagineModel(), ISO9613Model(), level = level)
+      print 'level %.0f dBA: %s' % (level, viewport)
+
+  # emission cache: hit rate and accuracy for queued and free-flowing traffic
+  if 0:
+    model = ImagineModel()
+    cache = EmissionCache(model)
+    for step in range(100):
+      vehicles = [QLDCar(vid = i, speed = 0.0) for i in range(20)] + [QLDCar(vid = 20 + i, speed = 70.0 + numpy.random.rand())
+                                                                         for i in range(20)]
+      spectra = cache.stepSpectra(vehicles)
+    error = max([numpy.max(numpy.abs(z[2] - model.emission(vehicle).amplitudes())) for (z, vehicle) in zip(spectra, vehicles)])
+    print cache.statistics(), 'maximum difference: %.4f dB' % error
+
+  # accuracy of the lookup table emission model, compared with the Imagine model, for different correction flags
+  if 0:
+    vehicles = [cls(speed = numpy.random.uniform(0.0, 160.0), acceleration = numpy.random.uniform(-2.0, 5.0),
+                    direction = Direction(0.0, numpy.random.uniform(-10.0, 10.0)))
+                for cls in 1000*[QLDCar, QLDLightTruck, QLDBDouble, QLDMotorcycle]]
+    for (acceleration, gradient) in [(True, True), (True, False), (False, True), (False, False)]:
+      imagine = ImagineModel()
+      lookup = LookupModel()
+      for model in [imagine, lookup]:
+        model.correction['acceleration'] = acceleration
+        model.correction['gradient'] = gradient
+      error = max([numpy.max(numpy.abs(lookup.emission(vehicle).amplitudes() - imagine.emission(vehicle).amplitudes()))
+                   for vehicle in vehicles])
+      batch = lookup.batchEmission([v.cat() for v in vehicles], [v.speed() for v in vehicles],
+                                   [v.acceleration() for v in vehicles], [v.direction().gradient for v in vehicles])
+      reference = numpy.array([imagine.emission(vehicle).amplitudes() for vehicle in vehicles])
+      error = max(error, numpy.max(numpy.abs(batch - reference)))
+      print 'acceleration %s, gradient %s: maximum difference with Imagine emissions: %.4f dB' % (acceleration, gradient, error)
+
   # plot of Imagine emission spectrum at different vehicle speeds
   if 0:
     road = ReferenceRoadsurface()
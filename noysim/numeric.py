@@ -74,13 +74,15 @@ def rouletterand(partition):
   return v
 
 
-def randskewn(eta = 0.0, alpha = 1.0, kappa = 0.5):
-  """ return a random number sampled from a skewed normal distribution (kappa = skew factor) """
+def randskewn(eta = 0.0, alpha = 1.0, kappa = 0.5, size = None):
+  """ return a random number sampled from a skewed normal distribution (kappa = skew factor),
+      or an array with random numbers if a size is given
+  """
   if (abs(kappa) < 1e-6):
     # assume a normal gaussian distribution
-    return eta + alpha*numpy.random.randn()
+    return eta + alpha*numpy.random.standard_normal(size)
   else:
-    return SKEWinv(numpy.random.rand(), eta = eta, alpha = alpha, kappa = kappa)
+    return SKEWinv(numpy.random.random(size), eta = eta, alpha = alpha, kappa = kappa)
 
 
 #---------------------------------------------------------------------------------------------------
@@ -113,13 +115,20 @@ class CorrectionGenerator(object):
   def __init__(self):
     object.__init__(self)
 
-  def generate(self):
-    """ generate a correction in dB according to a predefined distribution """
+  def generate(self, n = None):
+    """ generate a correction in dB according to a predefined distribution, or an array with n corrections """
+    result = self.sample(1 if (n is None) else n)
+    if n is None:
+      return result[0]
+    return result
+
+  def sample(self, n):
+    """ return an array with n corrections (to be implemented by subclasses, using vectorized sampling) """
     raise NotImplementedError
 
   def plot(self, n = 20000, xlimits = (-20.0, 20.0), dx = 1.0):
     """ generate a plot of the distribution of generated values """
-    v = [self.generate() for i in range(n)]
+    v = self.generate(n)
     bins = numpy.arange(xlimits[0]-(dx/2.0), xlimits[1]+(dx/2.0), dx)
     x = (bins[1:] + bins[:-1])/2.0
     (hist, edges) = numpy.histogram(v, bins=bins, normed=True)
@@ -145,11 +154,11 @@ class TabulatedCorrectionGenerator(CorrectionGenerator):
     #print 'meandB:', self._meandB
     #print 'meanEn:', self._meanEn
 
-  def generate(self):
-    # select random bin
-    result = self._xvalues[rouletterand(self._partition)]
+  def sample(self, n):
+    # select random bins (roulette wheel selection by a search in the cumulative distribution, see rouletterand)
+    result = self._xvalues[numpy.searchsorted(self._partition, 100.0*numpy.random.random(n))]
     # assume that corrections are uniformily distributed within a bin
-    result += urand(left = -self._dx/2.0, right = self._dx/2.0)
+    result += (numpy.random.random(n) - 0.5)*self._dx
     return result
 
   def plotData(self):
@@ -164,8 +173,8 @@ class NormalCorrectionGenerator(CorrectionGenerator):
     CorrectionGenerator.__init__(self)
     self._stdev = stdev # standard deviation
 
-  def generate(self):
-    return self._stdev * numpy.random.randn()
+  def sample(self, n):
+    return self._stdev * numpy.random.standard_normal(n)
 
 
 class SkewedNormalCorrectionGenerator(CorrectionGenerator):
@@ -175,8 +184,8 @@ class SkewedNormalCorrectionGenerator(CorrectionGenerator):
     self._alpha = stdev
     self._kappa = skew
 
-  def generate(self):
-    return randskewn(eta = 0.0, alpha = self._alpha, kappa = self._kappa)
+  def sample(self, n):
+    return randskewn(eta = 0.0, alpha = self._alpha, kappa = self._kappa, size = n)
 
 
 class DistributionCorrectionGenerator(CorrectionGenerator):
@@ -187,8 +196,8 @@ class DistributionCorrectionGenerator(CorrectionGenerator):
     self._generator = scipy.stats.__dict__[name](*args, **kwargs)
     self._median = self._generator.median()
 
-  def generate(self):
-    return self._invert*(self._generator.rvs() - self._median)
+  def sample(self, n):
+    return self._invert*(self._generator.rvs(size = n) - self._median)
 
 
 #---------------------------------------------------------------------------------------------------
@@ -205,7 +214,7 @@ if __name__ == '__main__':
     kappa = 0.5
     xlimits = (-5.0, 5.0)
     xvalues = numpy.arange(xlimits[0], xlimits[1], 0.01)
-    a = [randskewn(eta=eta, alpha=alpha, kappa=kappa) for i in range(n)]
+    a = randskewn(eta=eta, alpha=alpha, kappa=kappa, size=n)
     b = skew(xvalues, eta=eta, alpha=alpha, kappa=kappa)
     pylab.figure()
     pylab.hist(a, bins = 50, range = (-5.0, 5.0), normed = True)
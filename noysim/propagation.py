@@ -6,9 +6,9 @@
 import numpy
 import pylab
 
-from acoustics import LOWDB, fromdB, OctaveBandSpectrum
+from acoustics import fromdB, todB, sumdB, precision, OctaveBandSpectrum
 from geo import EPSILON, Point, Direction, asPoint, asDirection
-from emission import QLDCar, QLDBDouble, ImagineModel
+from emission import QLDCar, QLDBDouble, ImagineModel, batchDirectivity, sourceBatch
 
 
 #---------------------------------------------------------------------------------------------------
@@ -75,6 +75,23 @@ class PropagationModel(object):
       result += self.immission(source, receiver)
     return result
 
+  def batchImmission(self, batch, receiver):
+    """ calculate the (N x bands) immission spectra at the location of the receiver, caused by the emission of a batch
+        of N sources (see emission.SourceBatch); derived classes should overload this with a vectorized calculation
+    """
+    return numpy.asarray([self.immission(source, receiver).amplitudes() for source in batch.sources()])
+
+  def totalBatchImmission(self, batch, receiver):
+    """ calculates the immission spectrum at the location of the receiver, caused by the emission of a batch of sources
+        (a list of Source objects is converted to a batch first)
+    """
+    if isinstance(batch, list):
+      batch = sourceBatch(batch)
+    result = self.zero()
+    if len(batch) > 0:
+      result.setFreqAmps(f = result.frequencies(), z = sumdB(self.batchImmission(batch, receiver), axis = 0))
+    return result
+
 
 #---------------------------------------------------------------------------------------------------
 # ISO 9613-2 propagation model
@@ -116,6 +133,10 @@ class ISO9613Environment(Environment):
     """
     return 0.0
 
+  def terrainHeights(self, positions):
+    """ return the heights of the terrain at an (N x 3) array of positions (see terrainHeight) """
+    return numpy.zeros(len(positions))
+
   def __str__(self):
     """ return a string representation of the environment """
     return '[ISO9613: G=(%.2f,%.2f,%.2f), p=%.1f, t=%.1f, r=%.1f]' % (self.G[0], self.G[1], self.G[2], self.p, self.t, self.r)
@@ -195,7 +216,7 @@ class ISO9613Model(PropagationModel):
     # temporary constants
     x = 1.0 - numpy.exp(-distance/50.0)
     y = 1.0 - numpy.exp(-(2.8e-6)*(distance**2))
-    G = self.environment().G
+    G = self.environment.G
     # calculating attenuation at source
     (h1, h2) = ((sourceH - 5.0)**2, sourceH**2)
     aa = 1.5 +  3.0*numpy.exp(-0.12*h1)*x + 5.7*numpy.exp(-0.09*h2)*y
@@ -234,6 +255,56 @@ class ISO9613Model(PropagationModel):
     # the noise emitted by a vehicle is the same for all horizontal angles, so this approximation can be justified
     return numpy.asarray([source.directivity(theta = theta, phi = phi, f = f) for f in OctaveBandSpectrum().frequencies()])
 
+  def batchImmission(self, batch, receiver):
+    """ overload the PropagationModel implementation (the attenuation of all sources is calculated at once) """
+    result = batch.octaveBands() # ISO 9613 only works on octave bands
+    delta = asPoint(receiver.position).coordinates() - batch.positions
+    distance = numpy.sqrt(numpy.sum(delta**2, axis = 1))
+    distanceXY = numpy.hypot(delta[:,0], delta[:,1])
+    if self.correction['geometricDivergence'] == True:
+      result += (-20.0*numpy.log10(distance) - 11.0)[:,numpy.newaxis]
+    if self.correction['atmosphericAbsorption'] == True:
+      result -= numpy.outer(distance, self.environment.abscoeff)
+    if self.correction['groundEffect'] == True:
+      result += self.batchGroundEffect(batch, receiver, distanceXY)
+    if self.correction['sourceDirectivity'] == True:
+      theta = numpy.degrees(numpy.arctan2(delta[:,1], delta[:,0])) - batch.bearings
+      phi = numpy.degrees(numpy.arctan2(delta[:,2], distanceXY))
+      result += batchDirectivity(batch.cats, batch.hcodes, theta, phi, OctaveBandSpectrum().frequencies())
+    return result.astype(precision())
+
+  def batchGroundEffect(self, batch, receiver, distance):
+    """ return the (N x 8) attenuation/amplification (in dB) caused by the ground effect for a batch of sources, given
+        their distances to the receiver in the XY-plane (see groundEffect)
+    """
+    sourceH = batch.positions[:,2] - self.environment.terrainHeights(batch.positions)
+    recH = receiver.position.z - self.environment.terrainHeight(receiver.position)
+    # avoid divisions by zero (the corresponding values are not used)
+    near = (distance <= EPSILON)
+    d = numpy.where(near, 1.0, distance)
+    # shorthand for hard surfaces
+    if self.environment.hasHardSurface():
+      return numpy.where(near, 3.0, 3.0 - numpy.minimum(0.0, -3.0 + 90.0*(sourceH + recH)/d))[:,numpy.newaxis]
+    # temporary constants
+    x = 1.0 - numpy.exp(-distance/50.0)
+    y = 1.0 - numpy.exp(-(2.8e-6)*(distance**2))
+    G = self.environment.G
+    def regionAttenuation(h, G):
+      """ attenuation in the source or receiver region, for heights h and ground factor G """
+      (h1, h2) = ((h - 5.0)**2, h**2)
+      aa = 1.5 +  3.0*numpy.exp(-0.12*h1)*x + 5.7*numpy.exp(-0.09*h2)*y
+      bb = 1.5 +  8.6*numpy.exp(-0.09*h2)*x
+      cc = 1.5 + 14.0*numpy.exp(-0.46*h2)*x
+      dd = 1.5 +  5.0*numpy.exp(-0.90*h2)*x
+      n = len(x)
+      return numpy.column_stack([-1.5 + numpy.zeros(n), -1.5 + G*aa, -1.5 + G*bb, -1.5 + G*cc, -1.5 + G*dd] +
+                                3*[-1.5*(1.0 - G) + numpy.zeros(n)])
+    a = regionAttenuation(sourceH, G[0]) + regionAttenuation(recH, G[1])
+    # calculation attenuation in middle region
+    Dm = numpy.where(near, 0.0, numpy.minimum(0.0, -3.0 + 3.0*(30.0*(sourceH + recH)/d)))
+    a += numpy.column_stack([Dm] + 7*[Dm*(1.0 - G[2])])
+    return -a
+
 
 #---------------------------------------------------------------------------------------------------
 # Calculating and drawing noise maps
@@ -250,7 +321,7 @@ class Noisemap(object):
 
   def clear(self):
     """ clear the noisemap """
-    self.energy = numpy.zeros((len(self.recx),len(self.recy)))
+    self.energy = numpy.zeros((len(self.recx),len(self.recy)), dtype = numpy.float64) # energy is always summed in float64
 
   def add(self, source):
     """ add the effect of a single source to the noise map """
@@ -260,11 +331,14 @@ class Noisemap(object):
         level = pmodel.immission(source, receiver).laeq() # A-weighted SPL at receiver
         self.energy[i,j] += fromdB(level)
 
+  def levels(self):
+    """ return the noise levels of the map, in the precision of level arrays (see acoustics.setPrecision) """
+    return todB(self.energy).astype(precision())
+
   def plot(self, interval = None, cbar = True):
     """ draw the noisemap, within given interval and with/without a colorbar """
     # calculate the noise levels
-    levels = 10.0*numpy.log10(self.energy)
-    levels[numpy.where(levels == -numpy.inf)] = LOWDB
+    levels = self.levels()
     if interval == None:
       # try to estimate the best interval
       interval = (numpy.min(levels), numpy.max(levels))
@@ -344,6 +418,20 @@ if __name__ == '__main__':
     pylab.figure()
     noisemap.plot()
 
+  # comparison of the batch propagation calculation with the calculation per source
+  if 0:
+    emodel = ImagineModel()
+    vehicles = [cls(vid = i, position = Point(numpy.random.uniform(-100.0, 100.0), numpy.random.uniform(-100.0, 100.0), 0.0),
+                    direction = Direction(numpy.random.uniform(0.0, 360.0)), speed = numpy.random.uniform(10.0, 120.0),
+                    acceleration = 0.0) for (i, cls) in enumerate(500*[QLDCar, QLDBDouble])]
+    receiver = Receiver(position = Point(0.0, 0.0, 1.5))
+    for G in [(0.0, 0.0, 0.0), (1.0, 0.5, 0.5)]:
+      pmodel = ISO9613Model(environment = ISO9613Environment(G = G))
+      sources = [source for vehicle in vehicles for source in emodel.sources(vehicle = vehicle)]
+      batch = emodel.stepSourceBatch(vehicles)
+      error = numpy.max(numpy.abs(pmodel.totalImmission(sources, receiver).amplitudes() - pmodel.totalBatchImmission(batch, receiver).amplitudes()))
+      print 'G = %s: maximum difference between batch and single source immissions: %.2e dB' % (str(G), error)
+
 
   try:
     pylab.show()
@@ -5,6 +5,7 @@
 
 import math
 import random
+import time
 
 import numpy
 import pylab
@@ -12,7 +13,7 @@ import pylab
 from numeric import choice
 from geo import Point, Direction
 from acoustics import sumdB, TimeSeries
-from emission import QLDCar, QLDLightTruck, QLDBDouble, QLDMotorcycle, Roadsurface, ImagineModel, SkewedNormalImagineCorrectionModel, DistributionImagineCorrectionModel
+from emission import QLDCar, QLDLightTruck, QLDBDouble, QLDMotorcycle, Roadsurface, ImagineModel, SkewedNormalImagineCorrectionModel, DistributionImagineCorrectionModel, LookupModel, FlowSources, sourceBatch
 from propagation import Receiver, ISO9613Environment, ISO9613Model
 
 
@@ -231,11 +232,15 @@ def levelTimeSeries(vhist, dt, emodel, road, pmodel, receivers, verbose=False):
   # calculate lists of sources
   t = 0.0
   sourcesList = []
+  vids = set() # ids of the vehicles in the network at the previous timestep
   for vehicles in vhist:
     sources = []
     t += dt
     if verbose:
       print 'performing emission calculation: t = %.1f/%.1f\r' % (t, duration),
+    # release the vehicles that left the network from the emission model
+    (previous, vids) = (vids, set([vehicle.vid() for vehicle in vehicles]))
+    emodel.release(previous - vids)
     for vehicle in vehicles:
       sList = emodel.sources(vehicle=vehicle, road=road)
       if vehicle.passby == True:
@@ -257,7 +262,8 @@ def levelTimeSeries(vhist, dt, emodel, road, pmodel, receivers, verbose=False):
     t += dt
     if verbose:
       print 'performing propagation calculation: t = %.1f/%.1f\r' % (t, duration),
-    immi = [pmodel.totalImmission(sources, receiver) for receiver in receivers]
+    batch = sourceBatch(sources)
+    immi = [pmodel.totalBatchImmission(batch, receiver) for receiver in receivers]
     levelsList.append([spectrum.laeq() for spectrum in immi])
   if verbose:
     print
@@ -265,6 +271,30 @@ def levelTimeSeries(vhist, dt, emodel, road, pmodel, receivers, verbose=False):
   return (elevels, [TimeSeries(z, dt) for z in zip(*levelsList)])
 
 
+def flowLevelTimeSeries(vhist, dt, emodel, road, pmodel, receivers, interval = 60.0, spacing = 10.0, verbose=False):
+  """ calculate a time series of levels based on the flows and mean speeds in the given traffic simulation history,
+      with one equivalent level per aggregation interval (see FlowSources); the result can be compared with the time
+      series of levelTimeSeries, resampled to the aggregation interval
+  """
+  flows = FlowSources(emodel, spacing=spacing)
+  nsteps = max(1, int(round(interval/dt)))
+  levelsList = []
+  for i, vehicles in enumerate(vhist):
+    for vehicle in vehicles:
+      flows.add(0, vehicle, vehicle.position().x)
+    if ((i+1) % nsteps == 0) or (i+1 == len(vhist)):
+      if verbose:
+        print 'performing flow based calculation: t = %.1f/%.1f\r' % ((i+1)*dt, len(vhist)*dt),
+      # calculate the immission of the equivalent sources of the aggregation interval
+      sources = flows.sourceBatch(((i % nsteps) + 1)*dt, road=road)
+      immi = [pmodel.totalBatchImmission(sources, receiver) for receiver in receivers]
+      levelsList.append([spectrum.laeq() for spectrum in immi])
+      flows.clear()
+  if verbose:
+    print
+  return [TimeSeries(z, nsteps*dt) for z in zip(*levelsList)]
+
+
 def simulateLevelHistory(# general simulation parameters
                          warmup = 120.0, # traffic build up time, 120 seconds should be ok in most cases
                          duration = 3600.0, # duration of the simulation (in seconds)
@@ -326,6 +356,8 @@ def simulateLevelHistory(# general simulation parameters
     emodel = SkewedNormalImagineCorrectionModel(stdev = stdev, skew = skew, seed = seed)
   elif emodelname.lower() == 'imagine+distribution':
     emodel = DistributionImagineCorrectionModel(seed = seed)
+  elif emodelname.lower() == 'lookup':
+    emodel = LookupModel()
   else:
     raise 'unknown emission model: %s' % emodelname
   emodel.correction['acceleration'] = ecorr[0]
@@ -425,7 +457,7 @@ if __name__ == '__main__':
       for key, value in passbytimes.iteritems():
         print ' -> category %d: %d' % (key, len(value))
       ts.append(tsList[0])
-      indicators = tsList[0].indicators()
+      indicators = tsList[0].indicators(['LAeq', 'LAmax', 'LA10', 'LA90', 'Ncn', 'TNI', 'NPL'])
       # print noise indicators
       print 'LAeq:', indicators['LAeq']
       print 'LAmax:', indicators['LAmax']
@@ -440,6 +472,29 @@ if __name__ == '__main__':
       pylab.subplot(3,1,i+1)
       ts[i].plot()
 
+  # compare the flow based calculation with the vehicle by vehicle calculation
+  if 0:
+    dt = 0.25
+    interval = 300.0
+    fleet = {QLDCar: 90.0, QLDBDouble: 10.0}
+    dist = DisplacedNegativeExponentialDistribution(dt = dt, rate = 600.0, hmin = 1.2)
+    tsim = TrafficSimulation(vlimit = 70.0, fleet = fleet, dist = dist, seed = 0)
+    (passbytimes, vhist) = tsim.run(warmup = 120.0, duration = 1800.0, verbose = True)
+    emodel = ImagineModel()
+    road = Roadsurface(cat = 'REF', temperature = 20.0, chipsize = 11.0, age = 2.0, wet = False, tc = 0.08)
+    pmodel = ISO9613Model(environment = ISO9613Environment())
+    receivers = [Receiver(position = Point(0.0, -d, 1.2)) for d in (7.5, 15.0, 30.0, 60.0)]
+    t0 = time.time()
+    elevels, dynamic = levelTimeSeries(vhist = vhist, dt = dt, emodel = emodel, road = road, pmodel = pmodel, receivers = receivers)
+    t1 = time.time()
+    flow = flowLevelTimeSeries(vhist = vhist, dt = dt, emodel = emodel, road = road, pmodel = pmodel, receivers = receivers,
+                               interval = interval)
+    t2 = time.time()
+    print 'calculation time: dynamic %.1fs, flow based %.1fs' % (t1 - t0, t2 - t1)
+    for d, tsd, tsf in zip((7.5, 15.0, 30.0, 60.0), dynamic, flow):
+      print 'd = %.1fm: LAeq dynamic %.2f dBA, flow based %.2f dBA' % (d, tsd.leq(), tsf.leq())
+      print '  per interval:', ' '.join(['%.1f/%.1f' % x for x in zip(tsd.resample(interval).amplitudes(), tsf.amplitudes())])
+
   try:
     pylab.show()
   except: